@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'social_django',
 
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,7 +78,7 @@ WSGI_APPLICATION = 'books.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'books_db',
         'USER': 'books_user',
         'PASSWORD': '123',
@@ -85,6 +87,98 @@ DATABASES = {
     }
 }
 
+# Пул соединений с Postgres (встроенный в Django пул psycopg 3, нужен psycopg[pool]).
+# Размер пула на процесс, timeout - сколько ждать свободное соединение, с;
+# соединения старше max_lifetime пересоздаются, простаивающие дольше max_idle
+# закрываются до min_size. Перед выдачей соединение проверяется.
+# Статистика пула - в /stats/
+DATABASE_POOL = {
+    'min_size': 2,
+    'max_size': 20,
+    'timeout': 10,
+    'max_lifetime': 30 * 60,
+    'max_idle': 5 * 60,
+}
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    # psycopg2: пула нет, держим соединение потока открытым и проверяем его перед запросом
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+else:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {**DATABASE_POOL, 'check': ConnectionPool.check_connection},
+    }
+
+# Реплики для чтения (store.routers). REPLICAS - алиасы из DATABASES с весами,
+# например {'replica': 1} при DATABASES['replica'] = {..., 'HOST': 'replica-host'}.
+# После записи пользователь STICKY_SECONDS читает из default, недоступная
+# реплика пропускается RETRY_SECONDS. Локально репликой может быть второй файл SQLite
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+STORE_REPLICAS = {
+    'REPLICAS': {},
+    'STICKY_SECONDS': 5,
+    'RETRY_SECONDS': 30,
+}
+
+# Кэш. В алиасе books лежат ответы API по книгам и версии каталога и книг (store.cache),
+# в default - закрепление пользователя за primary после записи (store.routers).
+# LocMemCache вытесняет записи по LRU после MAX_ENTRIES и по TIMEOUT, но живет
+# в памяти процесса: годится только для одного процесса. При нескольких воркерах
+# оба алиаса должны указывать на общий кэш (RedisCache, PyMemcacheCache, FileBasedCache
+# с LOCATION на каталог), иначе запись в одном воркере не сбросит кэш других.
+# С LocMemCache при WEB_CONCURRENCY больше 1 не стартуют воркеры WSGI/ASGI,
+# а manage.py check --deploy сообщает ошибку store.E001
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'books': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Замеры запросов (store.timing). Профилирование cProfile выключено,
+# при PROFILE_SAMPLE_RATE > 0 профили медленных запросов пишутся в PROFILE_DIR
+STORE_TIMING = {
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_THRESHOLD_MS': 500,
+    'PROFILE_DIR': BASE_DIR / 'profiles',
+}
+
+# Рейтинги /book/top/ и /book/trending/ (store.leaderboards): вес априорной оценки
+# байесовского среднего и период полураспада активности. Средняя оценка каталога
+# и накопленная погрешность обновляются командой refresh_leaderboards
+STORE_LEADERBOARDS = {
+    'RATING_PRIOR_WEIGHT': 10,
+    'TRENDING_HALF_LIFE_HOURS': 48,
+    'TRENDING_MIN_SCORE': 0.01,
+}
+
+# Отложенная запись лайков/закладок/рейтов (store.write_behind) на время всплесков:
+# PATCH/PUT book_relation/<book>/ отвечают 202, изменения сливаются по (пользователь, книга)
+# и пишутся пакетами по FLUSH_SIZE не реже раза в FLUSH_INTERVAL секунд. В буфере
+# процесса не больше MAX_PENDING пар, сверх этого запрос получает 503 с Retry-After
+STORE_WRITE_BEHIND = {
+    'ENABLED': False,
+    'MAX_PENDING': 10000,
+    'FLUSH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Фасеты каталога GET /book/?facets=1 (store.facets): сколько авторов отдавать
+# и границы корзин гистограммы цен
+STORE_FACETS = {
+    'AUTHORS_LIMIT': 10,
+    'PRICE_BUCKETS': (10, 50, 100),
+}
+
 # Аутентификация
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
@@ -134,13 +228,20 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Вывод в формате JSON в браузер
+# Вывод в формате JSON в браузер. Для больших списков клиент может запросить
+# колоночный JSON (application/vnd.books.columnar+json, ?format=columnar)
+# или MessagePack (application/msgpack, ?format=msgpack), в тех же форматах
+# принимаются тела запросов
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
+        'store.renderers.ColumnarJSONRenderer',
+        'store.renderers.MessagePackRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
+        'store.renderers.ColumnarJSONParser',
+        'store.renderers.MessagePackParser',
     )
 }
 
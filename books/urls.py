@@ -18,7 +18,8 @@ from django.template.defaulttags import url
 from django.urls import path, include, re_path
 from rest_framework.routers import SimpleRouter
 
-from store.views import BookViewSet, auth, UserBooksRelationView
+from store import async_views
+from store.views import BookViewSet, LibraryView, StatsView, auth, UserBooksRelationView
 
 router = SimpleRouter()
 
@@ -30,6 +31,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('me/library/', LibraryView.as_view(), name='library'),
+    # Чтение без потоков для ASGI, ответы те же, что у book/ и book_relation/
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/book_relation/<int:book>/', async_views.relation_detail,
+         name='async-userbookrelation-detail'),
 ]
 
 urlpatterns += router.urls
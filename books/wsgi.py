@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'books.settings')
 
 application = get_wsgi_application()
+
+# Несколько воркеров с кэшем в памяти процесса не стартуют (store.cache)
+from store.cache import ensure_shared_caches  # noqa: E402
+
+ensure_shared_caches()
@@ -1,16 +1,141 @@
-from django.contrib import admin
-from django.contrib.admin import ModelAdmin
+from django.contrib import admin, messages
+from django.contrib.admin import ModelAdmin, SimpleListFilter
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 
+from store.cache import invalidate_all_books
+from store.logic import change_relations, rebuild_counters
 from store.models import Book, UserBookRelation
 
 
-# Регистрация модели книги в админке
+# Оценка числа строк таблицы по статистике Postgres (pg_class.reltuples), None - не знаем
+def get_estimated_count(model, using):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                       [model._meta.db_table])
+        row = cursor.fetchone()
+    # У таблицы без ANALYZE reltuples = -1
+    return row[0] if row and row[0] >= 0 else None
+
+
+# Пагинатор списков админки: для большой таблицы без фильтров число строк берется
+# из статистики вместо COUNT(*) по всей таблице. С фильтрами считаем точно,
+# фильтры в админке идут по индексам
+class EstimatedCountPaginator(Paginator):
+    # Меньшие таблицы считаем точно
+    exact_count_limit = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = get_estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+# Общие настройки списков для больших таблиц: оценка числа строк
+# и без второго COUNT(*) по всей таблице для "N из M" при фильтрах.
+# Стандартного удаления нет: оно грузит выбранные строки и их каскад в память
+# и удаляет по одной с сигналами
+class LargeTableAdmin(ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+# Диапазоны цены, фильтр идет по индексу (price, id)
+class PriceFilter(SimpleListFilter):
+    title = 'price'
+    parameter_name = 'price_range'
+    ranges = {
+        'lt10': (None, 10),
+        '10-50': (10, 50),
+        '50-100': (50, 100),
+        'gte100': (100, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [('lt10', '< 10'), ('10-50', '10 - 50'), ('50-100', '50 - 100'), ('gte100', '≥ 100')]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        if low is not None:
+            queryset = queryset.filter(price__gte=low)
+        if high is not None:
+            queryset = queryset.filter(price__lt=high)
+        return queryset
+
+
+# Регистрация модели книги в админке. Владелец подтягивается тем же запросом,
+# выбирается поиском, а не списком всех пользователей
 @admin.register(Book)
-class BookAdmin(ModelAdmin):
-    pass
+class BookAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'author_name', 'price', 'owner', 'likes_count',
+                    'bookmarks_count', 'rating', 'updated_at')
+    list_select_related = ('owner',)
+    list_filter = (PriceFilter,)
+    # icontains админки в Postgres - UPPER(...) LIKE, триграммные индексы он не использует:
+    # поиск по подстроке просматривает таблицу книг целиком
+    search_fields = ('name', 'author_name')
+    autocomplete_fields = ('owner',)
+    # Счетчики и очки поддерживаются сервером
+    readonly_fields = ('likes_count', 'bookmarks_count', 'rating_sum', 'rating_count', 'rating',
+                       'top_score', 'trending_score', 'updated_at')
+    actions = ('recalculate_counters',)
 
+    # Пересчет одним UPDATE по подзапросу выбранных книг, без выгрузки их id:
+    # при "выбрать все" это может быть весь каталог
+    @admin.action(description='Recalculate counters of selected books')
+    def recalculate_counters(self, request, queryset):
+        with transaction.atomic():
+            rebuild_counters(queryset.values('pk'))
+            invalidate_all_books()
+        self.message_user(request, 'Counters recalculated.', messages.SUCCESS)
 
-# Регистрация модели рейтов в админке
+
+# Регистрация модели рейтов в админке. Пользователь и книга для __str__ и колонок
+# приходят одним JOIN, а не двумя запросами на строку
 @admin.register(UserBookRelation)
-class UserBookRelationAdmin(ModelAdmin):
-    pass
+class UserBookRelationAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'book', 'like', 'in_bookmarks', 'rate', 'updated_at')
+    list_select_related = ('user', 'book')
+    # Фильтры идут по индексам relation_*_admin_idx модели
+    list_filter = ('like', 'in_bookmarks', 'rate')
+    autocomplete_fields = ('user', 'book')
+    # Вместо стандартного удаления - delete_relations
+    actions = ('clear_likes', 'clear_bookmarks', 'clear_rates', 'delete_relations')
+
+    def apply_change(self, request, queryset, values, message):
+        count = change_relations(queryset, values)
+        self.message_user(request, message.format(count=count), messages.SUCCESS)
+
+    @admin.action(description='Remove likes from selected relations', permissions=['change'])
+    def clear_likes(self, request, queryset):
+        self.apply_change(request, queryset.filter(like=True), {'like': False},
+                          'Removed {count} likes.')
+
+    @admin.action(description='Remove bookmarks from selected relations', permissions=['change'])
+    def clear_bookmarks(self, request, queryset):
+        self.apply_change(request, queryset.filter(in_bookmarks=True), {'in_bookmarks': False},
+                          'Removed {count} bookmarks.')
+
+    @admin.action(description='Remove rates from selected relations', permissions=['change'])
+    def clear_rates(self, request, queryset):
+        self.apply_change(request, queryset.filter(rate__isnull=False), {'rate': None},
+                          'Removed {count} rates.')
+
+    @admin.action(description='Delete selected relations', permissions=['delete'])
+    def delete_relations(self, request, queryset):
+        self.apply_change(request, queryset, None, 'Deleted {count} relations.')
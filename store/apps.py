@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from store import signals  # noqa: F401
+        # Версии кэша и закрепление за primary в памяти процесса при нескольких воркерах не работают
+        from store.cache import check_shared_caches
+        checks.register(check_shared_caches, checks.Tags.caches, deploy=True)
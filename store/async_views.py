@@ -0,0 +1,171 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, load_backend
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import (APIException, NotAuthenticated, NotFound, PermissionDenied,
+                                       ValidationError)
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from store.cache import aget_catalog_state, cache_stats, get_cache, make_cache_key
+from store.conditional import add_validators, get_not_modified
+from store.fast_list import ValuesListSerializer
+from store.logic import aget_relation_state
+from store.models import Book
+from store.routers import aget_read_alias, may_be_stale, read_alias
+from store.search import ahas_sqlite_fts
+from store.views import BookViewSet
+from store.write_behind import overlay_books, relation_buffer
+
+# Async-версии чтения книг и релейшенов для ASGI. Фильтры, поиск, сортировка,
+# пагинация, ETag и кэширование ответов списка те же, что у BookViewSet:
+# его экземпляр только собирает queryset, а все запросы к базе идут через async ORM.
+# Аутентификация только сессионная, ответ только JSON: другой ?format= - 400,
+# Accept без JSON - 406. Фасетов (?facets=) нет, такой запрос получает 400.
+
+MEDIA_TYPE = 'application/json'
+UNSUPPORTED_MESSAGE = 'Not supported by the async endpoint, use the same URL without /async.'
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data, MEDIA_TYPE), status=status,
+                        content_type=MEDIA_TYPE)
+
+
+# Ошибки DRF отдаем в том же виде, что и синхронные вьюхи
+def async_api_view(func):
+    @require_safe
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        token = read_alias.set(None)
+        try:
+            return await func(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(detail, exc.status_code)
+        finally:
+            read_alias.reset(token)
+    return wrapper
+
+
+# Бэкенды social_core не умеют aget_user, через которую работает request.auser().
+# Для них пользователь по id из сессии грузится так же, как в их get_user,
+# с той же проверкой хэша сессии, что у django.contrib.auth
+async def aget_user(request):
+    backend_path = await request.session.aget(BACKEND_SESSION_KEY)
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    if hasattr(load_backend(backend_path), 'aget_user'):
+        return await request.auser()
+    user_id = await request.session.aget(SESSION_KEY)
+    user = await User.objects.filter(pk=user_id).afirst() if user_id is not None else None
+    session_hash = await request.session.aget(HASH_SESSION_KEY)
+    if user is None or not session_hash or not constant_time_compare(
+            session_hash, user.get_session_auth_hash()):
+        return AnonymousUser()
+    return user
+
+
+# Синхронные вьюхи отдают еще колоночный JSON и MessagePack, здесь - только JSON.
+# Accept без JSON - NotAcceptable, как у DRF
+def check_json_only(request):
+    output_format = request.query_params.get(api_settings.URL_FORMAT_OVERRIDE)
+    if output_format not in (None, 'json'):
+        raise ValidationError({api_settings.URL_FORMAT_OVERRIDE: [UNSUPPORTED_MESSAGE]})
+    DefaultContentNegotiation().select_renderer(request, [JSONRenderer()])
+
+
+# Экземпляр BookViewSet без dispatch: пользователь уже загружен, поэтому
+# DRF не пойдет за ним в базу синхронно
+async def get_book_view(request, action, **kwargs):
+    drf_request = Request(request)
+    drf_request.user = await aget_user(request)
+    # Чтения с реплики, как у синхронных вьюх: пользователь уже загружен из default
+    read_alias.set(await aget_read_alias(drf_request.user))
+    check_json_only(drf_request)
+    drf_request.accepted_media_type = MEDIA_TYPE
+    view = BookViewSet(request=drf_request, action=action, args=(), kwargs=kwargs,
+                       format_kwarg=None)
+    view.check_permissions(drf_request)
+    # BookSearchFilter проверяет наличие FTS в SQLite, делаем это заранее
+    using = Book.objects.all().db
+    if connections[using].vendor == 'sqlite' and drf_request.query_params.get('search'):
+        await ahas_sqlite_fts(using)
+    return view
+
+
+@async_api_view
+async def book_list(request):
+    view = await get_book_view(request, 'list')
+    if view.facets_query_param in view.request.query_params:
+        raise ValidationError({view.facets_query_param: [UNSUPPORTED_MESSAGE]})
+    # Версия и время изменения каталога читаются из кэша один раз на запрос
+    version, modified = await aget_catalog_state()
+    etag, last_modified = view.build_list_validators(view.request, version, modified)
+    not_modified = get_not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    # Кэш ответов как у синхронного списка и с той же версией каталога. Путь входит
+    # в ключ, поэтому записи свои: ссылки страниц ведут на /async. Незаписанные
+    # изменения пользователя накладываются поверх
+    cache = get_cache()
+    key = make_cache_key(view.request, 'list', version, view.get_sparse_fields())
+    data = await cache.aget(key)
+    cache_stats.record('list', data is not None)
+    if data is None:
+        data = await get_list_data(view)
+        if not may_be_stale(modified):
+            await cache.aset(key, data, view.cache_timeout)
+    overlay_books(data, view.request.user)
+    return add_validators(render(data), etag, last_modified)
+
+
+async def get_list_data(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    fast = ValuesListSerializer(view.get_serializer(), queryset, view.get_extra_columns(queryset))
+    rows = fast.get_rows(queryset)
+    paginator = view.paginator
+    page = await paginator.apaginate_queryset(rows, view.request, view)
+    if page is None:
+        return await fast.ato_representation([row async for row in rows])
+    return paginator.get_paginated_response(await fast.ato_representation(page)).data
+
+
+@async_api_view
+async def book_detail(request, pk):
+    # В kwargs строка, как у роутера DRF: от нее зависит ETag
+    view = await get_book_view(request, 'retrieve', pk=str(pk))
+    etag, last_modified = await view.aget_retrieve_validators(view.request)
+    not_modified = get_not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    queryset = view.get_queryset().filter(pk=pk)
+    fast = ValuesListSerializer(view.get_serializer(), queryset)
+    rows = [row async for row in fast.get_rows(queryset)]
+    if not rows:
+        raise NotFound()
+    data = await fast.ato_representation(rows)
+    return add_validators(render(overlay_books(data[0], view.request.user)), etag, last_modified)
+
+
+@async_api_view
+async def relation_detail(request, book):
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        # Как у DRF с SessionAuthentication: 403, а не 401
+        raise PermissionDenied(NotAuthenticated.default_detail)
+    read_alias.set(await aget_read_alias(user))
+    state = await aget_relation_state(user, book)
+    if state is None:
+        raise NotFound()
+    state.update(relation_buffer.get(user.pk, book))
+    return render(state)
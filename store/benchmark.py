@@ -0,0 +1,188 @@
+import random
+import time
+import tracemalloc
+from bisect import bisect
+from collections import Counter
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.cache import get_cache
+from store.logic import rebuild_counters
+from store.models import Book, UserBookRelation
+
+# Синтетический набор данных и сценарии нагрузки для manage.py bench.
+# Все случайное берется из random.Random(seed), поэтому при одинаковых
+# параметрах данные и запросы совпадают от запуска к запуску.
+
+WORDS = ('war', 'peace', 'night', 'river', 'garden', 'stone', 'winter', 'city', 'light',
+         'shadow', 'road', 'sea', 'fire', 'house', 'song', 'star', 'forest', 'glass')
+FIRST_NAMES = ('Anna', 'Ivan', 'Maria', 'Petr', 'Olga', 'Lev', 'Nina', 'Boris', 'Vera', 'Oleg')
+LAST_NAMES = ('Tolstoy', 'Chekhov', 'Pushkin', 'Gogol', 'Bunin', 'Blok', 'Bely', 'Grin')
+USERNAME = 'bench_user_{}'
+BATCH_SIZE = 2000
+
+
+class Rollback(Exception):
+    pass
+
+
+# Веса по закону Ципфа: skew=0 - равномерно, чем больше, тем сильнее
+# релейшены и запросы сосредоточены на первых книгах
+def zipf_picker(rng, items, skew):
+    cum_weights = list(accumulate(1 / (rank ** skew) for rank in range(1, len(items) + 1)))
+    total = cum_weights[-1]
+
+    def pick():
+        return items[min(bisect(cum_weights, rng.random() * total), len(items) - 1)]
+    return pick
+
+
+def seed_dataset(users=100, books=1000, relations=5000, skew=1.0, seed=42):
+    rng = random.Random(seed)
+    user_objs = User.objects.bulk_create(
+        [User(username=USERNAME.format(i)) for i in range(users)], batch_size=BATCH_SIZE)
+    user_ids = [user.pk for user in user_objs]
+    book_objs = Book.objects.bulk_create(
+        [Book(name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+              price=rng.randint(100, 100000) / 100,
+              author_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+              owner_id=rng.choice(user_ids))
+         for _ in range(books)], batch_size=BATCH_SIZE)
+    book_ids = [book.pk for book in book_objs]
+
+    # Пары (user, book) уникальны, популярность книг по Ципфу
+    relations = min(relations, users * books)
+    pick_book = zipf_picker(rng, book_ids, skew)
+    pairs = {}
+    while len(pairs) < relations:
+        pair = (rng.choice(user_ids), pick_book())
+        if pair not in pairs:
+            rate = rng.randint(1, 5) if rng.random() < 0.6 else None
+            pairs[pair] = (rng.random() < 0.5, rng.random() < 0.3, rate)
+    UserBookRelation.objects.bulk_create(
+        [UserBookRelation(user_id=user_id, book_id=book_id, like=like,
+                          in_bookmarks=in_bookmarks, rate=rate)
+         for (user_id, book_id), (like, in_bookmarks, rate) in pairs.items()],
+        batch_size=BATCH_SIZE)
+    # bulk_create идет в обход save(), счетчики книг считаем одним проходом
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        rebuild_counters(book_ids[start:start + BATCH_SIZE])
+    return user_ids, book_ids
+
+
+# Запрос сценария: метод, url, данные и пользователь (None - аноним)
+def build_scenarios(user_ids, book_ids, requests, skew, seed):
+    rng = random.Random(seed)
+    pick_book = zipf_picker(rng, book_ids, skew)
+    list_url = reverse('book-list')
+    prices = list(Book.objects.filter(id__in=book_ids[:100]).values_list('price', flat=True))
+
+    def repeat(make):
+        return [make() for _ in range(requests)]
+
+    return {
+        'list': repeat(lambda: ('get', list_url, {'page_size': 20}, rng.choice(user_ids))),
+        'list_anonymous': repeat(lambda: ('get', list_url, {'page_size': 20}, None)),
+        'list_filter': repeat(lambda: ('get', list_url, {'price': str(rng.choice(prices))},
+                                       rng.choice(user_ids))),
+        'list_search': repeat(lambda: ('get', list_url, {'search': rng.choice(WORDS + LAST_NAMES),
+                                                         'page_size': 20}, rng.choice(user_ids))),
+        'list_ordering': repeat(lambda: ('get', list_url,
+                                         {'ordering': rng.choice(('price', '-price', 'author_name')),
+                                          'page_size': 20}, rng.choice(user_ids))),
+        'detail': repeat(lambda: ('get', reverse('book-detail', args=(pick_book(),)), None,
+                                  rng.choice(user_ids))),
+        'create': repeat(lambda: ('post', list_url,
+                                  {'name': ' '.join(rng.sample(WORDS, 2)),
+                                   'price': f'{rng.randint(100, 10000) / 100:.2f}',
+                                   'author_name': rng.choice(LAST_NAMES)}, rng.choice(user_ids))),
+        'relation': repeat(lambda: ('patch', reverse('userbookrelation-detail', args=(pick_book(),)),
+                                    {'like': rng.random() < 0.5, 'rate': rng.randint(1, 5)},
+                                    rng.choice(user_ids))),
+    }
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# Host для запросов: первый конкретный из ALLOWED_HOSTS, при DEBUG подходит localhost
+def default_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class BenchmarkRunner:
+    def __init__(self, host=None, warm_cache=False, memory_samples=10):
+        self.client = Client(SERVER_NAME=host or default_host())
+        self.users = {}
+        self.current_user = None
+        self.warm_cache = warm_cache
+        self.memory_samples = memory_samples
+
+    def prepare(self, user_id):
+        # Логин и сброс кэша не входят в замер
+        if user_id != self.current_user:
+            if user_id is None:
+                self.client.logout()
+            else:
+                if user_id not in self.users:
+                    self.users[user_id] = User.objects.get(pk=user_id)
+                self.client.force_login(self.users[user_id])
+            self.current_user = user_id
+        if not self.warm_cache:
+            get_cache().clear()
+
+    def send(self, method, url, data):
+        if method == 'get':
+            return self.client.get(url, data)
+        return getattr(self.client, method)(url, data, content_type='application/json')
+
+    def run(self, requests):
+        timings, queries, statuses = [], [], Counter()
+        started = time.perf_counter()
+        elapsed = 0
+        for method, url, data, user_id in requests:
+            self.prepare(user_id)
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = self.send(method, url, data)
+                timings.append(time.perf_counter() - request_started)
+            elapsed += timings[-1]
+            queries.append(len(captured))
+            statuses[response.status_code] += 1
+
+        # Память меряем отдельным проходом: tracemalloc заметно замедляет запросы
+        peak = 0
+        for method, url, data, user_id in requests[:self.memory_samples]:
+            self.prepare(user_id)
+            tracemalloc.start()
+            self.send(method, url, data)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        return {
+            'requests': len(requests),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'mean_ms': round(elapsed / len(timings) * 1000, 3),
+            'requests_per_sec': round(len(timings) / max(elapsed, 1e-9), 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'wall_time_s': round(time.perf_counter() - started, 3),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
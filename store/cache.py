@@ -0,0 +1,236 @@
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from store.routers import may_be_stale
+
+# Алиас кэша из settings.CACHES для ответов по книгам
+CACHE_ALIAS = 'books'
+CATALOG_VERSION_KEY = 'store:version:catalog'
+CATALOG_MODIFIED_KEY = 'store:modified:catalog'
+BOOK_VERSION_KEY = 'store:version:book:{}'
+# Общая версия всех книг: меняется массовыми операциями, которые не перечисляют id
+BOOKS_VERSION_KEY = 'store:version:books'
+# Существование книги для приема изменений write-behind (store.write_behind)
+BOOK_EXISTS_KEY = 'store:book:exists:{}:{}'
+# Сводка полок библиотеки пользователя (store.library)
+LIBRARY_COUNTS_KEY = 'store:library:counts:{}'
+# Фасеты результатов каталога (store.facets)
+FACETS_KEY = 'store:facets:{}'
+
+
+# Кэши, которые должны быть общими для всех процессов: версии каталога и книг
+# и закрепление пользователя за primary (store.routers, кэш default)
+SHARED_CACHE_ALIASES = (CACHE_ALIAS, 'default')
+PROCESS_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+# Число процессов приложения: WEB_CONCURRENCY задает число воркеров gunicorn и uvicorn
+def get_worker_count():
+    return int(os.environ.get('WEB_CONCURRENCY') or 1)
+
+
+# Кэш в памяти процесса при нескольких воркерах ломает инвалидацию: запись в одном
+# процессе не меняет версию в других, и они отдают старые ответы до TIMEOUT.
+# Проверка для manage.py check --deploy, регистрируется в StoreConfig.ready
+def check_shared_caches(app_configs=None, **kwargs):
+    if get_worker_count() <= 1:
+        return []
+    local = [alias for alias in SHARED_CACHE_ALIASES
+             if settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_CACHE_BACKENDS]
+    if not local:
+        return []
+    return [checks.Error(
+        f'Caches {", ".join(local)} are per-process (LocMemCache) but WEB_CONCURRENCY='
+        f'{get_worker_count()}: cache versions and primary pinning would not be shared between workers.',
+        hint='Configure a shared cache backend (Redis, Memcached, FileBasedCache).',
+        id='store.E001')]
+
+
+# Вызывается из books/wsgi.py и books/asgi.py: воркеры с такой конфигурацией не стартуют,
+# а manage.py (migrate, collectstatic) в том же окружении работает
+def ensure_shared_caches():
+    errors = check_shared_caches()
+    if errors:
+        raise ImproperlyConfigured(f'{errors[0].msg} {errors[0].hint}')
+
+
+# Счетчики попаданий и промахов в пределах процесса
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = Counter()
+
+    def record(self, name, hit):
+        with self.lock:
+            self.counter[f'{name}_{"hits" if hit else "misses"}'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counter)
+
+    def reset(self):
+        with self.lock:
+            self.counter.clear()
+
+
+cache_stats = CacheStats()
+
+
+# Версия (поколение) каталога или книги. Если ключ вытеснили,
+# начинаем с текущего времени, чтобы не совпасть со старыми записями.
+def get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+# Несколько версий одним запросом к кэшу, недостающие создаются как в get_version
+def get_versions(*keys):
+    values = get_cache().get_many(keys)
+    return tuple(values[key] if key in values else get_version(key) for key in keys)
+
+
+# Для async-вьюх: то же без блокирующих вызовов кэша в event loop
+async def aget_version(key):
+    cache = get_cache()
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_versions(book_ids):
+    bump_version(CATALOG_VERSION_KEY)
+    get_cache().set(CATALOG_MODIFIED_KEY, time.time(), None)
+    for book_id in book_ids:
+        bump_version(BOOK_VERSION_KEY.format(book_id))
+
+
+# Сбрасываем кэш сразу и еще раз после коммита: иначе параллельный запрос
+# может успеть закэшировать старые данные под новой версией
+def invalidate_books(*book_ids):
+    bump_versions(book_ids)
+    transaction.on_commit(lambda: bump_versions(book_ids))
+
+
+def bump_all_versions():
+    bump_version(CATALOG_VERSION_KEY)
+    bump_version(BOOKS_VERSION_KEY)
+    get_cache().set(CATALOG_MODIFIED_KEY, time.time(), None)
+
+
+# Массовое изменение книг по фильтру (пересчет счетчиков в админке): вместо версии
+# каждой книги меняется общая, она входит в ключ детальной книги
+def invalidate_all_books():
+    bump_all_versions()
+    transaction.on_commit(bump_all_versions)
+
+
+def drop_library_counts(user_ids):
+    get_cache().delete_many([LIBRARY_COUNTS_KEY.format(user_id) for user_id in user_ids])
+
+
+# Сводка полок зависит от релейшенов и книг пользователя, сбрасываем ее так же дважды
+def invalidate_library(*user_ids):
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        drop_library_counts(user_ids)
+        transaction.on_commit(lambda: drop_library_counts(user_ids))
+
+
+# Время последнего изменения каталога (unix time) или None, если неизвестно
+def get_catalog_modified():
+    return get_cache().get(CATALOG_MODIFIED_KEY)
+
+
+# Версия каталога и время его изменения одним запросом к кэшу (для async-списка)
+async def aget_catalog_state():
+    values = await get_cache().aget_many([CATALOG_VERSION_KEY, CATALOG_MODIFIED_KEY])
+    version = values.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = await aget_version(CATALOG_VERSION_KEY)
+    return version, values.get(CATALOG_MODIFIED_KEY)
+
+
+# Ответ зависит от пользователя через состояние его релейшенов
+# и от выбранного набора полей (fields, None - все поля)
+def make_cache_key(request, name, version, fields=None):
+    params = sorted((key, sorted(request.GET.getlist(key))) for key in request.GET)
+    user_id = request.user.pk if request.user.is_authenticated else None
+    accepted = getattr(request, 'accepted_media_type', '')
+    raw = repr((name, request.get_host(), request.path, params, user_id, accepted, fields, version))
+    return f'store:response:{name}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+# pk книги из URL числом: /book/07/ и /book/7/ - одна книга, и версия у них должна быть
+# одна, иначе ключ с ведущим нулем никогда не сбросится
+def get_book_pk(view):
+    try:
+        return int(view.kwargs.get(view.lookup_url_kwarg or view.lookup_field))
+    except (TypeError, ValueError):
+        raise NotFound()
+
+
+# Кэширование данных ответа list/retrieve во вьюсете (вместе с SparseFieldsMixin).
+# Ключ строится по нормализованному запросу, пользователю, набору полей и версии данных:
+# список зависит от версии каталога, детальная книга - от своей версии и общей версии книг.
+class CachedResponseMixin:
+    cache_timeout = DEFAULT_TIMEOUT
+
+    def get_cache_version(self, name):
+        if name == 'retrieve':
+            return get_versions(BOOKS_VERSION_KEY, BOOK_VERSION_KEY.format(get_book_pk(self)))
+        return get_version(CATALOG_VERSION_KEY)
+
+    def cached_response(self, name, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = make_cache_key(request, name, self.get_cache_version(name), self.get_sparse_fields())
+        data = cache.get(key)
+        cache_stats.record(name, data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        # Ответ с отстающей реплики не кэшируем, иначе он проживет до TIMEOUT
+        if response.status_code == 200 and not may_be_stale(get_catalog_modified()):
+            cache.set(key, response.data, self.cache_timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response('list', super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response('retrieve', super().retrieve, request, *args, **kwargs)
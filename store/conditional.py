@@ -0,0 +1,86 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from store.cache import CATALOG_VERSION_KEY, get_book_pk, get_catalog_modified, get_version
+from store.models import Book
+from store.write_behind import relation_buffer
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def get_not_modified(request, etag, last_modified):
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    if etag is not None and response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# Условные GET для list/retrieve. ETag и Last-Modified строятся из версии каталога
+# в кэше и updated_at строки книги, поэтому 304 отдается до запроса данных и сериализации.
+# Ответ зависит от пользователя (его лайки и рейты) и набора полей
+# (SparseFieldsMixin во вьюхе), они тоже входят в ETag.
+class ConditionalGetMixin:
+    def get_list_validators(self, request):
+        return self.build_list_validators(request, get_version(CATALOG_VERSION_KEY),
+                                          get_catalog_modified())
+
+    def build_list_validators(self, request, version, modified):
+        params = sorted((key, sorted(request.GET.getlist(key))) for key in request.GET)
+        # Незаписанные изменения пользователя (write-behind) меняют его ответ, но не версию каталога
+        pending = relation_buffer.get_user(request.user.pk) if request.user.pk else {}
+        etag = make_etag('list', version, request.path, params,
+                         request.user.pk, sorted((book_id, sorted(data.items()))
+                                                 for book_id, data in pending.items()),
+                         self.get_sparse_fields(),
+                         getattr(request, 'accepted_media_type', ''))
+        return etag, int(modified) if modified is not None else None
+
+    def get_retrieve_validators(self, request):
+        lookup = get_book_pk(self)
+        updated_at = self.get_updated_at(lookup).first()
+        return self.build_retrieve_validators(request, lookup, updated_at)
+
+    async def aget_retrieve_validators(self, request):
+        lookup = get_book_pk(self)
+        updated_at = await self.get_updated_at(lookup).afirst()
+        return self.build_retrieve_validators(request, lookup, updated_at)
+
+    def get_updated_at(self, lookup):
+        return Book.objects.filter(pk=lookup).values_list('updated_at', flat=True)
+
+    def build_retrieve_validators(self, request, lookup, updated_at):
+        # Книги нет - пусть дальше сработает обычный 404
+        if updated_at is None:
+            return None, None
+        # Незаписанные изменения релейшена (write-behind) меняют ответ, но не updated_at
+        pending = relation_buffer.get(request.user.pk, lookup) if request.user.pk else {}
+        etag = make_etag('retrieve', lookup, updated_at.isoformat(), request.user.pk,
+                         sorted(pending.items()), self.get_sparse_fields(),
+                         getattr(request, 'accepted_media_type', ''))
+        return etag, int(updated_at.timestamp())
+
+    def conditional_response(self, validators, handler, request, *args, **kwargs):
+        etag, last_modified = validators(request)
+        not_modified = get_not_modified(request._request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return add_validators(handler(request, *args, **kwargs), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.get_list_validators, super().list,
+                                         request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(self.get_retrieve_validators, super().retrieve,
+                                         request, *args, **kwargs)
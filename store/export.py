@@ -0,0 +1,84 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from store.models import Book
+
+# Поля выгрузки каталога, owner выгружается как id
+EXPORT_FIELDS = ('id', 'name', 'price', 'author_name', 'owner')
+# Денормализованные счетчики релейшенов, выгружаются по запросу
+AGGREGATE_FIELDS = ('likes_count', 'bookmarks_count', 'rating_count', 'rating')
+# Сколько строк забираем из курсора и отдаем клиенту за раз
+CHUNK_SIZE = 2000
+
+
+# Строки каталога по возрастанию id без создания объектов моделей.
+# iterator() в Postgres читает через серверный курсор, поэтому память не растет.
+def book_rows(fields, after=None):
+    queryset = Book.objects.order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    return queryset.values_list(*fields)
+
+
+def iter_book_rows(fields, after=None, chunk_size=CHUNK_SIZE):
+    return book_rows(fields, after).iterator(chunk_size=chunk_size)
+
+
+def iter_chunks(rows, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Для ASGI: синхронный итератор StreamingHttpResponse там целиком собирает в память
+# перед отправкой, поэтому строки отдаем асинхронно пачками. aiterator() для values_list
+# выполняет запрос прямо в event loop, поэтому читаем синхронный курсор через sync_to_async
+async def aiter_book_chunks(fields, after=None, chunk_size=CHUNK_SIZE):
+    rows = iter_book_rows(fields, after=after, chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+
+# Decimal и прочие типы отдаем строкой, как в API
+def ndjson_lines(chunk, fields):
+    return ''.join(json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str) + '\n'
+                   for row in chunk)
+
+
+def stream_ndjson(rows, fields):
+    for chunk in iter_chunks(rows):
+        yield ndjson_lines(chunk, fields)
+
+
+async def astream_ndjson(chunks, fields):
+    async for chunk in chunks:
+        yield ndjson_lines(chunk, fields)
+
+
+# Буфер для csv.writer: writerow возвращает строку вместо записи в файл
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for chunk in iter_chunks(rows):
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+async def astream_csv(chunks, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    async for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk)
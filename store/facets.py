@@ -0,0 +1,155 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Func, IntegerField, Max, Min, Q
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from store.cache import (CATALOG_VERSION_KEY, FACETS_KEY, cache_stats, get_cache,
+                         get_catalog_modified, get_version)
+from store.models import Book
+from store.routers import may_be_stale
+from store.search import split_terms
+
+# Фасеты результатов каталога: GET /book/?facets=1 вместе со страницей книг отдает
+# число найденных книг, топ авторов с числом книг, гистограмму цен и min/max цены
+# по тем же фильтрам и поиску. Все считается одним запросом: GROUP BY author_name
+# дает счетчики авторов, а итоги по всем группам (число книг, корзины цен, min/max)
+# добавляются оконными агрегатами OVER () до LIMIT по числу авторов.
+#
+# Фасеты не зависят от страницы, сортировки и пользователя, поэтому кэшируются
+# отдельно от ответа по нормализованным параметрам фильтров и поиска и версии каталога:
+# листание страниц и смена сортировки не пересчитывают их
+
+DEFAULTS = {
+    'AUTHORS_LIMIT': 10,
+    # Границы корзин цены: [< 10), [10, 50), [50, 100), [>= 100)
+    'PRICE_BUCKETS': (10, 50, 100),
+}
+
+PRICE_FIELD = Book._meta.get_field('price')
+# Цены в фасетах строками, как в ответе книг
+PRICE = serializers.DecimalField(max_digits=PRICE_FIELD.max_digits,
+                                 decimal_places=PRICE_FIELD.decimal_places)
+
+
+def get_setting(name):
+    return getattr(settings, 'STORE_FACETS', {}).get(name, DEFAULTS[name])
+
+
+# Итог агрегата по всем группам GROUP BY: SUM(COUNT(...)) OVER ().
+# Window в ORM не принимает агрегат внутри агрегата, поэтому шаблон свой
+class GroupTotal(Func):
+    template = '%(function)s(%(expressions)s) OVER ()'
+    contains_over_clause = True
+    window_compatible = True
+
+
+# Корзины цены: [(нижняя граница или None, верхняя или None), ...]
+def get_price_buckets():
+    edges = sorted(get_setting('PRICE_BUCKETS'))
+    bounds = [None, *edges, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def price_range(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def format_price(value):
+    return None if value is None else PRICE.to_representation(value)
+
+
+# Фасеты queryset книг одним запросом
+def compute_facets(queryset):
+    buckets = get_price_buckets()
+    totals = {
+        'total': GroupTotal(Count('id'), function='SUM', output_field=IntegerField()),
+        'min_price': GroupTotal(Min('price'), function='MIN', output_field=PRICE_FIELD),
+        'max_price': GroupTotal(Max('price'), function='MAX', output_field=PRICE_FIELD),
+    }
+    for index, (low, high) in enumerate(buckets):
+        totals[f'bucket_{index}'] = GroupTotal(Count('id', filter=price_range(low, high)),
+                                               function='SUM', output_field=IntegerField())
+    # Сортировка поиска и ?ordering= для группировки не нужны
+    rows = list(queryset.order_by().values('author_name')
+                .annotate(count=Count('id'), **totals)
+                .order_by('-count', 'author_name')[:get_setting('AUTHORS_LIMIT')])
+
+    first = rows[0] if rows else {}
+    return {
+        'count': first.get('total', 0),
+        'authors': [{'author_name': row['author_name'], 'count': row['count']} for row in rows],
+        'price': {
+            'min': format_price(first.get('min_price')),
+            'max': format_price(first.get('max_price')),
+            'buckets': [{'gte': format_price(low), 'lt': format_price(high),
+                         'count': first.get(f'bucket_{index}', 0)}
+                        for index, (low, high) in enumerate(buckets)],
+        },
+    }
+
+
+# Ключ фасетов: параметры фильтров и поиска без порядка и пустых значений, поисковая
+# строка - словами в нижнем регистре, как ее видят движки поиска
+def make_facets_key(params, version):
+    normalized = []
+    for name, values in params:
+        if name == api_settings.SEARCH_PARAM:
+            values = [' '.join(split_terms(values)).lower()]
+        values = sorted(value for value in values if value)
+        if values:
+            normalized.append((name, values))
+    raw = repr((sorted(normalized), get_setting('AUTHORS_LIMIT'), get_price_buckets(), version))
+    return FACETS_KEY.format(hashlib.sha1(raw.encode()).hexdigest())
+
+
+# Фасеты из кэша или посчитанные заново. params - [(имя параметра, [значения]), ...]
+def get_facets(queryset, params):
+    cache = get_cache()
+    key = make_facets_key(params, get_version(CATALOG_VERSION_KEY))
+    facets = cache.get(key)
+    cache_stats.record('facets', facets is not None)
+    if facets is not None:
+        return facets
+
+    facets = compute_facets(queryset)
+    # Как и ответы, фасеты с отстающей реплики не кэшируем
+    if not may_be_stale(get_catalog_modified()):
+        cache.set(key, facets)
+    return facets
+
+
+# ?facets=1 на list добавляет фасеты в ответ: в страницу пагинации ключом facets,
+# список без пагинации становится {"results": [...], "facets": {...}}
+class FacetsMixin:
+    facets_query_param = 'facets'
+
+    def wants_facets(self):
+        return self.request.query_params.get(self.facets_query_param) in ('1', 'true')
+
+    # Параметры, от которых зависят фасеты: фильтры filterset_class и поиск
+    def get_facet_params(self):
+        names = {*self.filterset_class.base_filters, api_settings.SEARCH_PARAM}
+        return [(name, self.request.query_params.getlist(name))
+                for name in names if name in self.request.query_params]
+
+    # Книги по тем же фильтрам и поиску, без состояния пользователя и prefetch
+    def get_facets_queryset(self):
+        return self.filter_queryset(self.queryset.all())
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != 200 or not self.wants_facets():
+            return response
+        facets = get_facets(self.get_facets_queryset(), self.get_facet_params())
+        if isinstance(response.data, dict):
+            response.data['facets'] = facets
+        else:
+            response.data = {'results': response.data, 'facets': facets}
+        return response
@@ -0,0 +1,218 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from store.search import SEARCH_RANK
+from store.timing import timing
+
+# Поля, значения которых из базы уже в нужном виде
+IDENTITY_FIELDS = (serializers.CharField, serializers.IntegerField,
+                   serializers.BooleanField, PrimaryKeyRelatedField)
+
+
+def identity(value):
+    return value
+
+
+# Decimal из базы приводим к строке с нужным числом знаков, как DecimalField в DRF
+def decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if (not coerce_to_string or field.localize or field.normalize_output
+            or field.decimal_places is None):
+        return field.to_representation
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+
+    def convert(value):
+        return format(value.quantize(exponent), 'f')
+    return convert
+
+
+def build_converter(field):
+    if isinstance(field, serializers.DecimalField):
+        return decimal_converter(field)
+    # EmailField, SlugField и т.п. наследуют CharField, но тоже отдают строку как есть
+    if isinstance(field, IDENTITY_FIELDS):
+        return identity
+    return field.to_representation
+
+
+# Список в виде таблицы: имена полей и строки-списки значений в том же порядке.
+# Его строят для колоночных рендереров (store.renderers), без словаря на каждую строку
+class Table:
+    def __init__(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Массив значений на каждое поле
+    def columns(self):
+        if not self.rows:
+            return {name: [] for name in self.fields}
+        return dict(zip(self.fields, map(list, zip(*self.rows))))
+
+
+# Сериализация списка книг напрямую из кортежей values_list(), без создания
+# моделей и без пополевого to_representation в DRF. План (колонки и конвертеры)
+# строится один раз по полям обычного сериализатора, результат с ним совпадает.
+class ValuesListSerializer:
+    # extra_columns - колонки, которые нужны помимо полей ответа, например пагинации
+    def __init__(self, serializer, queryset, extra_columns=()):
+        self.serializer = serializer
+        self.model = queryset.model
+        self.columns = []
+        self.plan = []
+        self.many = []
+        annotations = set(queryset.query.annotations)
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, ManyRelatedField):
+                self.plan.append((name, None, None))
+                self.many.append((name, field.source))
+                continue
+            if field.source in annotations or self.is_model_field(field.source):
+                self.plan.append((name, len(self.columns), build_converter(field)))
+                self.columns.append(field.source)
+            elif field.allow_null:
+                # Аннотации нет (например, аноним) - DRF отдает null
+                self.plan.append((name, None, None))
+            else:
+                raise ValueError(f'Field "{name}" can not be read from values_list()')
+        # Для many-полей нужен id книги, даже если его нет в выдаче
+        if self.many:
+            extra_columns = ('id', *extra_columns)
+        for column in extra_columns:
+            if column not in self.columns:
+                self.columns.append(column)
+
+    def is_model_field(self, source):
+        try:
+            field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.many_to_many
+
+    # Набор строк для пагинации: именованные кортежи, чтобы курсор мог брать поля по имени
+    def get_rows(self, queryset):
+        return queryset.prefetch_related(None).values_list(*self.columns, named=True)
+
+    # id связанных объектов для many-полей одним запросом на страницу
+    def get_many_values(self, rows):
+        return {name: (pk_index, self.group(list(pairs)))
+                for name, pk_index, pairs in self.get_many_querysets(rows)}
+
+    async def aget_many_values(self, rows):
+        return {name: (pk_index, self.group([pair async for pair in pairs]))
+                for name, pk_index, pairs in self.get_many_querysets(rows)}
+
+    def get_many_querysets(self, rows):
+        if not self.many or not rows:
+            return []
+        pk_index = self.columns.index('id')
+        ids = [row[pk_index] for row in rows]
+        querysets = []
+        for name, source in self.many:
+            relation = self.model._meta.get_field(source)
+            through = relation.remote_field.through
+            from_field = relation.m2m_field_name()
+            to_field = relation.m2m_reverse_field_name()
+            querysets.append((name, pk_index, through.objects.filter(**{f'{from_field}__in': ids})
+                              .order_by('pk').values_list(f'{from_field}_id', f'{to_field}_id')))
+        return querysets
+
+    def group(self, pairs):
+        grouped = defaultdict(list)
+        for from_id, to_id in pairs:
+            grouped[from_id].append(to_id)
+        return grouped
+
+    def to_representation(self, rows):
+        many_values = self.get_many_values(rows)
+        with timing('serialize'):
+            return self.build(rows, many_values)
+
+    def to_table(self, rows):
+        many_values = self.get_many_values(rows)
+        with timing('serialize'):
+            return Table([name for name, _, _ in self.plan], self.build_rows(rows, many_values))
+
+    async def ato_representation(self, rows):
+        many_values = await self.aget_many_values(rows)
+        with timing('serialize'):
+            return self.build(rows, many_values)
+
+    def build(self, rows, many_values):
+        plan = self.plan
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, convert in plan:
+                if convert is not None:
+                    value = row[index]
+                    item[name] = None if value is None else convert(value)
+                elif name in many_values:
+                    pk_index, grouped = many_values[name]
+                    item[name] = grouped.get(row[pk_index], [])
+                else:
+                    item[name] = None
+            data.append(item)
+        return data
+
+    # То же, что build, но строка - список значений в порядке plan
+    def build_rows(self, rows, many_values):
+        plan = self.plan
+        data = []
+        for row in rows:
+            values = []
+            for name, index, convert in plan:
+                if convert is not None:
+                    value = row[index]
+                    values.append(None if value is None else convert(value))
+                elif name in many_values:
+                    pk_index, grouped = many_values[name]
+                    values.append(grouped.get(row[pk_index], []))
+                else:
+                    values.append(None)
+            data.append(values)
+        return data
+
+
+# Быстрый list: пагинация и сериализация идут по кортежам values_list().
+# Если сериализатор нельзя собрать из колонок, работает обычный list.
+class FastListMixin:
+    # Курсору нужны id и поля сортировки из ?ordering=, даже если их нет среди полей ответа,
+    # а для результатов поиска (queryset с аннотацией) - еще и ранг
+    def get_extra_columns(self, queryset=None):
+        allowed = getattr(self, 'ordering_fields', None) or ()
+        terms = self.request.query_params.get('ordering', '').split(',')
+        columns = ('id', *(name for name in (term.strip().lstrip('-') for term in terms)
+                           if name in allowed))
+        if queryset is not None and SEARCH_RANK in queryset.query.annotations:
+            columns += (SEARCH_RANK,)
+        return columns
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            fast = ValuesListSerializer(self.get_serializer(), queryset,
+                                        self.get_extra_columns(queryset))
+        except ValueError:
+            return super().list(request, *args, **kwargs)
+
+        rows = fast.get_rows(queryset)
+        # Колоночным рендерерам отдаем таблицу вместо списка словарей
+        if getattr(request.accepted_renderer, 'columnar', False):
+            represent = fast.to_table
+        else:
+            represent = fast.to_representation
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(represent(list(page)))
+        return Response(represent(list(rows)))
@@ -0,0 +1,15 @@
+from django_filters import rest_framework as filters
+
+from store.models import Book
+
+
+# Фильтры каталога. ?price= как раньше, плюс диапазоны (?price__gte=10&price__lt=50,
+# ?price__range=10,50) и списки (?price__in=10,25) - все идут по индексу (price, id).
+# Автор для перехода по фасету (?author_name= / ?author_name__in=) - по индексу (author_name, id)
+class BookFilter(filters.FilterSet):
+    class Meta:
+        model = Book
+        fields = {
+            'price': ['exact', 'in', 'range', 'gt', 'gte', 'lt', 'lte'],
+            'author_name': ['exact', 'in'],
+        }
@@ -0,0 +1,138 @@
+import csv
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+# Разбор и проверка строк импорта. Модуль не трогает базу и ORM,
+# поэтому его функции выполняются в отдельных процессах пула.
+
+BOOK_COLUMNS = ('name', 'price', 'author_name', 'owner')
+RELATION_COLUMNS = ('user', 'book', 'like', 'in_bookmarks', 'rate')
+MAX_PRICE = Decimal('100000')
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt):
+    # CSV разбираем здесь же (поля бывают многострочными),
+    # NDJSON отдаем строками, json разбирается уже в пуле
+    with open(path, newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(file, start=1):
+                if line.strip():
+                    yield line_num, line
+
+
+def iter_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def required_text(row, field, max_length=255):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        raise RowError(f'{field}: This field is required.')
+    if len(value) > max_length:
+        raise RowError(f'{field}: Ensure this field has no more than {max_length} characters.')
+    return value
+
+
+def parse_bool(row, field):
+    value = row.get(field)
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'{field}: Must be a valid boolean.')
+
+
+def validate_book(row):
+    name = required_text(row, 'name')
+    author_name = required_text(row, 'author_name')
+    try:
+        price = Decimal(str(row.get('price')).strip())
+    except InvalidOperation:
+        raise RowError('price: A valid number is required.')
+    if not price.is_finite() or price.as_tuple().exponent < -2 or abs(price) >= MAX_PRICE:
+        raise RowError('price: Ensure that there are no more than 7 digits in total '
+                       'and 2 decimal places.')
+    owner = row.get('owner')
+    owner = str(owner).strip() if owner not in (None, '') else None
+    return name, price, author_name, owner
+
+
+def validate_relation(row):
+    user = required_text(row, 'user', max_length=150)
+    try:
+        book = int(row.get('book'))
+    except (TypeError, ValueError):
+        raise RowError('book: A valid integer is required.')
+    rate = row.get('rate')
+    if rate in (None, ''):
+        rate = None
+    else:
+        try:
+            rate = int(rate)
+        except (TypeError, ValueError):
+            raise RowError('rate: A valid integer is required.')
+        if not 1 <= rate <= 5:
+            raise RowError(f'rate: "{rate}" is not a valid choice.')
+    return user, book, parse_bool(row, 'like'), parse_bool(row, 'in_bookmarks'), rate
+
+
+VALIDATORS = {
+    'books': validate_book,
+    'relations': validate_relation,
+}
+
+
+# Проверка пачки строк. Возвращает принятые строки (номер, исходник, значения)
+# и отклоненные (номер, исходник, ошибка)
+def validate_chunk(kind, chunk):
+    validator = VALIDATORS[kind]
+    valid, rejected = [], []
+    for line_num, raw in chunk:
+        try:
+            row = json.loads(raw) if isinstance(raw, str) else raw
+            if not isinstance(row, dict):
+                raise RowError('Expected an object.')
+            valid.append((line_num, row, validator(row)))
+        except (RowError, json.JSONDecodeError) as error:
+            rejected.append((line_num, raw, str(error)))
+    return valid, rejected
+
+
+# Прогоняем пачки через пул процессов, сохраняя порядок.
+# В работе держим не больше двух пачек на процесс, чтобы не читать файл целиком.
+def run_pool(func, chunks, workers):
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(func, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from store.models import LeaderboardState
+from store.similar import state_weight
+
+# Рейтинги книг. Очки хранятся в самой книге и обновляются тем же UPDATE,
+# что и счетчики, поэтому страница рейтинга - диапазон по индексу без агрегатов.
+#
+# top_score - байесовское среднее: (C * m + сумма оценок) / (C + число оценок),
+# где m - средняя оценка по каталогу, C - вес априорной оценки. Пара оценок
+# 5 не поднимает книгу выше книги с сотней оценок 4.8.
+#
+# trending_score - сумма весов релейшенов (как у похожих книг), затухающих
+# вдвое за TRENDING_HALF_LIFE_HOURS. Чтобы не пересчитывать все книги со
+# временем, вклад хранится в масштабе эпохи E: w * 2^((t - E) / half_life).
+# Порядок книг от этого не меняется, а к текущему моменту значение приводится
+# делением на decay_factor(now, E). Множитель растет со временем, поэтому
+# refresh_leaderboards переносит эпоху (LeaderboardState.trending_epoch) на момент
+# пересчета и считает очки уже в ее масштабе
+
+DEFAULTS = {
+    'RATING_PRIOR_WEIGHT': 10,
+    # m до первого refresh_leaderboards
+    'DEFAULT_RATING_MEAN': 3.0,
+    'TRENDING_HALF_LIFE_HOURS': 48,
+    # Книги с меньшим приведенным trending в рейтинг не попадают
+    'TRENDING_MIN_SCORE': 0.01,
+}
+# Эпоха до первого refresh_leaderboards
+DEFAULT_EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+# Предел показателя множителя: 2^1024 уже не помещается во float. Если
+# refresh_leaderboards долго не запускали, вклады упираются в предел
+# (свежая активность перестает перевешивать старую), но запись релейшена не падает
+MAX_DECAY_EXPONENT = 512
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name):
+    return getattr(settings, 'STORE_LEADERBOARDS', {}).get(name, DEFAULTS[name])
+
+
+def get_trending_epoch():
+    return LeaderboardState.objects.values_list('trending_epoch', flat=True).first() or DEFAULT_EPOCH
+
+
+# Эпоха подзапросом, чтобы прочитать ее тем же запросом, что и строку книги
+# (пусто - DEFAULT_EPOCH)
+def trending_epoch_subquery():
+    return Subquery(LeaderboardState.objects.values('trending_epoch')[:1])
+
+
+def decay_factor(moment, epoch):
+    half_life = get_setting('TRENDING_HALF_LIFE_HOURS') * 3600
+    exponent = (moment - epoch).total_seconds() / half_life
+    if exponent > MAX_DECAY_EXPONENT:
+        logger.warning('Trending epoch %s is too old, run refresh_leaderboards', epoch.isoformat())
+        exponent = MAX_DECAY_EXPONENT
+    return 2 ** exponent
+
+
+def trending_contribution(state, moment, epoch):
+    weight = state_weight(state)
+    if not weight or moment is None:
+        return 0.0
+    return weight * decay_factor(moment, epoch)
+
+
+# Изменение trending книги, когда релейшен перешел из old_state, записанного
+# в old_time, в new_state на момент new_time. Пакетные изменения передают
+# эпоху один раз, поштучные читают ее, только если вклад может поменяться
+def trending_delta(old_state, old_time, new_state, new_time, epoch=None):
+    if not state_weight(old_state) and not state_weight(new_state):
+        return 0.0
+    if epoch is None:
+        epoch = get_trending_epoch()
+    return (trending_contribution(new_state, new_time, epoch)
+            - trending_contribution(old_state, old_time, epoch))
+
+
+def trending_threshold(moment, epoch):
+    return get_setting('TRENDING_MIN_SCORE') * decay_factor(moment, epoch)
+
+
+# m берется подзапросом к строке LeaderboardState в том же UPDATE
+def rating_mean():
+    return Coalesce(Subquery(LeaderboardState.objects.values('rating_mean')[:1]),
+                    Value(float(get_setting('DEFAULT_RATING_MEAN'))), output_field=FloatField())
+
+
+# Выражение top_score для UPDATE книги, когда сумма и число оценок
+# меняются на sum_delta и count_delta (в UPDATE видны старые значения)
+def top_score_update(sum_delta=0, count_delta=0):
+    weight = get_setting('RATING_PRIOR_WEIGHT')
+    rating_count = F('rating_count') + count_delta
+    return Case(
+        When(rating_count__lte=-count_delta, then=Value(0.0)),
+        default=(Cast(F('rating_sum') + sum_delta, FloatField()) + rating_mean() * weight)
+        / (rating_count + weight),
+        output_field=FloatField(),
+    )
+
+
+# Выражение trending_score для UPDATE нескольких книг с разными изменениями
+def trending_update(deltas):
+    return F('trending_score') + Case(
+        *[When(id=book_id, then=Value(delta)) for book_id, delta in deltas.items() if delta],
+        default=Value(0.0), output_field=FloatField(),
+    )
@@ -0,0 +1,42 @@
+from django.db.models import Count, Q
+
+from store.cache import LIBRARY_COUNTS_KEY, get_cache, get_catalog_modified
+from store.models import Book, UserBookRelation
+from store.routers import may_be_stale
+
+# Библиотека пользователя: его книги и книги с лайком, закладкой или оценкой
+SHELVES = ('owned', 'liked', 'bookmarked', 'rated')
+
+
+# Условие полки для queryset книг из annotate_user_relation. Полки по релейшенам
+# фильтруют по аннотациям того же JOIN user_relation, из которого берется состояние
+# пользователя: условие в WHERE отбрасывает NULL, и база делает JOIN внутренним
+# по частичному индексу полки
+def shelf_filter(shelf, user):
+    if shelf == 'owned':
+        return Q(owner=user)
+    if shelf == 'liked':
+        return Q(user_like=True)
+    if shelf == 'bookmarked':
+        return Q(user_in_bookmarks=True)
+    return Q(user_rate__isnull=False)
+
+
+# Число книг на каждой полке. Лежит в кэше до записи релейшена или книги пользователя
+def get_shelf_counts(user):
+    cache = get_cache()
+    key = LIBRARY_COUNTS_KEY.format(user.pk)
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    counts = {'owned': Book.objects.filter(owner=user).count()}
+    counts.update(UserBookRelation.objects.filter(user=user).aggregate(
+        liked=Count('id', filter=Q(like=True)),
+        bookmarked=Count('id', filter=Q(in_bookmarks=True)),
+        rated=Count('rate'),
+    ))
+    # Как и ответы, сводку с отстающей реплики не кэшируем
+    if not may_be_stale(get_catalog_modified()):
+        cache.set(key, counts)
+    return counts
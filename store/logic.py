@@ -0,0 +1,361 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import connection, transaction
+from django.db.models import (Case, Count, F, FilteredRelation, FloatField, OuterRef, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Cast, Coalesce, Now
+from django.utils import timezone
+
+from store.cache import invalidate_books, invalidate_library
+from store.leaderboards import (DEFAULT_EPOCH, get_trending_epoch, top_score_update, trending_delta,
+                                trending_epoch_subquery, trending_update)
+from store.models import Book, UserBookRelation
+from store.similar import state_weight, track_change, track_changes
+
+# Поля состояния релейшена
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+# Поля, которые обновляет upsert существующего релейшена
+RELATION_UPSERT_FIELDS = (*RELATION_FIELDS, 'updated_at')
+# Аннотации прошлого состояния релейшена в запросе строки книги (upsert_relation)
+OLD_RELATION_FIELDS = (*(f'old_{field}' for field in RELATION_FIELDS), 'old_updated_at')
+# Состояние релейшена (like, in_bookmarks, rate), которое не влияет на счетчики
+EMPTY_RELATION_STATE = (False, False, None)
+# Сколько релейшенов change_relations блокирует и меняет за одну транзакцию
+CHANGE_BATCH_SIZE = 1000
+
+
+# Вклад одного релейшена в счетчики книги
+def relation_counters(state):
+    like, in_bookmarks, rate = state
+    return {
+        'likes_count': int(bool(like)),
+        'bookmarks_count': int(bool(in_bookmarks)),
+        'rating_sum': rate or 0,
+        'rating_count': int(rate is not None),
+    }
+
+
+# Применяем к книге разницу между старым и новым состоянием релейшена
+# одним UPDATE без чтения строки книги. old_time и new_time - время записи
+# старого и нового состояния, от них зависит вклад в trending (в масштабе эпохи epoch,
+# None - прочитать эпоху, если вклад меняется). readers_changed - релейшен создан
+# или удален, то есть поменялся список читателей книги
+def apply_relation_change(book_id, old_state, new_state, old_time=None, new_time=None, epoch=None,
+                          readers_changed=False):
+    old = relation_counters(old_state)
+    new = relation_counters(new_state)
+    delta = {field: new[field] - old[field] for field in new}
+    trending = trending_delta(old_state, old_time, new_state, new_time, epoch)
+    if not any(delta.values()) and not trending and not readers_changed:
+        return
+
+    updates = {field: F(field) + value for field, value in delta.items() if value}
+    if any(delta.values()) or readers_changed:
+        # Счетчики и читатели входят в представление книги, поэтому двигаем
+        # и время изменения: от него зависит ETag книги
+        updates['updated_at'] = Now()
+    if delta['rating_sum'] or delta['rating_count']:
+        # В правой части UPDATE видны старые значения колонок, поэтому прибавляем дельту сами
+        rating_count = F('rating_count') + delta['rating_count']
+        updates['rating'] = Case(
+            When(rating_count__lte=-delta['rating_count'], then=Value(None)),
+            default=Cast(F('rating_sum') + delta['rating_sum'], FloatField()) / rating_count,
+        )
+        updates['top_score'] = top_score_update(delta['rating_sum'], delta['rating_count'])
+    if trending:
+        updates['trending_score'] = F('trending_score') + trending
+    Book.objects.filter(pk=book_id).update(**updates)
+
+
+# Пересчитываем счетчики набора книг по релейшенам двумя UPDATE,
+# используется после пакетных изменений в обход UserBookRelation.save.
+# trending из релейшенов так не посчитать, его изменения по книгам передаются
+# в trending_deltas, полностью он пересчитывается refresh_leaderboards
+def rebuild_counters(book_ids, trending_deltas=None):
+    def aggregate(expression):
+        relations = (UserBookRelation.objects.filter(book=OuterRef('pk'))
+                     .values('book').annotate(value=expression).values('value'))
+        return Coalesce(Subquery(relations), 0)
+
+    books = Book.objects.filter(id__in=book_ids)
+    books.update(
+        likes_count=aggregate(Count('id', filter=Q(like=True))),
+        bookmarks_count=aggregate(Count('id', filter=Q(in_bookmarks=True))),
+        rating_sum=aggregate(Sum('rate')),
+        rating_count=aggregate(Count('rate')),
+    )
+    updates = {}
+    if trending_deltas and any(trending_deltas.values()):
+        updates['trending_score'] = trending_update(trending_deltas)
+    books.update(
+        rating=Case(
+            When(rating_count=0, then=Value(None)),
+            default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        ),
+        top_score=top_score_update(),
+        updated_at=Now(),
+        **updates,
+    )
+
+
+# Запись релейшена пользователя через INSERT ... ON CONFLICT DO UPDATE
+# по уникальности (user, book). Возвращает None, если книги нет.
+# В Postgres прошлое состояние, upsert и эпоха trending - один запрос,
+# дальше UPDATE счетчиков книги и, если поменялся вес, очередь похожих книг.
+# В остальных базах (SQLite) прошлое состояние и эпоха читаются вместе со строкой книги
+def upsert_relation(user, book_id, data):
+    if connection.vendor == 'postgresql':
+        return upsert_relation_postgres(user, book_id, data)
+    with transaction.atomic():
+        # Запись в SQLite сериализует сама база: транзакция, чье чтение устарело,
+        # получит ошибку на записи, а не испортит счетчики
+        book = (Book.objects.select_for_update().filter(pk=book_id)
+                .annotate(epoch=trending_epoch_subquery(), **old_relation_subqueries(user, book_id))
+                .values_list('epoch', *OLD_RELATION_FIELDS).first())
+        if book is None:
+            return None
+        epoch, *old = book
+        old_state, old_time = (tuple(old[:-1]), old[-1]) if old[-1] else (EMPTY_RELATION_STATE, None)
+        new_state = tuple(data.get(field, value) for field, value in zip(RELATION_FIELDS, old_state))
+        relation = UserBookRelation(user=user, book_id=book_id,
+                                    **dict(zip(RELATION_FIELDS, new_state)))
+        UserBookRelation.objects.bulk_create([relation], update_conflicts=True,
+                                             unique_fields=['user', 'book'],
+                                             update_fields=RELATION_UPSERT_FIELDS)
+        apply_relation_change(book_id, old_state, new_state, old_time, relation.updated_at,
+                              epoch or DEFAULT_EPOCH, readers_changed=old_time is None)
+        track_change(user.pk, book_id, old_state, new_state)
+    # bulk_create не отправляет сигналы
+    invalidate_books(book_id)
+    invalidate_library(user.pk)
+    return relation
+
+
+def old_relation_subqueries(user, book_id):
+    relation = UserBookRelation.objects.filter(user=user, book_id=book_id)
+    return {f'old_{field}': Subquery(relation.values(field)[:1])
+            for field in (*RELATION_FIELDS, 'updated_at')}
+
+
+# Прошлое состояние (old, FOR UPDATE ждет параллельную запись и берет ее результат),
+# upsert и эпоха одним запросом. Незаданные поля upsert берет из текущей строки,
+# поэтому состояние верно и при гонке. INSERT ... SELECT из old задает порядок:
+# old читается до записи. xmax = 0 - строка вставлена, а не обновлена.
+# Пустая выборка - книги нет
+UPSERT_RELATION_SQL = """
+WITH old AS (
+    SELECT "like", in_bookmarks, rate, updated_at FROM store_userbookrelation
+    WHERE user_id = %(user_id)s AND book_id = %(book_id)s FOR UPDATE
+), up AS (
+    INSERT INTO store_userbookrelation AS relation
+        (user_id, book_id, "like", in_bookmarks, rate, created_at, updated_at)
+    SELECT %(user_id)s, book.id, {insert_values}, %(now)s, %(now)s
+    FROM store_book book LEFT JOIN old ON TRUE WHERE book.id = %(book_id)s
+    ON CONFLICT (user_id, book_id) DO UPDATE SET {update_values}
+    RETURNING relation."like", relation.in_bookmarks, relation.rate, relation.created_at,
+              relation.updated_at, relation.xmax = 0
+)
+SELECT up.*, old."like", old.in_bookmarks, old.rate, old.updated_at,
+       (SELECT trending_epoch FROM store_leaderboardstate LIMIT 1)
+FROM up LEFT JOIN old ON TRUE
+"""
+RELATION_COLUMNS = {'like': ('"like"', 'boolean', 'FALSE'),
+                    'in_bookmarks': ('in_bookmarks', 'boolean', 'FALSE'),
+                    'rate': ('rate', 'smallint', 'NULL')}
+
+
+def upsert_relation_postgres(user, book_id, data):
+    insert_values, update_values = [], []
+    for field in RELATION_FIELDS:
+        column, db_type, default = RELATION_COLUMNS[field]
+        if field in data:
+            insert_values.append(f'%({field})s::{db_type}')
+            update_values.append(f'{column} = EXCLUDED.{column}')
+        else:
+            insert_values.append(f'COALESCE(old.{column}, {default})')
+    update_values.append('updated_at = EXCLUDED.updated_at')
+    sql = UPSERT_RELATION_SQL.format(insert_values=', '.join(insert_values),
+                                     update_values=', '.join(update_values))
+    params = {'user_id': user.pk, 'book_id': book_id, 'now': timezone.now(),
+              **{field: data[field] for field in RELATION_FIELDS if field in data}}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        like, in_bookmarks, rate, created_at, updated_at, inserted, *old, epoch = row
+        new_state = (like, in_bookmarks, rate)
+        if inserted:
+            old_state, old_time = EMPTY_RELATION_STATE, None
+        elif old[-1] is not None:
+            old_state, old_time = tuple(old[:-1]), old[-1]
+        else:
+            old_state = None
+        if old_state is not None:
+            apply_relation_change(book_id, old_state, new_state, old_time, updated_at,
+                                  epoch or DEFAULT_EPOCH, readers_changed=inserted)
+            track_change(user.pk, book_id, old_state, new_state)
+        else:
+            # Параллельная запись того же релейшена вставила его после начала запроса:
+            # прошлое состояние неизвестно, счетчики книги пересчитываем целиком
+            rebuild_counters([book_id])
+            track_changes([(user.pk, book_id)])
+    invalidate_books(book_id)
+    invalidate_library(user.pk)
+    relation = UserBookRelation(user=user, book_id=book_id, like=like, in_bookmarks=in_bookmarks,
+                                rate=rate, created_at=created_at, updated_at=updated_at)
+    relation._state.adding = False
+    return relation
+
+
+# Пакетная запись релейшенов разных пользователей: changes - {(user_id, book_id): {поле: значение}}.
+# Переданные поля меняются, остальные остаются как были, книги должны существовать.
+# Существующие релейшены блокируются в порядке ключа, чтобы параллельные пакеты
+# не ждали друг друга по кругу, все пишутся одним INSERT ... ON CONFLICT DO UPDATE.
+# Возвращает ключи созданных релейшенов
+def upsert_relations(changes):
+    if not changes:
+        return set()
+    books_by_user = defaultdict(list)
+    for user_id, book_id in changes:
+        books_by_user[user_id].append(book_id)
+    query = Q()
+    for user_id, book_ids in books_by_user.items():
+        query |= Q(user_id=user_id, book_id__in=book_ids)
+
+    with transaction.atomic():
+        relations = {
+            (relation.user_id, relation.book_id): relation for relation in
+            UserBookRelation.objects.select_for_update().filter(query).order_by('user_id', 'book_id')
+        }
+        created = set()
+        upserts = []
+        for key, data in changes.items():
+            relation = relations.get(key)
+            if relation is None:
+                relation = UserBookRelation(user_id=key[0], book_id=key[1])
+                created.add(key)
+            for field, value in data.items():
+                setattr(relation, field, value)
+            upserts.append(relation)
+        UserBookRelation.objects.bulk_create(upserts, update_conflicts=True,
+                                             unique_fields=['user', 'book'],
+                                             update_fields=RELATION_UPSERT_FIELDS)
+
+        # Пакет идет в обход save(), счетчики пересчитываем по книгам пакета
+        epoch = get_trending_epoch()
+        trending_deltas = defaultdict(float)
+        weight_changes = []
+        for relation in upserts:
+            new_state = (relation.like, relation.in_bookmarks, relation.rate)
+            trending_deltas[relation.book_id] += trending_delta(
+                relation.old_state, relation.old_updated_at, new_state, relation.updated_at, epoch)
+            if state_weight(relation.old_state) != state_weight(new_state):
+                weight_changes.append((relation.user_id, relation.book_id))
+        rebuild_counters(trending_deltas, trending_deltas=trending_deltas)
+        track_changes(weight_changes)
+    invalidate_books(*trending_deltas)
+    invalidate_library(*books_by_user)
+    return created
+
+
+# Изменение или удаление набора релейшенов (действия админки). values - новые значения
+# полей, None - удалить. Выборка обходится пачками по pk, каждая в своей транзакции:
+# память и время блокировок не растут с размером выборки. Прошлые состояния пачки
+# читаются одним запросом, по ним считаются изменения trending и очередь похожих книг,
+# счетчики пересчитываются по книгам пачки. Возвращает число релейшенов
+def change_relations(queryset, values=None):
+    # Выборку админки (с JOIN и сортировкой) заменяем подзапросом по pk
+    relations = UserBookRelation.objects.filter(pk__in=queryset.values('pk')).order_by('pk')
+    epoch = get_trending_epoch()
+    count = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(relations.filter(pk__gt=last_pk).select_for_update()
+                        .values_list('pk', 'user_id', 'book_id', *RELATION_FIELDS, 'updated_at')
+                        [:CHANGE_BATCH_SIZE])
+            if not rows:
+                return count
+            pks = [pk for pk, *_ in rows]
+            now = timezone.now()
+            if values is None:
+                delete_relations(pks)
+            else:
+                UserBookRelation.objects.filter(pk__in=pks).update(**values, updated_at=now)
+
+            trending_deltas = defaultdict(float)
+            weight_changes = []
+            for _, user_id, book_id, *state, updated_at in rows:
+                old_state = tuple(state)
+                if values is None:
+                    new_state, new_time = EMPTY_RELATION_STATE, None
+                else:
+                    new_state = tuple(values.get(field, value)
+                                      for field, value in zip(RELATION_FIELDS, old_state))
+                    new_time = now
+                trending_deltas[book_id] += trending_delta(old_state, updated_at, new_state, new_time, epoch)
+                if state_weight(old_state) != state_weight(new_state):
+                    weight_changes.append((user_id, book_id))
+            rebuild_counters(trending_deltas, trending_deltas=trending_deltas)
+            track_changes(weight_changes)
+        invalidate_books(*trending_deltas)
+        invalidate_library(*{user_id for _, user_id, *_ in rows})
+        count += len(rows)
+        last_pk = pks[-1]
+
+
+# DELETE релейшенов по pk без сбора объектов: QuerySet.delete() отправил бы
+# post_delete на каждую строку, а вклад в счетчики change_relations вычитает пачкой сам
+def delete_relations(pks):
+    table = connection.ops.quote_name(UserBookRelation._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', pks)
+
+
+# Состояние релейшена пользователя с книгой. Если релейшена нет - пустое состояние,
+# если нет книги - None
+def get_relation_state(user, book_id):
+    state = relation_state_queryset(user, book_id).first()
+    if state is None and Book.objects.filter(pk=book_id).exists():
+        state = empty_relation_state(book_id)
+    return state
+
+
+async def aget_relation_state(user, book_id):
+    state = await relation_state_queryset(user, book_id).afirst()
+    if state is None and await Book.objects.filter(pk=book_id).aexists():
+        state = empty_relation_state(book_id)
+    return state
+
+
+def relation_state_queryset(user, book_id):
+    return UserBookRelation.objects.filter(user=user, book_id=book_id).values('book', *RELATION_FIELDS)
+
+
+def empty_relation_state(book_id):
+    return {'book': book_id, **dict(zip(RELATION_FIELDS, EMPTY_RELATION_STATE))}
+
+
+# Средний рейтинг в том виде, в котором он хранится в Book.rating
+def calculate_rating(rating_sum, rating_count):
+    if not rating_count:
+        return None
+    return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+# Добавляем к книгам состояние релейшена текущего пользователя
+# одним LEFT JOIN, без отдельного запроса на каждую книгу
+def annotate_user_relation(queryset, user):
+    if not user or not user.is_authenticated:
+        return queryset
+    return queryset.annotate(
+        user_relation=FilteredRelation('userbookrelation',
+                                       condition=Q(userbookrelation__user=user)),
+        user_like=F('user_relation__like'),
+        user_in_bookmarks=F('user_relation__in_bookmarks'),
+        user_rate=F('user_relation__rate'),
+    )
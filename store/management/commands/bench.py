@@ -0,0 +1,94 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from store.benchmark import BenchmarkRunner, Rollback, build_scenarios, seed_dataset
+
+SCENARIOS = ('list', 'list_anonymous', 'list_filter', 'list_search', 'list_ordering',
+             'detail', 'create', 'relation')
+
+
+# Воспроизводимый бенчмарк API: синтетические данные по seed, прогон сценариев
+# через тестовый клиент, перцентили задержки, запросы к базе и пик памяти.
+# Все создается в транзакции и откатывается, JSON удобно сравнивать между коммитами.
+class Command(BaseCommand):
+    help = 'Seeds a deterministic dataset and benchmarks the books API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--relations', type=int, default=5000)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf exponent of book popularity, 0 is uniform')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Untimed requests per scenario before the measured run')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help='Scenario to run, may be repeated; all by default')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the response cache between requests')
+        parser.add_argument('--memory-samples', type=int, default=10,
+                            help='Requests per scenario replayed under tracemalloc')
+        parser.add_argument('--host', help='Host header of the requests, '
+                                           'defaults to the first of ALLOWED_HOSTS or localhost')
+        parser.add_argument('--output', help='Write JSON results to this file, "-" for stdout')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        # JSON в stdout - тогда таблицу пишем в stderr
+        self.log = self.stderr if options['output'] == '-' else self.stdout
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        params = {name: options[name] for name in ('users', 'books', 'relations', 'skew', 'seed',
+                                                    'requests', 'warmup', 'warm_cache')}
+        result = {
+            'params': params,
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'scenarios': {},
+        }
+        try:
+            with transaction.atomic():
+                user_ids, book_ids = seed_dataset(options['users'], options['books'],
+                                                  options['relations'], options['skew'],
+                                                  options['seed'])
+                scenarios = build_scenarios(user_ids, book_ids,
+                                            options['warmup'] + options['requests'],
+                                            options['skew'], options['seed'])
+                runner = BenchmarkRunner(options['host'], options['warm_cache'],
+                                         options['memory_samples'])
+                # Записи идут последними, чтобы чтения шли по исходному набору
+                for name in options['scenarios'] or SCENARIOS:
+                    requests = scenarios[name]
+                    if options['warmup']:
+                        runner.run(requests[:options['warmup']])
+                    result['scenarios'][name] = runner.run(requests[options['warmup']:])
+                    self.report(name, result['scenarios'][name])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['output']:
+            data = json.dumps(result, indent=2, sort_keys=True)
+            if options['output'] == '-':
+                self.stdout.write(data)
+            else:
+                with open(options['output'], 'w', encoding='utf-8') as file:
+                    file.write(data + '\n')
+
+    def report(self, name, stats):
+        if self.verbosity < 1:
+            return
+        self.log.write(
+            f'{name:15} p50 {stats["p50_ms"]:8.2f}ms  p95 {stats["p95_ms"]:8.2f}ms  '
+            f'p99 {stats["p99_ms"]:8.2f}ms  {stats["requests_per_sec"]:8.1f} req/s  '
+            f'{stats["queries_per_request"]:5.1f} queries  {stats["peak_memory_kb"]:8.1f} KiB  '
+            f'{stats["statuses"]}')
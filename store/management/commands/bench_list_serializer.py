@@ -0,0 +1,67 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.benchmark import Rollback
+from store.fast_list import ValuesListSerializer
+from store.logic import annotate_user_relation
+from store.models import Book, UserBookRelation
+from store.serializers import BooksSerializer
+
+
+# Сравнение обычного BooksSerializer и сериализации из values_list() на синтетических данных.
+# Данные создаются в транзакции, которая в конце откатывается.
+class Command(BaseCommand):
+    help = 'Compares BooksSerializer and the values_list() list serializer on synthetic books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Numbers of books to serialize')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per path, the best one is reported')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username='bench_list_serializer')
+                created = 0
+                for size in sorted(options['sizes']):
+                    self.create_books(user, created, size)
+                    created = size
+                    queryset = annotate_user_relation(Book.objects.order_by('id')[:size], user)
+                    self.bench(size, queryset, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_books(self, user, start, stop):
+        books = Book.objects.bulk_create(
+            [Book(name=f'Book {i}', price=i % 1000, author_name=f'Author {i % 100}')
+             for i in range(start, stop)], batch_size=5000)
+        if not books or books[0].pk is None:
+            books = Book.objects.order_by('id')[start:stop]
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=user, book=book, like=True, rate=book.id % 5 + 1)
+             for book in books[::10]], batch_size=5000)
+
+    def bench(self, size, queryset, repeat):
+        def serializer():
+            return BooksSerializer(queryset.prefetch_related('readers'), many=True).data
+
+        def fast():
+            fast = ValuesListSerializer(BooksSerializer(), queryset)
+            return fast.to_representation(list(fast.get_rows(queryset)))
+
+        results = {}
+        for name, func in (('BooksSerializer', serializer), ('values_list', fast)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+            results[name] = min(timings)
+            self.stdout.write(f'{size} books, {name}: {results[name]:.3f}s')
+        speedup = results['BooksSerializer'] / max(results['values_list'], 1e-9)
+        self.stdout.write(self.style.SUCCESS(f'{size} books: x{speedup:.1f}'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.similar import TOP_K, build_similar, np, update_similar
+
+
+# Пересчет похожих книг для /book/<id>/similar/. По умолчанию инкрементально
+# по очереди изменений релейшенов, --full пересчитывает все книги.
+# Удобно запускать по расписанию: инкрементально часто, полностью раз в сутки
+class Command(BaseCommand):
+    help = 'Builds the "readers also liked" top-K table from likes and rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild neighbours of all books instead of the changed ones')
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help='Neighbours stored per book')
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1:
+            raise CommandError('--top-k must be positive')
+        if np is None and options['verbosity'] > 0:
+            self.stderr.write('NumPy/SciPy are not installed, using the slower pure Python build')
+        started = time.perf_counter()
+        if options['full']:
+            count = build_similar(options['top_k'])
+        else:
+            count = update_similar(options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt neighbours of {count} books in {time.perf_counter() - started:.2f}s'))
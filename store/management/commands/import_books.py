@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+import os
+import time
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from store.cache import invalidate_books, invalidate_library
+from store.importer import iter_chunks, read_rows, run_pool, validate_chunk
+from store.logic import RELATION_UPSERT_FIELDS, rebuild_counters
+from store.models import Book, UserBookRelation
+from store.similar import track_changes
+
+
+# Массовая загрузка книг или релейшенов из CSV/NDJSON.
+# Разбор идет в пуле процессов, запись - через COPY в Postgres
+# или пачками bulk_create в остальных базах. После релейшенов счетчики
+# и top_score книг пачки пересчитываются, пары попадают в очередь похожих книг,
+# а trending не меняется: его пересчитывает refresh_leaderboards.
+class Command(BaseCommand):
+    help = ('Imports books or user-book relations from a CSV or NDJSON file. '
+            'After importing relations run build_similar and refresh_leaderboards '
+            'to update similar books and trending scores')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file')
+        parser.add_argument('--type', dest='kind', choices=('books', 'relations'), default='books',
+                            help='books: name, price, author_name, owner (username); '
+                                 'relations: user (username), book (id), like, in_bookmarks, rate')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='Input format, guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Parser processes, 0 or 1 parses in the main process')
+        parser.add_argument('--rejects', help='NDJSON file for rejected rows, '
+                                              'defaults to <path>.rejected.ndjson')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File "{path}" does not exist')
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        kind = options['kind']
+        self.verbosity = options['verbosity']
+        self.rejects_path = options['rejects'] or f'{path}.rejected.ndjson'
+        self.rejects_file = None
+        self.usernames = {}
+        self.use_copy = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # copy_expert - psycopg2, copy - psycopg 3
+                self.use_copy = hasattr(cursor.cursor, 'copy_expert') or hasattr(cursor.cursor, 'copy')
+        write = self.write_books if kind == 'books' else self.write_relations
+
+        imported = rejected = 0
+        started = time.monotonic()
+        chunks = iter_chunks(read_rows(path, fmt), options['batch_size'])
+        try:
+            for valid, errors in run_pool(partial(validate_chunk, kind), chunks, options['workers']):
+                written, db_errors = write(valid)
+                errors = sorted(errors + db_errors, key=lambda error: error[0])
+                self.reject(errors)
+                imported += written
+                rejected += len(errors)
+                if self.verbosity > 1:
+                    self.report(imported, rejected, started)
+        finally:
+            if self.rejects_file is not None:
+                self.rejects_file.close()
+
+        invalidate_books()
+        # Владельцы и читатели из файла - все найденные по username пользователи
+        invalidate_library(*self.usernames.values())
+        self.report(imported, rejected, started, style=self.style.SUCCESS)
+        if rejected:
+            self.stdout.write(f'Rejected rows written to {self.rejects_path}')
+
+    def report(self, imported, rejected, started, style=None):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        message = (f'Imported {imported} rows, rejected {rejected} '
+                   f'in {elapsed:.1f}s ({(imported + rejected) / elapsed:.0f} rows/sec)')
+        self.stdout.write(style(message) if style else message)
+
+    def reject(self, errors):
+        if not errors:
+            return
+        if self.rejects_file is None:
+            self.rejects_file = open(self.rejects_path, 'w', encoding='utf-8')
+        for line_num, raw, error in errors:
+            self.rejects_file.write(json.dumps({'line': line_num, 'error': error, 'row': raw},
+                                               ensure_ascii=False) + '\n')
+
+    # id пользователей по username одним запросом на пачку, найденные запоминаем
+    def resolve_users(self, usernames):
+        missing = set(usernames) - set(self.usernames)
+        if missing:
+            self.usernames.update(dict.fromkeys(missing))
+            self.usernames.update(User.objects.filter(username__in=missing)
+                                  .values_list('username', 'id'))
+        return self.usernames
+
+    def write_books(self, valid):
+        users = self.resolve_users(owner for _, _, (_, _, _, owner) in valid if owner)
+        rows, errors = [], []
+        for line_num, raw, (name, price, author_name, owner) in valid:
+            owner_id = users[owner] if owner else None
+            if owner and owner_id is None:
+                errors.append((line_num, raw, f'owner: User "{owner}" does not exist.'))
+                continue
+            rows.append((name, price, author_name, owner_id))
+
+        with transaction.atomic():
+            if self.use_copy:
+                # Счетчики и время изменения заполняем явно: default у полей на стороне Django
+                now = timezone.now()
+                self.copy('store_book', ('name', 'price', 'author_name', 'owner_id', 'likes_count',
+                                         'bookmarks_count', 'rating_sum', 'rating_count', 'updated_at',
+                                         'top_score', 'trending_score'),
+                          (row + (0, 0, 0, 0, now, 0, 0) for row in rows))
+            else:
+                Book.objects.bulk_create(
+                    [Book(name=name, price=price, author_name=author_name, owner_id=owner_id)
+                     for name, price, author_name, owner_id in rows])
+        return len(rows), errors
+
+    def write_relations(self, valid):
+        users = self.resolve_users(user for _, _, (user, *_) in valid)
+        existing = set(Book.objects.filter(id__in={values[1] for _, _, values in valid})
+                       .values_list('id', flat=True))
+        # Повторы (user, book) внутри пачки схлопываем, побеждает последняя строка
+        relations, errors = {}, []
+        for line_num, raw, (user, book_id, like, in_bookmarks, rate) in valid:
+            if users[user] is None:
+                errors.append((line_num, raw, f'user: User "{user}" does not exist.'))
+            elif book_id not in existing:
+                errors.append((line_num, raw, f'book: Invalid pk "{book_id}" - object does not exist.'))
+            else:
+                relations[users[user], book_id] = (like, in_bookmarks, rate)
+        rows = [key + value for key, value in relations.items()]
+
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy_relations(rows)
+            else:
+                UserBookRelation.objects.bulk_create(
+                    [UserBookRelation(user_id=user_id, book_id=book_id, like=like,
+                                      in_bookmarks=in_bookmarks, rate=rate)
+                     for user_id, book_id, like, in_bookmarks, rate in rows],
+                    update_conflicts=True, unique_fields=['user', 'book'],
+                    update_fields=RELATION_UPSERT_FIELDS)
+            # Загрузка идет в обход save(), счетчики книг пачки пересчитываем,
+            # прошлые состояния неизвестны, поэтому в очередь похожих идут все пары
+            rebuild_counters(existing)
+            track_changes([(user_id, book_id) for user_id, book_id, *_ in rows])
+        # Версии книг пачки: от них зависят кэш и ETag детальной книги
+        invalidate_books(*existing)
+        return len(valid) - len(errors), errors
+
+    def copy(self, table, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+        sql = f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy_expert'):
+                cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    # COPY не умеет ON CONFLICT: грузим пачку во временную таблицу и переливаем upsert'ом
+    def copy_relations(self, rows):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS store_relation_import ('
+                           'user_id bigint, book_id bigint, "like" boolean, '
+                           'in_bookmarks boolean, rate smallint) ON COMMIT DELETE ROWS')
+        self.copy('store_relation_import', ('user_id', 'book_id', '"like"', 'in_bookmarks', 'rate'),
+                  rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO store_userbookrelation (user_id, book_id, "like", in_bookmarks, rate, '
+                'created_at, updated_at) '
+                'SELECT user_id, book_id, "like", in_bookmarks, rate, NOW(), NOW() '
+                'FROM store_relation_import '
+                'ON CONFLICT (user_id, book_id) DO UPDATE SET "like" = EXCLUDED."like", '
+                'in_bookmarks = EXCLUDED.in_bookmarks, rate = EXCLUDED.rate, '
+                'updated_at = EXCLUDED.updated_at'
+            )
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from store.benchmark import percentile, seed_dataset, zipf_picker
+from store.models import Book
+
+ENDPOINTS = ('list', 'detail', 'relation')
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+# Синхронные маршруты и их async-версии
+URL_NAMES = {
+    'list': ('book-list', 'async-book-list'),
+    'detail': ('book-detail', 'async-book-detail'),
+    'relation': ('userbookrelation-detail', 'async-userbookrelation-detail'),
+}
+
+
+# Нагрузочный тест чтения: одни и те же запросы с заданной параллельностью
+# через WSGI (пул потоков, синхронные вьюхи), через ASGI на синхронных вьюхах
+# и через ASGI на async-вьюхах. Сервер не нужен, запросы идут в процессе
+# через тестовые клиенты. Данные создаются и удаляются командой,
+# для потоков нужна файловая база, а не SQLite в памяти.
+class Command(BaseCommand):
+    help = 'Compares read throughput of the WSGI and ASGI paths under concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per endpoint and mode')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS, dest='endpoints')
+        parser.add_argument('--mode', action='append', choices=MODES, dest='modes')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--relations', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Replace the books response cache with DummyCache')
+        parser.add_argument('--output', help='Write JSON results to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError('An in-memory SQLite database is not shared between threads')
+        self.concurrency = options['concurrency']
+        with transaction.atomic():
+            user_ids, book_ids = seed_dataset(options['users'], options['books'],
+                                              options['relations'], seed=options['seed'])
+        results = []
+        try:
+            with ExitStack() as stack:
+                # Тестовые клиенты ходят с Host: testserver, как в тестах Django
+                stack.enter_context(override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS,
+                                                                     'testserver']))
+                if options['no_cache']:
+                    caches = {**settings.CACHES,
+                              'books': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+                    stack.enter_context(override_settings(CACHES=caches))
+                self.users = list(User.objects.filter(pk__in=user_ids))
+                rng = random.Random(options['seed'])
+                for endpoint in options['endpoints'] or ENDPOINTS:
+                    requests = self.build_requests(endpoint, rng, book_ids, options['requests'])
+                    for mode in options['modes'] or MODES:
+                        urls = [async_url if mode == 'asgi' else sync_url
+                                for async_url, sync_url in requests]
+                        run = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+                        stats = self.summarize(run(urls, login=endpoint == 'relation'))
+                        stats.update(endpoint=endpoint, mode=mode, concurrency=self.concurrency)
+                        results.append(stats)
+                        self.report(stats)
+        finally:
+            Book.objects.filter(pk__in=book_ids).delete()
+            User.objects.filter(pk__in=user_ids).delete()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+
+    # Пары (async url, sync url) для одного и того же запроса
+    def build_requests(self, endpoint, rng, book_ids, count):
+        pick_book = zipf_picker(rng, book_ids, 1.0)
+        sync_name, async_name = URL_NAMES[endpoint]
+        requests = []
+        for _ in range(count):
+            if endpoint == 'list':
+                query = f'?page_size=20&ordering={rng.choice(("price", "-price", "author_name"))}'
+                requests.append((reverse(async_name) + query, reverse(sync_name) + query))
+            else:
+                book_id = pick_book()
+                requests.append((reverse(async_name, args=(book_id,)),
+                                 reverse(sync_name, args=(book_id,))))
+        return requests
+
+    # WSGI: каждый поток со своим клиентом и соединением с базой
+    def run_wsgi(self, urls, login):
+        pending = queue.Queue()
+        for url in urls:
+            pending.put(url)
+        timings, statuses = [], []
+
+        def worker(index):
+            client = Client()
+            if login:
+                client.force_login(self.users[index % len(self.users)])
+            try:
+                while True:
+                    try:
+                        url = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, statuses, time.perf_counter() - started
+
+    # ASGI: все клиенты в одном цикле событий, синхронные вьюхи Django
+    # выполняет в одном потоке через sync_to_async
+    def run_asgi(self, urls, login):
+        async def run():
+            pending = asyncio.Queue()
+            for url in urls:
+                pending.put_nowait(url)
+            timings, statuses = [], []
+            clients = [AsyncClient() for _ in range(self.concurrency)]
+            if login:
+                for index, client in enumerate(clients):
+                    await client.aforce_login(self.users[index % len(self.users)])
+
+            async def worker(client):
+                while not pending.empty():
+                    url = pending.get_nowait()
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    statuses.append(response.status_code)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for client in clients))
+            return timings, statuses, time.perf_counter() - started
+
+        return asyncio.run(run())
+
+    def summarize(self, result):
+        timings, statuses, elapsed = result
+        return {
+            'requests': len(timings),
+            'requests_per_sec': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'errors': sum(status >= 400 for status in statuses),
+        }
+
+    def report(self, stats):
+        self.stdout.write(
+            f'{stats["endpoint"]:9} {stats["mode"]:10} {stats["requests_per_sec"]:8.1f} req/s  '
+            f'p50 {stats["p50_ms"]:8.2f}ms  p95 {stats["p95_ms"]:8.2f}ms  '
+            f'p99 {stats["p99_ms"]:8.2f}ms  errors {stats["errors"]}')
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from store.cache import invalidate_books
+from store.logic import calculate_rating, rebuild_counters
+from store.models import Book
+
+COUNTER_FIELDS = ('likes_count', 'bookmarks_count', 'rating_sum', 'rating_count', 'rating')
+
+
+# Пересчет денормализованных счетчиков книг по таблице UserBookRelation
+class Command(BaseCommand):
+    help = 'Rebuilds Book like/bookmark/rating counters and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of books aggregated and updated per query')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, fail if any is found')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        check = options['check']
+        checked = drifted = 0
+        last_id = 0
+        # Идем по книгам пачками по id, на каждую пачку один групповой запрос
+        while True:
+            books = list(
+                Book.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', *COUNTER_FIELDS)
+                .annotate(
+                    actual_likes=Count('userbookrelation', filter=Q(userbookrelation__like=True)),
+                    actual_bookmarks=Count('userbookrelation', filter=Q(userbookrelation__in_bookmarks=True)),
+                    actual_rating_sum=Sum('userbookrelation__rate', default=0),
+                    actual_rating_count=Count('userbookrelation__rate'),
+                )[:batch_size]
+            )
+            if not books:
+                break
+            last_id = books[-1].id
+            checked += len(books)
+
+            changed_ids = []
+            for book in books:
+                actual = {
+                    'likes_count': book.actual_likes,
+                    'bookmarks_count': book.actual_bookmarks,
+                    'rating_sum': book.actual_rating_sum,
+                    'rating_count': book.actual_rating_count,
+                    'rating': calculate_rating(book.actual_rating_sum, book.actual_rating_count),
+                }
+                drift = {field: (getattr(book, field), value)
+                         for field, value in actual.items() if getattr(book, field) != value}
+                if not drift:
+                    continue
+                drifted += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Book {book.id}: ' + ', '.join(
+                        f'{field} {stored} -> {value}' for field, (stored, value) in drift.items()))
+                changed_ids.append(book.id)
+
+            # Пересчет двигает updated_at и top_score, а сброс версий - кэш и ETag книг
+            if changed_ids and not check:
+                with transaction.atomic():
+                    rebuild_counters(changed_ids)
+                invalidate_books(*changed_ids)
+
+        message = f'Checked {checked} books, {drifted} with drifted counters'
+        if check and drifted:
+            raise CommandError(message)
+        if not check and drifted:
+            message += ', rebuilt'
+        self.stdout.write(self.style.SUCCESS(message))
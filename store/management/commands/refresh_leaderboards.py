@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from store.leaderboards import get_setting, top_score_update, trending_contribution
+from store.models import Book, LeaderboardState, UserBookRelation
+
+BATCH_SIZE = 1000
+
+
+# Полный пересчет рейтингов: средняя оценка каталога для байесовского среднего,
+# top_score всех книг одним UPDATE и trending по времени изменения релейшенов.
+# Между запусками очки двигаются инкрементально при записи релейшенов,
+# запуск по расписанию обновляет среднюю оценку и убирает накопленную погрешность.
+# Эпоха trending переносится на момент пересчета, и очки считаются в ее масштабе,
+# поэтому множитель затухания не растет без предела. Запускать стоит хотя бы раз
+# в несколько десятков периодов полураспада (TRENDING_HALF_LIFE_HOURS)
+class Command(BaseCommand):
+    help = 'Recomputes top-rated and trending scores of all books'
+
+    def handle(self, *args, **options):
+        totals = Book.objects.aggregate(rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count'))
+        with transaction.atomic():
+            state = LeaderboardState.objects.select_for_update().first() or LeaderboardState()
+            if totals['rating_count']:
+                state.rating_mean = totals['rating_sum'] / totals['rating_count']
+            elif state.rating_mean is None:
+                state.rating_mean = get_setting('DEFAULT_RATING_MEAN')
+            state.refreshed_at = timezone.now()
+            state.trending_epoch = state.refreshed_at
+            state.save()
+            Book.objects.update(top_score=top_score_update())
+
+            # Вклад в trending есть только у релейшенов с лайком или высокой оценкой,
+            # в памяти держим только очки книг
+            scores = defaultdict(float)
+            relations = (UserBookRelation.objects.filter(Q(like=True) | Q(rate__gte=4))
+                         .values_list('book_id', 'like', 'rate', 'updated_at'))
+            for book_id, like, rate, updated_at in relations.iterator(chunk_size=BATCH_SIZE * 10):
+                scores[book_id] += trending_contribution((like, False, rate), updated_at,
+                                                          state.trending_epoch)
+            Book.objects.exclude(trending_score=0).update(trending_score=0)
+            books = [Book(id=book_id, trending_score=score) for book_id, score in scores.items() if score]
+            Book.objects.bulk_update(books, ['trending_score'], batch_size=BATCH_SIZE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rating mean {state.rating_mean:.3f}, {len(books)} books trending'))
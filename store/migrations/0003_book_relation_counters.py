@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:00
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+# Заполняем счетчики для уже существующих релейшенов одним UPDATE
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    def aggregate(expression):
+        relations = (UserBookRelation.objects.filter(book=OuterRef('pk'))
+                     .values('book').annotate(value=expression).values('value'))
+        return Coalesce(Subquery(relations), 0)
+
+    Book.objects.update(
+        likes_count=aggregate(Count('id', filter=Q(like=True))),
+        bookmarks_count=aggregate(Count('id', filter=Q(in_bookmarks=True))),
+        rating_sum=aggregate(Sum('rate')),
+        rating_count=aggregate(Count('rate')),
+    )
+    Book.objects.update(rating=Case(
+        When(rating_count=0, then=Value(None)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=None, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
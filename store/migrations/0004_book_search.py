@@ -0,0 +1,125 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    '''
+    CREATE FUNCTION store_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            to_tsvector('simple', coalesce(NEW.name, '')) ||
+            to_tsvector('simple', coalesce(NEW.author_name, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE TRIGGER store_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, author_name ON store_book
+    FOR EACH ROW EXECUTE FUNCTION store_book_search_vector_update()
+    ''',
+    # Заполняем вектор для уже существующих книг
+    'UPDATE store_book SET name = name',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP TRIGGER IF EXISTS store_book_search_vector_trigger ON store_book',
+    'DROP FUNCTION IF EXISTS store_book_search_vector_update()',
+]
+
+SQLITE_FORWARD = [
+    '''
+    CREATE VIRTUAL TABLE store_book_fts USING fts5(
+        name, author_name, content='store_book', content_rowid='id'
+    )
+    ''',
+    '''
+    CREATE TRIGGER store_book_fts_insert AFTER INSERT ON store_book BEGIN
+        INSERT INTO store_book_fts(rowid, name, author_name)
+        VALUES (new.id, new.name, new.author_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER store_book_fts_delete AFTER DELETE ON store_book BEGIN
+        INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name)
+        VALUES ('delete', old.id, old.name, old.author_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN
+        INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name)
+        VALUES ('delete', old.id, old.name, old.author_name);
+        INSERT INTO store_book_fts(rowid, name, author_name)
+        VALUES (new.id, new.name, new.author_name);
+    END
+    ''',
+    "INSERT INTO store_book_fts(store_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS store_book_fts_insert',
+    'DROP TRIGGER IF EXISTS store_book_fts_delete',
+    'DROP TRIGGER IF EXISTS store_book_fts_update',
+    'DROP TABLE IF EXISTS store_book_fts',
+]
+
+
+def run_statements(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+# Поисковые структуры зависят от базы: триггер для tsvector в Postgres,
+# внешняя FTS5 таблица в SQLite (если FTS5 собран)
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            options = {row[0] for row in cursor.fetchall()}
+        if 'ENABLE_FTS5' in options:
+            run_statements(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRES_BACKWARD)
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_book_relation_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='book_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['author_name'], name='book_author_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+# Склеиваем дубли релейшенов (user, book) перед добавлением уникальности:
+# лайк и закладка остаются, если были хотя бы в одном дубле,
+# рейт берется из самого свежего дубля, где он проставлен
+def dedupe_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    duplicates = (UserBookRelation.objects.values('user', 'book')
+                  .annotate(count=Count('id')).filter(count__gt=1))
+    book_ids = set()
+    for duplicate in duplicates.iterator():
+        relations = list(UserBookRelation.objects
+                         .filter(user=duplicate['user'], book=duplicate['book'])
+                         .order_by('-id'))
+        kept = relations[0]
+        kept.like = any(relation.like for relation in relations)
+        kept.in_bookmarks = any(relation.in_bookmarks for relation in relations)
+        kept.rate = next((relation.rate for relation in relations if relation.rate is not None), None)
+        kept.save(update_fields=['like', 'in_bookmarks', 'rate'])
+        UserBookRelation.objects.filter(id__in=[relation.id for relation in relations[1:]]).delete()
+        book_ids.add(duplicate['book'])
+
+    if not book_ids:
+        return
+
+    # Счетчики затронутых книг пересчитываем заново
+    def aggregate(expression):
+        relations = (UserBookRelation.objects.filter(book=OuterRef('pk'))
+                     .values('book').annotate(value=expression).values('value'))
+        return Coalesce(Subquery(relations), 0)
+
+    books = Book.objects.filter(id__in=book_ids)
+    books.update(
+        likes_count=aggregate(Count('id', filter=Q(like=True))),
+        bookmarks_count=aggregate(Count('id', filter=Q(in_bookmarks=True))),
+        rating_sum=aggregate(Sum('rate')),
+        rating_count=aggregate(Count('rate')),
+    )
+    books.update(rating=Case(
+        When(rating_count=0, then=Value(None)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_book_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_user_book_relation'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 
 
 # Модель книги
@@ -17,11 +19,56 @@ class Book(models.Model):
     # Задаем разные related names, потому что владелец и читатели ссылаются на юзера
     readers = models.ManyToManyField(User, through='UserBookRelation',
                                      related_name='books')
+    # Денормализованные счетчики по UserBookRelation, обновляются при сохранении релейшена
+    likes_count = models.PositiveIntegerField(default=0)
+    bookmarks_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Кэшированный средний рейтинг, пустой пока книгу никто не оценил
+    rating = models.DecimalField(max_digits=3, decimal_places=2,
+                                 null=True, default=None)
+    # Время последнего изменения книги или ее счетчиков, из него строятся ETag и Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
+    # Поисковый вектор по name и author_name, в Postgres заполняется триггером
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Очки рейтингов (store.leaderboards): байесовское среднее оценок, 0 - оценок нет,
+    # и затухающая во времени активность. Обновляются вместе со счетчиками
+    top_score = models.FloatField(default=0)
+    trending_score = models.FloatField(default=0)
+
+    class Meta:
+        # Составные индексы под keyset-пагинацию: (поле сортировки, id)
+        indexes = [
+            models.Index(fields=['price', 'id'], name='book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='book_author_name_id_idx'),
+            # Страницы рейтингов тоже берутся keyset-пагинацией
+            models.Index(fields=['top_score', 'id'], name='book_top_score_id_idx'),
+            models.Index(fields=['trending_score', 'id'], name='book_trending_score_id_idx'),
+            # Полка "мои книги" библиотеки пользователя по убыванию id
+            models.Index(fields=['owner', 'id'], name='book_owner_id_idx'),
+            # Индексы полнотекстового и триграммного поиска (только Postgres)
+            GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='book_name_trgm_idx'),
+            GinIndex(fields=['author_name'], opclasses=['gin_trgm_ops'], name='book_author_name_trgm_idx'),
+        ]
+
+    # Поля, которые поддерживает сервер: счетчики и очки двигаются UPDATE при записи
+    # релейшенов (store.logic), поисковый вектор - триггером
+    SERVER_FIELDS = ('likes_count', 'bookmarks_count', 'rating_sum', 'rating_count', 'rating',
+                     'top_score', 'trending_score', 'search_vector')
 
     # Настраиваем отображение книг в админке, ID: название.
     def __str__(self):
         return f'Id {self.id}: {self.name}'
 
+    # Изменение книги пишет только свои поля: значения счетчиков, прочитанные
+    # при загрузке, затерли бы лайки и оценки, записанные после нее
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.SERVER_FIELDS]
+        super().save(*args, **kwargs)
+
 
 # Модель лайков
 class UserBookRelation(models.Model):
@@ -41,7 +88,88 @@ class UserBookRelation(models.Model):
     in_bookmarks = models.BooleanField(default=False)
     # Рейтинг может быть пустым, добавляем null=True
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Время последнего изменения, от него считается вклад релейшена в trending
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # У пользователя не больше одного релейшена на книгу, по нему же делаем upsert
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_user_book_relation'),
+        ]
+        # Полки библиотеки пользователя (/me/library/): частичные индексы (user, book)
+        # только по строкам полки, id книг страницы читаются из индекса без таблицы
+        indexes = [
+            models.Index(fields=['user', 'book'], condition=models.Q(like=True),
+                         name='relation_user_liked_idx'),
+            models.Index(fields=['user', 'book'], condition=models.Q(in_bookmarks=True),
+                         name='relation_user_bookmarked_idx'),
+            models.Index(fields=['user', 'book'], condition=models.Q(rate__isnull=False),
+                         name='relation_user_rated_idx'),
+            # Фильтры списка админки (like, in_bookmarks, rate) в ее порядке -pk.
+            # like=False и in_bookmarks=False - большинство строк, им хватает первичного ключа
+            models.Index(fields=['id'], condition=models.Q(like=True),
+                         name='relation_liked_admin_idx'),
+            models.Index(fields=['id'], condition=models.Q(in_bookmarks=True),
+                         name='relation_bookmarked_admin_idx'),
+            models.Index(fields=['rate', 'id'], name='relation_rate_admin_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Запоминаем состояние из базы, чтобы при сохранении посчитать изменение счетчиков книги
+        self.old_state = (self.like, self.in_bookmarks, self.rate)
+        self.old_updated_at = self.updated_at
 
     # Настраиваем отображение рейтов в админке
     def __str__(self):
         return f'{self.user.username}: {self.book.name}, Rate: {self.rate}'
+
+    def save(self, *args, **kwargs):
+        from store.logic import EMPTY_RELATION_STATE, apply_relation_change
+        from store.similar import track_change
+
+        adding = self._state.adding
+        old_state = EMPTY_RELATION_STATE if adding else self.old_state
+        new_state = (self.like, self.in_bookmarks, self.rate)
+        # Релейшен и счетчики книги меняются в одной транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            apply_relation_change(self.book_id, old_state, new_state,
+                                  self.old_updated_at, self.updated_at, readers_changed=adding)
+            track_change(self.user_id, self.book_id, old_state, new_state)
+        self.old_state = new_state
+        self.old_updated_at = self.updated_at
+
+
+# Похожие книги ("с этой книгой также любят"): top-K соседей по совместным
+# лайкам и высоким оценкам. Строится командой build_similar, эндпоинт
+# читает строки одной книги по индексу (book, -score)
+class BookSimilarity(models.Model):
+    # Отдельный индекс по book не нужен, его заменяет составной
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False,
+                             related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', '-score', 'similar'], name='book_similarity_rank_idx'),
+        ]
+
+
+# Очередь изменений релейшенов для инкрементального build_similar.
+# Без внешних ключей: записи переживают удаление пользователя и книги
+class SimilarityChange(models.Model):
+    user_id = models.BigIntegerField()
+    book_id = models.BigIntegerField()
+
+
+# Общие параметры рейтингов, одна строка. Средняя оценка по каталогу нужна
+# байесовскому среднему, эпоха - масштабу trending_score, обе пересчитываются
+# командой refresh_leaderboards
+class LeaderboardState(models.Model):
+    rating_mean = models.FloatField()
+    refreshed_at = models.DateTimeField()
+    # Пусто - очки в масштабе leaderboards.DEFAULT_EPOCH
+    trending_epoch = models.DateTimeField(null=True)
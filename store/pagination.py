@@ -0,0 +1,241 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from store.search import SEARCH_RANK
+
+
+# Keyset-пагинация каталога по паре (поле сортировки, id).
+# Вместо OFFSET продолжаем выборку с последней отданной книги,
+# поэтому глубокая страница стоит столько же, сколько первая.
+class BookCursorPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request, view)])
+
+    def get_page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view, queryset)
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+        # Равные ранги поиска идут по возрастанию id, как и без пагинации
+        self.id_descending = self.descending and self.field != SEARCH_RANK
+        self.value_field = self.get_value_field(queryset)
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor['r'])
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor))
+
+        # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+        return queryset.order_by(*self.get_order_by())[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    # Сортировка берется из того же параметра, что и у OrderingFilter,
+    # учитываем только первое допустимое поле, id всегда добавляется вторым ключом.
+    # Без явной сортировки результаты поиска листаются по релевантности (search_rank, id).
+    # В Postgres поиск без пагинации дополнительно сортирует равные ранги
+    # по триграммной похожести, курсор - сразу по id
+    def get_ordering(self, request, view, queryset):
+        allowed = set(getattr(view, 'ordering_fields', None) or ()) | {'id'}
+        params = request.query_params.get(self.ordering_query_param, '')
+        for term in params.split(','):
+            term = term.strip()
+            if term.lstrip('-') in allowed:
+                return term
+        if SEARCH_RANK in queryset.query.annotations:
+            return f'-{SEARCH_RANK}'
+        return self.default_ordering
+
+    # Поле модели или аннотация, по которой идет сортировка: им приводится значение из курсора
+    def get_value_field(self, queryset):
+        if self.field in queryset.query.annotations:
+            return queryset.query.annotations[self.field].output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def get_order_by(self):
+        # При движении назад инвертируем направление и потом разворачиваем страницу
+        descending = self.descending != self.reverse
+        id_descending = self.id_descending != self.reverse
+        if self.field == 'id':
+            return ['-id' if descending else 'id']
+        return [f'-{self.field}' if descending else self.field, '-id' if id_descending else 'id']
+
+    def get_keyset_filter(self, cursor):
+        lookup = 'lt' if self.descending != cursor['r'] else 'gt'
+        id_lookup = 'lt' if self.id_descending != cursor['r'] else 'gt'
+        if self.field == 'id':
+            return Q(**{f'id__{lookup}': cursor['i']})
+        return (Q(**{f'{self.field}__{lookup}': cursor['v']}) |
+                Q(**{self.field: cursor['v'], f'id__{id_lookup}': cursor['i']}))
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        if self.has_more or self.reverse:
+            return self.encode_cursor(self.page[-1], reverse=False)
+        return None
+
+    def get_previous_link(self):
+        if not self.page:
+            return None
+        if (self.reverse and self.has_more) or (not self.reverse and self.has_cursor):
+            return self.encode_cursor(self.page[0], reverse=True)
+        return None
+
+    # Курсор непрозрачен для клиента: base64 от JSON с позицией и сортировкой
+    def encode_cursor(self, obj, reverse):
+        value = None if self.field == 'id' else str(getattr(obj, self.field))
+        # obj - модель книги или именованный кортеж из values_list()
+        payload = {'o': self.ordering, 'v': value, 'i': obj.id, 'r': int(reverse)}
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if cursor['o'] != self.ordering or not isinstance(cursor['i'], int):
+                raise ValueError
+            cursor['r'] = bool(cursor.get('r'))
+            # Значение поля сортировки приводим к типу поля, испорченное значение - не 500
+            if self.field != 'id':
+                cursor['v'] = self.value_field.to_python(cursor['v'])
+                if cursor['v'] is None:
+                    raise ValueError
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+# Keyset-пагинация рейтингов: сортировку задает вьюха, страница ограничена всегда
+class LeaderboardPagination(BookCursorPagination):
+    max_page_size = 100
+
+    def __init__(self, ordering):
+        self.default_ordering = ordering
+
+    def get_ordering(self, request, view, queryset):
+        return self.default_ordering
+
+
+# Keyset-пагинация полки библиотеки: новые книги первыми, страница ограничена всегда
+class LibraryPagination(BookCursorPagination):
+    default_ordering = '-id'
+    max_page_size = 100
+
+
+# Старый офсетный режим, включается явно через ?limit= / ?offset=
+class BookLimitOffsetPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 1000
+
+    # То же, что paginate_queryset в DRF, на async ORM
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+
+# Пагинация каталога. Без параметров отдаем список целиком, как и раньше;
+# ?cursor= / ?page_size= включают keyset-режим, ?limit= / ?offset= — офсетный.
+class BookPagination(BasePagination):
+    cursor_pagination_class = BookCursorPagination
+    offset_pagination_class = BookLimitOffsetPagination
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, request):
+        params = request.query_params
+        offset_class = self.offset_pagination_class
+        if offset_class.limit_query_param in params or offset_class.offset_query_param in params:
+            return offset_class()
+        cursor_class = self.cursor_pagination_class
+        if cursor_class.cursor_query_param in params or cursor_class.page_size_query_param in params:
+            return cursor_class()
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        if self.paginator is None:
+            return None
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.cursor_pagination_class().get_paginated_response_schema(schema)
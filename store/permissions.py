@@ -4,14 +4,15 @@ from rest_framework.permissions import BasePermission, SAFE_METHODS
 class IsOwnerOrStaffOrReadOnly(BasePermission):
     # Проверяем разрешение на действия над объектом.
     # Удостоверимся, что запрос пришел от пришел от аутентифицированного владельца книги
-    # или от авторизованного персонала компании
+    # или от авторизованного персонала компании.
+    # Владельца сравниваем по owner_id, чтобы не загружать его отдельным запросом
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
             request.user and
             request.user.is_authenticated and
             (
-                    obj.owner == request.user or
+                    obj.owner_id == request.user.pk or
                     request.user.is_staff
             )
         )
@@ -0,0 +1,39 @@
+from django.db import connections
+
+# Статистика пулов соединений (psycopg_pool) по алиасам баз.
+# Счетчики накопительные с момента старта процесса.
+
+
+def format_pool_stats(raw):
+    size = raw.get('pool_size', 0)
+    available = raw.get('pool_available', 0)
+    queued = raw.get('requests_queued', 0)
+    wait_ms = raw.get('requests_wait_ms', 0)
+    return {
+        'min_size': raw.get('pool_min'),
+        'max_size': raw.get('pool_max'),
+        'size': size,
+        'in_use': size - available,
+        'idle': available,
+        'waiting': raw.get('requests_waiting', 0),
+        'requests': raw.get('requests_num', 0),
+        # Время ожидания копится только по запросам, которым не хватило свободного соединения
+        'queued': queued,
+        'wait_ms_total': wait_ms,
+        'wait_ms_avg': round(wait_ms / queued, 2) if queued else 0,
+        'timeouts': raw.get('requests_errors', 0),
+        'connections_opened': raw.get('connections_num', 0),
+        'connection_errors': raw.get('connections_errors', 0),
+        'connections_lost': raw.get('connections_lost', 0),
+        'returns_bad': raw.get('returns_bad', 0),
+    }
+
+
+def get_pool_stats():
+    stats = {}
+    for alias in connections:
+        # У бэкендов без пула (SQLite, psycopg2) атрибута нет или он None
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = format_pool_stats(pool.get_stats())
+    return stats
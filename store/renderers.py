@@ -0,0 +1,95 @@
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from store.fast_list import Table
+
+# Компактные форматы ответов для больших списков книг (выбираются по Accept или ?format=).
+# Список отдается колонками: {"id": [...], "name": [...], ...} вместо массива объектов,
+# так ключи не повторяются в каждой строке. Быстрый list (FastListMixin) для этих
+# рендереров сразу строит таблицу из кортежей values_list(), остальные ответы
+# со списком словарей переворачиваются в колонки при рендере.
+#
+# columnar - тот же JSON, msgpack - двоичный MessagePack (пакет msgpack).
+# Парсеры принимают колоночное тело в пакетных эндпоинтах: объект, у которого
+# все значения - массивы одной длины, разворачивается в список строк.
+
+COLUMNAR_JSON_MEDIA_TYPE = 'application/vnd.books.columnar+json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+# Ответ в колоночном виде: таблица или список словарей -> колонки,
+# у страницы пагинации переворачиваются results
+def to_columnar(data):
+    if isinstance(data, Table):
+        return data.columns()
+    if isinstance(data, dict) and isinstance(data.get('results'), (list, Table)):
+        return {**data, 'results': to_columnar(data['results'])}
+    if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+        fields = list(data[0])
+        for item in data[1:]:
+            fields.extend(name for name in item if name not in fields)
+        return {name: [item.get(name) for item in data] for name in fields}
+    return data
+
+
+# Колоночное тело запроса -> список строк. Остальные тела не меняются
+def from_columnar(data):
+    if not isinstance(data, dict) or not data:
+        return data
+    if not all(isinstance(column, list) for column in data.values()):
+        return data
+    lengths = {len(column) for column in data.values()}
+    if len(lengths) != 1:
+        raise ParseError('Columnar body columns must have the same length.')
+    return [dict(zip(data, values)) for values in zip(*data.values())]
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = COLUMNAR_JSON_MEDIA_TYPE
+    format = 'columnar'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class ColumnarJSONParser(JSONParser):
+    media_type = COLUMNAR_JSON_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return from_columnar(super().parse(stream, media_type, parser_context))
+
+
+# Типы, которых нет в MessagePack (Decimal, datetime, UUID...), приводим так же, как JSON
+def msgpack_default(obj):
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(to_columnar(data), default=msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data = msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        # ExtraData, FormatError и StackError (слишком глубокая вложенность) наследуют
+        # ValueError, TypeError - ключ словаря, который нельзя захешировать.
+        # RecursionError - на случай чистого Python варианта пакета без C-расширения
+        except (ValueError, TypeError, msgpack.UnpackException, RecursionError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+        return from_columnar(data)
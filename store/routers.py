@@ -0,0 +1,161 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Чтение с реплик. Безопасные запросы вьюх с ReplicaReadMixin читают с одной
+# из реплик (по весам), записи и все остальное идут в default. После записи
+# пользователь какое-то время читает из default, чтобы видеть свои изменения
+# несмотря на отставание реплики.
+
+DEFAULTS = {
+    # Алиас из DATABASES -> вес. Пусто - реплик нет, все идет в default
+    'REPLICAS': {},
+    # Сколько секунд после записи пользователь читает из default.
+    # Должно быть не меньше обычного отставания реплик
+    'STICKY_SECONDS': 5,
+    # Сколько секунд не пробовать реплику, к которой не удалось подключиться
+    'RETRY_SECONDS': 30,
+}
+PINNED_KEY = 'store:primary:{}'
+
+# Алиас для чтения в текущем запросе, None - default
+read_alias = ContextVar('store_read_alias', default=None)
+
+# Недоступные реплики: алиас -> время (monotonic), до которого их не пробуем
+unavailable = {}
+# Время (monotonic) последней успешной проверки реплики
+checked = {}
+
+
+def get_setting(name):
+    return getattr(settings, 'STORE_REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+# Подключение проверяется при выборе реплики: открытое соединение
+# переиспользуется, упавшая реплика отваливается на подключении
+def is_available(alias):
+    if unavailable.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        unavailable[alias] = time.monotonic() + get_setting('RETRY_SECONDS')
+        return False
+    checked[alias] = time.monotonic()
+    return True
+
+
+# В async-вьюхах подключение проверяется в потоке, поэтому не на каждый запрос:
+# реплика, проверенная меньше RETRY_SECONDS назад, считается доступной
+async def ais_available(alias):
+    now = time.monotonic()
+    if unavailable.get(alias, 0) > now:
+        return False
+    if now - checked.get(alias, -float('inf')) < get_setting('RETRY_SECONDS'):
+        return True
+    return await sync_to_async(is_available)(alias)
+
+
+# Реплики в порядке выбора по весам
+def iter_replicas():
+    replicas = {alias: weight for alias, weight in get_setting('REPLICAS').items() if weight > 0}
+    while replicas:
+        alias = random.choices(list(replicas), weights=list(replicas.values()))[0]
+        yield alias
+        del replicas[alias]
+
+
+# Реплика по весам среди доступных, None - если доступных нет
+def choose_replica():
+    return next((alias for alias in iter_replicas() if is_available(alias)), None)
+
+
+async def achoose_replica():
+    for alias in iter_replicas():
+        if await ais_available(alias):
+            return alias
+    return None
+
+
+# Закрепление лежит в кэше default: при нескольких воркерах он должен быть общим,
+# иначе другой процесс отправит чтение на реплику (проверяет store.cache.check_shared_caches)
+def pin_to_primary(user):
+    cache.set(PINNED_KEY.format(user.pk), True, get_setting('STICKY_SECONDS'))
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(PINNED_KEY.format(user.pk), False)
+
+
+async def ais_pinned(user):
+    return user.is_authenticated and await cache.aget(PINNED_KEY.format(user.pk), False)
+
+
+def get_read_alias(user):
+    if not get_setting('REPLICAS') or is_pinned(user):
+        return None
+    return choose_replica()
+
+
+async def aget_read_alias(user):
+    if not get_setting('REPLICAS') or await ais_pinned(user):
+        return None
+    return await achoose_replica()
+
+
+# Сразу после изменения каталога реплика может отдать старые данные
+def may_be_stale(modified):
+    if read_alias.get() is None or modified is None:
+        return False
+    return time.time() - modified < get_setting('STICKY_SECONDS')
+
+
+# Подключается в DATABASE_ROUTERS. Вне запросов с ReplicaReadMixin и внутри
+# транзакций все читается из default. Записи всегда идут в default, даже для
+# объектов, прочитанных с реплики
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # На репликах те же данные, что в default
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_setting('REPLICAS')}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+# Выбор базы для чтения во вьюхах DRF. Реплика выбирается после аутентификации,
+# пользователь и сессия читаются из default. Успешная запись закрепляет
+# пользователя за default на STICKY_SECONDS
+class ReplicaReadMixin:
+    def dispatch(self, request, *args, **kwargs):
+        token = read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            read_alias.set(get_read_alias(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            pin_to_primary(request.user)
+        return response
@@ -0,0 +1,175 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from rest_framework.filters import SearchFilter
+
+# Из поискового терма оставляем только буквы и цифры
+TERM_RE = re.compile(r'\w+')
+# Аннотация релевантности движков поиска, по ней же листает курсор (store.pagination)
+SEARCH_RANK = 'search_rank'
+
+
+def split_terms(terms):
+    words = []
+    for term in terms:
+        words.extend(TERM_RE.findall(term))
+    return words
+
+
+# Полнотекстовый поиск в Postgres: колонка search_vector поддерживается триггером,
+# по ней GIN индекс, опечатки ловим триграммами по name/author_name
+class PostgresSearchBackend:
+    config = 'simple'
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+        words = split_terms(terms)
+        if not words:
+            return queryset
+        # Каждое слово ищем по префиксу, все слова должны найтись
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words),
+                            search_type='raw', config=self.config)
+        phrase = ' '.join(words)
+        similarity = Greatest(TrigramSimilarity('name', phrase),
+                              TrigramSimilarity('author_name', phrase))
+        return (queryset
+                .annotate(search_rank=SearchRank(F('search_vector'), query),
+                          search_similarity=similarity)
+                # Оператор % для триграмм использует GIN индексы по name/author_name
+                .filter(Q(search_vector=query) |
+                        Q(name__trigram_similar=phrase) |
+                        Q(author_name__trigram_similar=phrase))
+                .order_by(F('search_rank').desc(), F('search_similarity').desc(), 'id'))
+
+
+# Переносимый вариант для локальных и тестовых запусков: SQLite FTS5
+# и внешняя таблица store_book_fts, которую заполняют триггеры из миграции
+class SqliteSearchBackend:
+    table = 'store_book_fts'
+
+    @staticmethod
+    def quote(word):
+        return '"' + word.replace('"', '""') + '"*'
+
+    def search(self, queryset, terms):
+        words = split_terms(terms)
+        if not words:
+            return queryset
+        match = ' '.join(self.quote(word) for word in words)
+        table = queryset.model._meta.db_table
+        # bm25 меньше у более релевантных документов, поэтому берем со знаком минус
+        rank = RawSQL(
+            f'SELECT -bm25({self.table}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND {self.table}.rowid = "{table}"."id"',
+            (match,), output_field=FloatField(),
+        )
+        matched = RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', (match,))
+        return (queryset
+                .filter(id__in=matched)
+                .annotate(search_rank=rank)
+                .order_by(F('search_rank').desc(), 'id'))
+
+
+# SearchFilter, который отдает поиск движку под текущую базу.
+# Для баз без своего движка остается стандартный поиск через icontains.
+class BookSearchFilter(SearchFilter):
+    search_backends = {
+        'postgresql': PostgresSearchBackend,
+        'sqlite': SqliteSearchBackend,
+    }
+
+    def get_search_backend(self, queryset):
+        vendor = connections[queryset.db].vendor
+        backend_class = self.search_backends.get(vendor)
+        if backend_class is None:
+            return None
+        if vendor == 'sqlite' and not has_sqlite_fts(queryset.db):
+            return None
+        return backend_class()
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        backend = self.get_search_backend(queryset)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        return backend.search(queryset, search_terms)
+
+
+# Триггеры синхронизации store_book_fts (те же, что создает миграция 0004)
+SQLITE_FTS_TRIGGERS = {
+    'store_book_fts_insert': '''
+        CREATE TRIGGER store_book_fts_insert AFTER INSERT ON store_book BEGIN
+            INSERT INTO store_book_fts(rowid, name, author_name)
+            VALUES (new.id, new.name, new.author_name);
+        END
+    ''',
+    'store_book_fts_delete': '''
+        CREATE TRIGGER store_book_fts_delete AFTER DELETE ON store_book BEGIN
+            INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name)
+            VALUES ('delete', old.id, old.name, old.author_name);
+        END
+    ''',
+    'store_book_fts_update': '''
+        CREATE TRIGGER store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN
+            INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name)
+            VALUES ('delete', old.id, old.name, old.author_name);
+            INSERT INTO store_book_fts(rowid, name, author_name)
+            VALUES (new.id, new.name, new.author_name);
+        END
+    ''',
+}
+
+
+# SQLite меняет схему пересозданием таблицы, и триггеры store_book пропадают.
+# После миграций возвращаем недостающие триггеры и перестраиваем индекс.
+def ensure_sqlite_fts_triggers(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    # Миграции могли создать или удалить таблицу, проверяем заново
+    sqlite_fts_available.pop(get_fts_key(using), None)
+    if not has_sqlite_fts(using):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'store_book'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [sql for name, sql in SQLITE_FTS_TRIGGERS.items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            cursor.execute("INSERT INTO store_book_fts(store_book_fts) VALUES ('rebuild')")
+
+
+# FTS5 может быть не собран в SQLite, тогда миграция не создает таблицу.
+# Результат проверки запоминаем на процесс по базе: соединения у каждого потока свои,
+# а async-вьюхи не могут сами сходить в базу синхронно
+sqlite_fts_available = {}
+
+
+def get_fts_key(using):
+    return using, connections[using].settings_dict['NAME']
+
+
+def has_sqlite_fts(using):
+    key = get_fts_key(using)
+    if key not in sqlite_fts_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                           [SqliteSearchBackend.table])
+            sqlite_fts_available[key] = cursor.fetchone() is not None
+    return sqlite_fts_available[key]
+
+
+# Для async-вьюх: проверяем один раз в потоке, дальше значение берется из словаря
+async def ahas_sqlite_fts(using):
+    key = get_fts_key(using)
+    if key not in sqlite_fts_available:
+        await sync_to_async(has_sqlite_fts)(using)
+    return sqlite_fts_available[key]
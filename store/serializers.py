@@ -1,17 +1,50 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import (BooleanField, CharField, DecimalField, FloatField,
+                                        IntegerField, ModelSerializer, Serializer)
 
 from store.models import Book, UserBookRelation
+from store.sparse import SparseSerializerMixin
+from store.timing import TimingListSerializer, TimingSerializerMixin
 
 
-# API для книг
-class BooksSerializer(ModelSerializer):
+# API для книг. fields - набор полей в выдаче (?fields= / ?exclude=), None - все
+class BooksSerializer(TimingSerializerMixin, SparseSerializerMixin, ModelSerializer):
+    # Состояние релейшена запрашивающего пользователя, приходит аннотацией из вьюхи.
+    # Для анонимов и книг без релейшена - null
+    like = BooleanField(source='user_like', read_only=True, allow_null=True)
+    in_bookmarks = BooleanField(source='user_in_bookmarks', read_only=True, allow_null=True)
+    rate = IntegerField(source='user_rate', read_only=True, allow_null=True)
+
     class Meta:
         model = Book
-        fields = '__all__'
+        # Служебный поисковый вектор и очки рейтингов наружу не отдаем
+        exclude = ('search_vector', 'top_score', 'trending_score')
+        # Счетчики поддерживаются сервером при изменении релейшенов
+        read_only_fields = ('likes_count', 'bookmarks_count',
+                            'rating_sum', 'rating_count', 'rating')
+        list_serializer_class = TimingListSerializer
 
 
 # API для системы рейтов
-class UserBookRelationSerializer(ModelSerializer):
+class UserBookRelationSerializer(TimingSerializerMixin, ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+# Элемент пакетного обновления релейшенов. Книгу принимаем как id,
+# существование всех книг пакета проверяется во вьюхе одним запросом
+class UserBookRelationBulkSerializer(ModelSerializer):
+    book = IntegerField()
+
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+# Похожая книга, строка BookSimilarity из values() с полями книги-соседа
+class SimilarBookSerializer(Serializer):
+    id = IntegerField(source='similar_id')
+    name = CharField(source='similar__name')
+    author_name = CharField(source='similar__author_name')
+    price = DecimalField(source='similar__price', max_digits=7, decimal_places=2)
+    score = FloatField()
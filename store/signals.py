@@ -0,0 +1,60 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from store.cache import invalidate_books, invalidate_library
+from store.logic import EMPTY_RELATION_STATE, apply_relation_change
+from store.models import Book, UserBookRelation
+from store.search import ensure_sqlite_fts_triggers
+from store.similar import track_change
+from store.timing import install_query_timer
+
+
+# Релейшены удаляются каскадом вместе с книгой
+def is_book_deletion(origin):
+    return isinstance(origin, Book) or getattr(origin, 'model', None) is Book
+
+
+# Удаление релейшена вычитает его вклад из счетчиков книги.
+# При удалении самой книги счетчики не трогаем: иначе UPDATE на каждый релейшен
+@receiver(post_delete, sender=UserBookRelation)
+def relation_deleted(sender, instance, origin=None, **kwargs):
+    if is_book_deletion(origin):
+        return
+    apply_relation_change(instance.book_id, instance.old_state, EMPTY_RELATION_STATE,
+                          instance.old_updated_at, readers_changed=True)
+    track_change(instance.user_id, instance.book_id, instance.old_state, EMPTY_RELATION_STATE)
+
+
+# Любое изменение книги или релейшена (счетчики, состояние пользователя)
+# делает устаревшими закэшированные ответы по каталогу и по этой книге,
+# а также сводку полок владельца или читателя
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    invalidate_books(instance.pk)
+    invalidate_library(instance.owner_id)
+
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def relation_changed(sender, instance, origin=None, **kwargs):
+    # Полки читателя меняются и при удалении книги
+    invalidate_library(instance.user_id)
+    # Кэш удаляемой книги сбросит ее собственный сигнал
+    if is_book_deletion(origin):
+        return
+    invalidate_books(instance.book_id)
+
+
+# Пересоздание таблицы книг в SQLite удаляет FTS триггеры, возвращаем их после миграций
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'store':
+        ensure_sqlite_fts_triggers(using)
+
+
+# Замер числа запросов и времени в базе для Server-Timing
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_query_timer(connection)
@@ -0,0 +1,186 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from store.models import BookSimilarity, SimilarityChange, UserBookRelation
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    # Без NumPy/SciPy соседи считаются на словарях, заметно медленнее
+    np = sparse = None
+
+# Похожие книги по совместным лайкам и оценкам. Вектор книги - веса
+# пользователей, похожесть - косинус между векторами, для каждой книги
+# хранится TOP_K соседей в BookSimilarity.
+
+TOP_K = 20
+BATCH_SIZE = 1000
+
+
+# Вес релейшена: лайк дает 1, оценка 5 добавляет 1, 4 - 0.5, 1-2 отнимают
+def interaction_weight(like, rate):
+    weight = float(bool(like))
+    if rate is not None:
+        weight += (rate - 3) / 2
+    return max(weight, 0.0)
+
+
+def state_weight(state):
+    like, in_bookmarks, rate = state
+    return interaction_weight(like, rate)
+
+
+# Изменения, которые меняют вес, попадают в очередь инкрементального пересчета
+def track_change(user_id, book_id, old_state, new_state):
+    if state_weight(old_state) != state_weight(new_state):
+        track_changes([(user_id, book_id)])
+
+
+# pairs - пары (user_id, book_id)
+def track_changes(pairs):
+    SimilarityChange.objects.bulk_create(
+        [SimilarityChange(user_id=user_id, book_id=book_id) for user_id, book_id in pairs])
+
+
+# (user_id, book_id, weight) для релейшенов с положительным весом
+def load_interactions(**filters):
+    relations = (UserBookRelation.objects.filter(Q(like=True) | Q(rate__gte=4), **filters)
+                 .values_list('user_id', 'book_id', 'like', 'rate'))
+    for user_id, book_id, like, rate in relations.iterator(chunk_size=BATCH_SIZE * 10):
+        weight = interaction_weight(like, rate)
+        if weight:
+            yield user_id, book_id, weight
+
+
+def get_norms(interactions):
+    squares = defaultdict(float)
+    for _, book_id, weight in interactions:
+        squares[book_id] += weight * weight
+    return {book_id: math.sqrt(value) for book_id, value in squares.items()}
+
+
+# Соседи книг book_ids: {book_id: [(similar_id, score), ...]} по убыванию score.
+# В interactions должны быть все релейшены пользователей этих книг,
+# norms - нормы векторов по всем пользователям
+def top_similar(book_ids, interactions, norms, top_k=TOP_K):
+    if np is not None:
+        return top_similar_sparse(book_ids, interactions, norms, top_k)
+    return top_similar_python(book_ids, interactions, norms, top_k)
+
+
+# Разреженная матрица пользователи x книги, строки совместной встречаемости
+# целевых книг одним умножением X[:, targets].T @ X
+def top_similar_sparse(book_ids, interactions, norms, top_k):
+    if not interactions:
+        return {book_id: [] for book_id in book_ids}
+    users, books, weights = (np.array(column) for column in zip(*interactions))
+    _, user_index = np.unique(users, return_inverse=True)
+    book_keys, book_index = np.unique(books, return_inverse=True)
+    matrix = sparse.csr_matrix((weights, (user_index, book_index)),
+                               shape=(user_index.max() + 1, len(book_keys))).tocsc()
+    book_norms = np.array([norms[book_id] for book_id in book_keys.tolist()])
+
+    result = {book_id: [] for book_id in book_ids}
+    positions = {book_id: index for index, book_id in enumerate(book_keys.tolist())}
+    targets = np.array([positions[book_id] for book_id in result if book_id in positions],
+                       dtype=np.int64)
+    for start in range(0, len(targets), BATCH_SIZE):
+        chunk = targets[start:start + BATCH_SIZE]
+        cooccurrence = (matrix[:, chunk].T @ matrix).tocsr()
+        for row, target in enumerate(chunk):
+            columns = cooccurrence.indices[cooccurrence.indptr[row]:cooccurrence.indptr[row + 1]]
+            values = cooccurrence.data[cooccurrence.indptr[row]:cooccurrence.indptr[row + 1]]
+            keep = columns != target
+            columns, values = columns[keep], values[keep]
+            scores = values / (book_norms[target] * book_norms[columns])
+            # Равные score упорядочиваем по id, как в варианте без NumPy
+            order = np.lexsort((book_keys[columns], -scores))[:top_k]
+            result[int(book_keys[target])] = list(zip(book_keys[columns[order]].tolist(),
+                                                      scores[order].tolist()))
+    return result
+
+
+def top_similar_python(book_ids, interactions, norms, top_k):
+    by_user = defaultdict(dict)
+    by_book = defaultdict(dict)
+    for user_id, book_id, weight in interactions:
+        by_user[user_id][book_id] = weight
+        by_book[book_id][user_id] = weight
+
+    result = {}
+    for book_id in book_ids:
+        cooccurrence = defaultdict(float)
+        for user_id, weight in by_book.get(book_id, {}).items():
+            for other_id, other_weight in by_user[user_id].items():
+                if other_id != book_id:
+                    cooccurrence[other_id] += weight * other_weight
+        scores = ((other_id, value / (norms[book_id] * norms[other_id]))
+                  for other_id, value in cooccurrence.items())
+        result[book_id] = heapq.nsmallest(top_k, scores, key=lambda item: (-item[1], item[0]))
+    return result
+
+
+# Строки книг заменяются целиком в одной транзакции. Score округляем,
+# чтобы порядок и значения не зависели от погрешности вычислений
+def save_similar(similar):
+    with transaction.atomic():
+        BookSimilarity.objects.filter(book_id__in=similar).delete()
+        BookSimilarity.objects.bulk_create(
+            [BookSimilarity(book_id=book_id, similar_id=similar_id, score=round(score, 6))
+             for book_id, neighbours in similar.items() for similar_id, score in neighbours],
+            batch_size=BATCH_SIZE)
+
+
+# Полный пересчет по всем релейшенам. Изменения из очереди, накопленные
+# до начала, им покрыты. Возвращает число книг с пересчитанными соседями
+def build_similar(top_k=TOP_K):
+    last_change = SimilarityChange.objects.aggregate(last=Max('id'))['last']
+    interactions = list(load_interactions())
+    norms = get_norms(interactions)
+    book_ids = sorted(norms)
+    with transaction.atomic():
+        BookSimilarity.objects.exclude(book_id__in=book_ids).delete()
+        for start in range(0, len(book_ids), BATCH_SIZE):
+            save_similar(top_similar(book_ids[start:start + BATCH_SIZE], interactions, norms, top_k))
+        if last_change is not None:
+            SimilarityChange.objects.filter(id__lte=last_change).delete()
+    return len(book_ids)
+
+
+# Инкрементальный пересчет по очереди изменений. Пересчитываются книги из
+# изменений, книги тех же пользователей (у них поменялась встречаемость с
+# измененными) и книги, у которых измененные есть среди соседей (поменялась
+# норма). Остальные строки подтянет периодический полный пересчет
+def update_similar(top_k=TOP_K):
+    last_change = SimilarityChange.objects.aggregate(last=Max('id'))['last']
+    if last_change is None:
+        return 0
+    changes = SimilarityChange.objects.filter(id__lte=last_change)
+    changed_users = set(changes.values_list('user_id', flat=True))
+    changed_books = set(changes.values_list('book_id', flat=True))
+    dirty = changed_books | {book_id for _, book_id, _ in load_interactions(user_id__in=changed_users)}
+    dirty |= set(BookSimilarity.objects.filter(similar_id__in=changed_books)
+                 .values_list('book_id', flat=True))
+
+    dirty = sorted(dirty)
+    for start in range(0, len(dirty), BATCH_SIZE):
+        book_ids = dirty[start:start + BATCH_SIZE]
+        readers = {user_id for user_id, _, _ in load_interactions(book_id__in=book_ids)}
+        interactions = list(load_interactions(user_id__in=readers))
+        candidates = {book_id for _, book_id, _ in interactions}
+        norms = get_norms(load_interactions(book_id__in=candidates))
+        save_similar(top_similar(book_ids, interactions, norms, top_k))
+    changes.delete()
+    return len(dirty)
+
+
+# Соседи книги одним запросом по индексу (book, -score)
+def get_similar(book_id, limit):
+    return (BookSimilarity.objects.filter(book_id=book_id).order_by('-score', 'similar_id')
+            .values('similar_id', 'similar__name', 'similar__author_name', 'similar__price',
+                    'score')[:limit])
@@ -0,0 +1,61 @@
+from rest_framework.exceptions import ValidationError
+
+
+def split_fields(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+# Поля ответа по ?fields=id,name или ?exclude=readers, в порядке полей сериализатора.
+# None - клиент поля не выбирал. Имена проверяются по allowed
+def select_fields(query_params, allowed):
+    fields = query_params.get('fields')
+    exclude = query_params.get('exclude')
+    if fields is None and exclude is None:
+        return None
+    if fields is not None and exclude is not None:
+        raise ValidationError({'fields': ['Use either "fields" or "exclude", not both.']})
+
+    param = 'fields' if fields is not None else 'exclude'
+    names = split_fields(fields if fields is not None else exclude)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({param: [f'Unknown fields: {", ".join(unknown)}.']})
+    if fields is not None:
+        selected = tuple(name for name in allowed if name in names)
+    else:
+        selected = tuple(name for name in allowed if name not in names)
+    if not selected:
+        raise ValidationError({param: ['At least one field must be selected.']})
+    return selected
+
+
+# Сериализатор, у которого остаются только поля из аргумента fields
+class SparseSerializerMixin:
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+
+# Выбор полей ответа для чтений вьюсета. Сериализатор получает только выбранные
+# поля, список через него берет из базы только их колонки (values_list),
+# остальные чтения ограничивают queryset через only() во вьюхе.
+# Набор полей входит в ключ кэша и ETag
+class SparseFieldsMixin:
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        if getattr(self, 'action', None) not in self.sparse_actions:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            serializer_class = self.get_serializer_class()
+            allowed = [name for name, field in serializer_class().fields.items()
+                       if not field.write_only]
+            self._sparse_fields = select_fields(self.request.query_params, allowed)
+        return self._sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+from django.contrib.admin import helpers
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.admin import EstimatedCountPaginator
+from store.models import Book, UserBookRelation
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.users = [User.objects.create(username=f'test_username{i}') for i in range(3)]
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1',
+                                          owner=self.users[0])
+        self.book_2 = Book.objects.create(name='Test book 2', price=155, author_name='Author 2')
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.users[0], book=self.book_2, like=True)
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        response = self.client.get(reverse(f'admin:store_{model}_changelist'), params)
+        self.assertEqual(200, response.status_code)
+        return response
+
+    # Число запросов списка не зависит от числа строк
+    def test_changelist_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.changelist('userbookrelation')
+        for i in range(10):
+            book = Book.objects.create(name=f'Book {i}', price=10, author_name='Author')
+            UserBookRelation.objects.create(user=self.users[1], book=book, in_bookmarks=True)
+        with CaptureQueriesContext(connection) as large:
+            response = self.changelist('userbookrelation')
+        self.assertEqual(len(small), len(large))
+        self.assertContains(response, 'test_username1: Book 9')
+
+        response = self.changelist('book', price_range='gte100')
+        self.assertEqual([self.book_2], list(response.context['cl'].result_list))
+        response = self.changelist('userbookrelation', like__exact='1')
+        self.assertEqual(4, response.context['cl'].result_count)
+
+    def test_change_form(self):
+        response = self.client.get(reverse('admin:store_userbookrelation_change',
+                                           args=(UserBookRelation.objects.first().pk,)))
+        self.assertEqual(200, response.status_code)
+        # Вместо <select> со всеми книгами - виджет поиска
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Test book 2</option>')
+
+    def run_action(self, action, queryset):
+        return self.client.post(reverse('admin:store_userbookrelation_changelist'), {
+            'action': action, helpers.ACTION_CHECKBOX_NAME: [pk for pk in queryset.values_list('pk', flat=True)],
+        })
+
+    def test_clear_likes(self):
+        relations = UserBookRelation.objects.filter(book=self.book_1, user__in=self.users[:2])
+        with CaptureQueriesContext(connection) as queries:
+            self.run_action('clear_likes', relations)
+        self.book_1.refresh_from_db()
+        self.assertEqual((1, 15), (self.book_1.likes_count, self.book_1.rating_sum))
+        self.assertEqual(2, UserBookRelation.objects.filter(book=self.book_1, like=False).count())
+        # Обновление одним запросом, а не по релейшену
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "store_userbookrelation"')]
+        self.assertEqual(1, len(updates))
+
+        self.run_action('clear_rates', UserBookRelation.objects.all())
+        self.book_1.refresh_from_db()
+        self.assertEqual((0, 0, None), (self.book_1.rating_sum, self.book_1.rating_count, self.book_1.rating))
+
+    def test_delete_relations(self):
+        response = self.changelist('userbookrelation')
+        self.assertNotIn('delete_selected', [name for name, _ in response.context['action_form'].fields['action'].choices])
+        self.run_action('delete_relations', UserBookRelation.objects.filter(like=True, book=self.book_1))
+        self.book_1.refresh_from_db()
+        self.assertEqual((0, 0, 0), (self.book_1.likes_count, self.book_1.rating_sum,
+                                     self.book_1.rating_count))
+        self.assertEqual(1, UserBookRelation.objects.count())
+        self.book_2.refresh_from_db()
+        self.assertEqual(1, self.book_2.likes_count)
+
+    # Большая выборка обрабатывается пачками по pk
+    @patch('store.logic.CHANGE_BATCH_SIZE', 2)
+    def test_relations_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.run_action('clear_likes', UserBookRelation.objects.filter(like=True))
+        self.assertEqual(0, UserBookRelation.objects.filter(like=True).count())
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "store_userbookrelation"')]
+        self.assertEqual(2, len(updates))
+        self.book_1.refresh_from_db()
+        self.assertEqual((0, 15), (self.book_1.likes_count, self.book_1.rating_sum))
+
+        self.run_action('delete_relations', UserBookRelation.objects.all())
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.book_1.refresh_from_db()
+        self.assertEqual((0, 0), (self.book_1.rating_sum, self.book_1.rating_count))
+
+    # Пересчет по подзапросу без выгрузки id, закэшированная детальная книга сбрасывается
+    def test_recalculate_counters(self):
+        url = reverse('book-detail', args=(self.book_1.pk,))
+        self.assertEqual(3, self.client.get(url).data['likes_count'])
+        Book.objects.update(likes_count=0)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('admin:store_book_changelist'), {
+                'action': 'recalculate_counters', helpers.ACTION_CHECKBOX_NAME: [self.book_1.pk, self.book_2.pk],
+            })
+        self.book_1.refresh_from_db()
+        self.assertEqual(3, self.book_1.likes_count)
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "store_book"."id"')])
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(3, response.data['likes_count'])
+
+        response = self.changelist('book')
+        self.assertNotIn('delete_selected', [name for name, _ in response.context['action_form'].fields['action'].choices])
+
+    # Без фильтров большая таблица считается по статистике, с фильтрами - точно
+    @patch('store.admin.get_estimated_count', return_value=5000000)
+    def test_estimated_count(self, estimated_count):
+        self.assertEqual(5000000, EstimatedCountPaginator(Book.objects.order_by('pk'), 100).count)
+        self.assertEqual(1, EstimatedCountPaginator(Book.objects.filter(price__gt=100).order_by('pk'), 100).count)
+        estimated_count.return_value = 10
+        self.assertEqual(2, EstimatedCountPaginator(Book.objects.order_by('pk'), 100).count)
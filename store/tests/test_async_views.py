@@ -0,0 +1,140 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from store.cache import cache_stats, get_cache
+from store.models import Book, UserBookRelation
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 5')
+        self.book_3 = Book.objects.create(name='Test book Author 1', price=55,
+                                          author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, in_bookmarks=True)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_2, rate=2)
+
+    # Ответы совпадают с синхронными вьюхами
+    async def test_list_same_as_sync(self):
+        await self.async_client.aforce_login(self.user)
+        for params in ({}, {'price': 55}, {'search': 'Author 1'}, {'ordering': '-price'},
+                       {'page_size': 2, 'ordering': 'price'}, {'limit': 2, 'offset': 1},
+                       {'fields': 'name,like', 'page_size': 2, 'ordering': 'price'},
+                       {'exclude': 'readers'}):
+            response = await self.async_client.get(reverse('async-book-list'), params)
+            self.assertEqual(status.HTTP_200_OK, response.status_code, params)
+            expected = await self.async_client.get(reverse('book-list'), params)
+            data = json.loads(response.content)
+            expected = json.loads(expected.content)
+            for link in ('next', 'previous'):
+                if isinstance(data, dict) and data.get(link):
+                    data[link] = data[link].replace('/async', '')
+            self.assertEqual(expected, data, params)
+
+    async def test_cursor_next(self):
+        url = reverse('async-book-list')
+        response = await self.async_client.get(url, {'page_size': 2})
+        data = json.loads(response.content)
+        self.assertEqual([self.book_1.id, self.book_2.id], [book['id'] for book in data['results']])
+        response = await self.async_client.get(data['next'])
+        data = json.loads(response.content)
+        self.assertEqual([self.book_3.id], [book['id'] for book in data['results']])
+
+    async def test_detail(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('async-book-detail', args=(self.book_1.id,))
+        response = await self.async_client.get(url)
+        expected = await self.async_client.get(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEqual(json.loads(expected.content), json.loads(response.content))
+        self.assertEqual(expected['ETag'], response['ETag'])
+
+        response = await self.async_client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        response = await self.async_client.get(reverse('async-book-detail', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    async def test_list_errors(self):
+        response = await self.async_client.get(reverse('async-book-list'), {'price': 'abc'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('price', json.loads(response.content))
+        response = await self.async_client.post(reverse('async-book-list'), {})
+        self.assertEqual(status.HTTP_405_METHOD_NOT_ALLOWED, response.status_code)
+
+    # То, что есть только у синхронного списка, не игнорируется молча
+    async def test_list_unsupported(self):
+        url = reverse('async-book-list')
+        for params in ({'facets': 1}, {'format': 'msgpack'}, {'format': 'columnar'}):
+            response = await self.async_client.get(url, params)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, params)
+            self.assertIn(list(params)[0], json.loads(response.content))
+        response = await self.async_client.get(url, headers={'accept': 'application/msgpack'})
+        self.assertEqual(status.HTTP_406_NOT_ACCEPTABLE, response.status_code)
+        response = await self.async_client.get(url, {'format': 'json'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    # Список кэшируется и сбрасывается версией каталога, как синхронный
+    async def test_list_cache(self):
+        url = reverse('async-book-list')
+        cache_stats.reset()
+        await self.async_client.get(url, {'ordering': 'price'})
+        response = await self.async_client.get(url, {'ordering': 'price'})
+        self.assertEqual({'list_misses': 1, 'list_hits': 1}, cache_stats.snapshot())
+        self.assertEqual(3, len(json.loads(response.content)))
+
+        await Book.objects.acreate(name='Test book 4', price=10, author_name='Author 4')
+        response = await self.async_client.get(url, {'ordering': 'price'})
+        self.assertEqual(4, len(json.loads(response.content)))
+
+    # Версии из кэша читаются асинхронно: синхронные вызовы кэша в event loop не попадают
+    async def test_list_no_sync_cache(self):
+        url = reverse('async-book-list')
+        error = AssertionError('sync cache call')
+        with mock.patch('store.cache.get_version', side_effect=error), \
+                mock.patch('store.conditional.get_version', side_effect=error), \
+                mock.patch('store.cache.get_catalog_modified', side_effect=error), \
+                mock.patch('store.conditional.get_catalog_modified', side_effect=error):
+            response = await self.async_client.get(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    async def test_relation(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_1.id,))
+        response = await self.async_client.get(url)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual({'book': self.book_1.id, 'like': True, 'in_bookmarks': False, 'rate': 4},
+                         json.loads(response.content))
+        expected = await self.async_client.get(
+            reverse('userbookrelation-detail', args=(self.book_1.id,)))
+        self.assertEqual(json.loads(expected.content), json.loads(response.content))
+
+        # Релейшена нет - пустое состояние, и он не создается
+        response = await self.async_client.get(
+            reverse('async-userbookrelation-detail', args=(self.book_2.id,)))
+        self.assertEqual({'book': self.book_2.id, 'like': False, 'in_bookmarks': False, 'rate': None},
+                         json.loads(response.content))
+        self.assertEqual(3, await UserBookRelation.objects.acount())
+
+        response = await self.async_client.get(
+            reverse('async-userbookrelation-detail', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    async def test_server_timing(self):
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('"2 queries"', response['Server-Timing'])
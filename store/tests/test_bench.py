@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from store.benchmark import percentile, seed_dataset
+from store.models import Book, UserBookRelation
+
+
+class BenchTestCase(TestCase):
+    # Одинаковый seed дает одинаковые данные
+    def test_seed_deterministic(self):
+        def snapshot():
+            user_ids, book_ids = seed_dataset(users=5, books=20, relations=30, seed=7)
+            books = list(Book.objects.order_by('id').values_list('name', 'price', 'author_name'))
+            relations = sorted((user_ids.index(user), book_ids.index(book), like, rate)
+                               for user, book, like, rate in UserBookRelation.objects
+                               .values_list('user', 'book', 'like', 'rate'))
+            UserBookRelation.objects.all().delete()
+            Book.objects.all().delete()
+            User.objects.all().delete()
+            return books, relations
+
+        first = snapshot()
+        self.assertEqual(20, len(first[0]))
+        self.assertEqual(30, len(first[1]))
+        self.assertEqual(first, snapshot())
+
+    def test_percentile(self):
+        self.assertEqual(5.5, percentile(range(1, 11), 50))
+        self.assertEqual(10, percentile(range(1, 11), 100))
+        self.assertEqual(3, percentile([3], 99))
+
+    # JSON с результатами по сценариям, данные откатываются
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench', users=3, books=10, relations=10, requests=3, warmup=1,
+                         memory_samples=1, output=path, verbosity=0)
+            with open(path) as file:
+                result = json.load(file)
+        self.assertEqual({'list', 'list_anonymous', 'list_filter', 'list_search', 'list_ordering',
+                          'detail', 'create', 'relation'}, set(result['scenarios']))
+        for name, stats in result['scenarios'].items():
+            self.assertEqual(3, stats['requests'])
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+            self.assertGreater(stats['queries_per_request'], 0, name)
+            self.assertTrue(all(status.startswith('2') for status in stats['statuses']), name)
+        self.assertEqual({'201': 3}, result['scenarios']['create']['statuses'])
+        self.assertEqual(0, Book.objects.count())
+        self.assertEqual(0, User.objects.count())
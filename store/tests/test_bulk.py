@@ -0,0 +1,111 @@
+import json
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class BooksBulkApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.url = reverse('book-bulk')
+
+    def post(self, data):
+        return self.client.post(self.url, data=json.dumps(data),
+                                content_type='application/json')
+
+    # Тест пакетного создания книг
+    def test_bulk_create(self):
+        self.client.force_login(self.user)
+        data = [
+            {'name': 'Test book 1', 'price': 25, 'author_name': 'Author 1'},
+            {'name': 'Test book 2', 'price': 55, 'author_name': 'Author 2'},
+        ]
+        # Сессия, пользователь и одна вставка на весь пакет
+        with self.assertNumQueries(3):
+            response = self.post(data)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        books = Book.objects.order_by('id')
+        self.assertEqual([book.id for book in books],
+                         [result['id'] for result in response.data['results']])
+        self.assertEqual([self.user, self.user], [book.owner for book in books])
+
+    # Невалидные элементы не мешают создать остальные
+    def test_bulk_create_partial(self):
+        self.client.force_login(self.user)
+        response = self.post([
+            {'name': 'Test book 1', 'price': 25, 'author_name': 'Author 1'},
+            {'name': 'Test book 2', 'price': 'дорого'},
+        ])
+        self.assertEqual(status.HTTP_207_MULTI_STATUS, response.status_code)
+        self.assertIn('id', response.data['results'][0])
+        self.assertEqual({'price', 'author_name'}, set(response.data['results'][1]['errors']))
+        self.assertEqual(1, Book.objects.count())
+
+    # Тест ошибок формата и прав
+    def test_bulk_create_wrong(self):
+        response = self.post([{'name': 'Test book 1', 'price': 25, 'author_name': 'Author 1'}])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post({'name': 'Test book 1'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post([]).status_code)
+
+
+class BooksRelationBulkApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1,
+                                        in_bookmarks=True, rate=2)
+        self.url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post(self.url, data=json.dumps(data),
+                                content_type='application/json')
+
+    # Тест пакетного создания и обновления релейшенов
+    def test_bulk_upsert(self):
+        response = self.post([
+            {'book': self.book_1.id, 'like': True, 'rate': 5},
+            {'book': self.book_2.id, 'like': True},
+            {'book': self.book_2.id, 'in_bookmarks': True},
+        ])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['updated', 'created', 'created'],
+                         [result['status'] for result in response.data['results']])
+
+        relation_1 = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertEqual((True, True, 5), (relation_1.like, relation_1.in_bookmarks, relation_1.rate))
+        relation_2 = UserBookRelation.objects.get(user=self.user, book=self.book_2)
+        self.assertEqual((True, True, None), (relation_2.like, relation_2.in_bookmarks, relation_2.rate))
+
+        # Счетчики книг пересчитаны
+        self.book_1.refresh_from_db()
+        self.assertEqual((1, 1, 5), (self.book_1.likes_count, self.book_1.bookmarks_count,
+                                     self.book_1.rating_sum))
+        self.book_2.refresh_from_db()
+        self.assertEqual((1, 1, 0), (self.book_2.likes_count, self.book_2.bookmarks_count,
+                                     self.book_2.rating_count))
+
+    # Тест ошибок отдельных элементов
+    def test_bulk_errors(self):
+        response = self.post([
+            {'book': self.book_2.id, 'rate': 3},
+            {'book': 100500, 'like': True},
+            {'like': True},
+            {'book': self.book_1.id, 'rate': 6},
+        ])
+        self.assertEqual(status.HTTP_207_MULTI_STATUS, response.status_code)
+        results = response.data['results']
+        self.assertEqual('created', results[0]['status'])
+        self.assertIn('book', results[1]['errors'])
+        self.assertIn('book', results[2]['errors'])
+        self.assertIn('rate', results[3]['errors'])
+        self.assertEqual(2, UserBookRelation.objects.count())
@@ -0,0 +1,110 @@
+import json
+import os
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import cache_stats, check_shared_caches, ensure_shared_caches, get_cache
+from store.models import Book
+
+
+class BooksCacheTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        cache_stats.reset()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+
+    # Повторный запрос отдается из кэша без обращения к базе
+    def test_hit(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': 'price'})
+        self.assertEqual('MISS', response['X-Cache'])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, data={'ordering': 'price'})
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual([self.book_1.id, self.book_2.id], [book['id'] for book in response.data])
+        # Другие параметры - другой ключ
+        response = self.client.get(url, data={'ordering': '-price'})
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual({'list_hits': 1, 'list_misses': 2}, cache_stats.snapshot())
+
+    # Изменение книги сбрасывает кэш списка и детальной книги
+    def test_invalidate_book(self):
+        list_url = reverse('book-list')
+        detail_url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.get(list_url)
+        self.client.get(detail_url)
+        self.book_1.price = 30
+        self.book_1.save()
+        response = self.client.get(list_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('30.00', response.data[0]['price'])
+        response = self.client.get(detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('30.00', response.data['price'])
+
+    # pk с ведущим нулем - та же книга и та же версия
+    def test_invalidate_padded_pk(self):
+        url = reverse('book-detail', args=(f'0{self.book_1.id}',))
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(etag, self.client.get(reverse('book-detail', args=(self.book_1.id,)))['ETag'])
+        self.book_1.price = 30
+        self.book_1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(('MISS', '30.00'), (response['X-Cache'], response.data['price']))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(reverse('book-detail', args=('abc',))).status_code)
+
+    # Лайк меняет счетчики и состояние пользователя
+    def test_invalidate_relation(self):
+        self.client.force_login(self.user)
+        detail_url = reverse('book-detail', args=(self.book_1.id,))
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        self.client.get(detail_url)
+        self.client.get(other_url)
+        response = self.client.patch(reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                                     data=json.dumps({'like': True}),
+                                     content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.client.get(detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertTrue(response.data['like'])
+        self.assertEqual(1, response.data['likes_count'])
+        # Кэш другой книги не затронут
+        self.assertEqual('HIT', self.client.get(other_url)['X-Cache'])
+
+    # Ответы разных пользователей не смешиваются
+    def test_user_key(self):
+        url = reverse('book-list')
+        self.client.get(url)
+        self.client.force_login(self.user)
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+
+
+# Кэш в памяти процесса при нескольких воркерах: ошибка check --deploy и отказ
+# старта воркеров, но не остальных команд manage.py
+class SharedCacheTestCase(SimpleTestCase):
+    def test_check(self):
+        with patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            self.assertEqual(['store.E001'], [error.id for error in check_shared_caches()])
+            with self.assertRaises(ImproperlyConfigured):
+                ensure_shared_caches()
+            with self.assertRaises(SystemCheckError):
+                call_command('check', deploy=True, stdout=StringIO(), stderr=StringIO())
+            call_command('check', stdout=StringIO())
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/books'}
+            with self.settings(CACHES={'default': shared, 'books': shared}):
+                self.assertEqual([], check_shared_caches())
+        with patch.dict(os.environ, {'WEB_CONCURRENCY': '1'}):
+            ensure_shared_caches()
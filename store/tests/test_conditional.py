@@ -0,0 +1,80 @@
+import json
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.models import Book
+
+
+class BooksConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1', owner=self.user)
+
+    # Тест 304 по If-None-Match для списка
+    def test_list_etag(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        # Другой запрос - другой ETag
+        response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # После изменения каталога ETag меняется
+        Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    # Тест условных GET для книги: один легкий запрос к базе и смена версии после лайка
+    def test_retrieve(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        Book.objects.filter(pk=self.book_1.pk).update(updated_at='2000-01-01T00:00:00Z')
+        self.client.force_login(self.user)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                          data=json.dumps({'like': True}), content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data['likes_count'])
+
+    # Пустой релейшен не меняет счетчики, но добавляет читателя - ETag должен смениться
+    def test_retrieve_readers(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        Book.objects.filter(pk=self.book_1.pk).update(updated_at='2000-01-01T00:00:00Z')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                          data=json.dumps({'like': False}), content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.user.id], response.data['readers'])
+
+        Book.objects.filter(pk=self.book_1.pk).update(updated_at='2000-01-01T00:00:00Z')
+        etag = self.client.get(url)['ETag']
+        self.user.userbookrelation_set.get().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([], response.data['readers'])
+
+    def test_retrieve_not_found(self):
+        response = self.client.get(reverse('book-detail', args=(100500,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertNotIn('ETag', response)
@@ -0,0 +1,110 @@
+import json
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.models import Book, UserBookRelation
+
+
+class BookCountersApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1')
+
+    def patch(self, user, data):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(user)
+        response = self.client.patch(url, data=json.dumps(data),
+                                     content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    # Тест обновления счетчиков при изменении релейшенов
+    def test_counters(self):
+        self.patch(self.user, {'like': True, 'rate': 5})
+        self.patch(self.user2, {'like': True, 'in_bookmarks': True, 'rate': 2})
+        self.book_1.refresh_from_db()
+        self.assertEqual(2, self.book_1.likes_count)
+        self.assertEqual(1, self.book_1.bookmarks_count)
+        self.assertEqual(7, self.book_1.rating_sum)
+        self.assertEqual(2, self.book_1.rating_count)
+        self.assertEqual(Decimal('3.50'), self.book_1.rating)
+
+        # Снимаем лайк и меняем оценку
+        self.patch(self.user, {'like': False, 'rate': 4})
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(6, self.book_1.rating_sum)
+        self.assertEqual(Decimal('3.00'), self.book_1.rating)
+
+        # Счетчики отдаются в API книг
+        response = self.client.get(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEqual(1, response.data['likes_count'])
+        self.assertEqual('3.00', response.data['rating'])
+
+    # Лайк между загрузкой и сохранением книги не теряется
+    def test_book_save(self):
+        book = Book.objects.get(pk=self.book_1.id)
+        self.patch(self.user, {'like': True, 'rate': 5})
+        book.name = 'New name'
+        book.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(('New name', 1, 5, 1), (self.book_1.name, self.book_1.likes_count,
+                                                  self.book_1.rating_sum, self.book_1.rating_count))
+
+        self.book_1.owner = self.user
+        self.book_1.save()
+        self.client.force_login(self.user)
+        response = self.client.patch(reverse('book-detail', args=(self.book_1.id,)),
+                                     {'price': '30.00', 'likes_count': 100}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.book_1.refresh_from_db()
+        self.assertEqual((Decimal('30.00'), 1), (self.book_1.price, self.book_1.likes_count))
+
+    # Тест удаления релейшена
+    def test_delete(self):
+        self.patch(self.user, {'like': True, 'rate': 5})
+        UserBookRelation.objects.filter(user=self.user).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(0, self.book_1.likes_count)
+        self.assertEqual(0, self.book_1.rating_count)
+        self.assertIsNone(self.book_1.rating)
+
+
+class RebuildBookCountersTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1,
+                                        like=True, rate=4)
+        get_cache().clear()
+        # Портим счетчики в обход модели
+        Book.objects.update(likes_count=10, rating=None)
+
+    # Тест обнаружения и исправления рассинхрона
+    def test_rebuild(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_book_counters', check=True, stdout=StringIO())
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(Decimal('4.00'), self.book_1.rating)
+        call_command('rebuild_book_counters', check=True, stdout=StringIO())
+
+    # Исправленная книга получает новый ETag, кэш со старыми счетчиками сбрасывается
+    def test_rebuild_invalidates(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        etag = self.client.get(url)['ETag']
+        call_command('rebuild_book_counters', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data['likes_count'])
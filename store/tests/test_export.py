@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class BooksExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=4)
+
+    def export(self, **params):
+        response = self.client.get(reverse('book-export'), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return b''.join(response.streaming_content).decode()
+
+    # Тест выгрузки в NDJSON
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([
+            {'id': self.book_1.id, 'name': 'Test book 1', 'price': '25.00',
+             'author_name': 'Author 1', 'owner': self.user.id},
+            {'id': self.book_2.id, 'name': 'Test book 2', 'price': '55.00',
+             'author_name': 'Author 2', 'owner': None},
+        ], rows)
+
+    # Тест выгрузки в CSV со счетчиками
+    def test_csv_aggregates(self):
+        rows = list(csv.DictReader(io.StringIO(self.export(output='csv', aggregates=1))))
+        self.assertEqual(2, len(rows))
+        self.assertEqual({'likes_count': '1', 'rating_count': '1', 'rating': '4.00'},
+                         {field: rows[0][field] for field in ('likes_count', 'rating_count', 'rating')})
+        self.assertEqual('', rows[1]['rating'])
+
+    # Продолжение выгрузки после последнего полученного id
+    def test_after(self):
+        rows = [json.loads(line) for line in self.export(after=self.book_1.id).splitlines()]
+        self.assertEqual([self.book_2.id], [row['id'] for row in rows])
+
+    # Под ASGI выгрузка идет асинхронным итератором, а не собирается в память
+    async def test_asgi(self):
+        response = await self.async_client.get(reverse('book-export'), {'output': 'csv'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(['Test book 1', 'Test book 2'], [row['name'] for row in rows])
+
+    def test_wrong_params(self):
+        url = reverse('book-export')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST,
+                         self.client.get(url, data={'output': 'xml'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST,
+                         self.client.get(url, data={'after': 'abc'}).status_code)
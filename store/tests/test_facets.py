@@ -0,0 +1,104 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import cache_stats, get_cache
+from store.models import Book
+
+
+class FacetsTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        cache_stats.reset()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='War and Peace', price=5, author_name='Tolstoy')
+        self.book_2 = Book.objects.create(name='Anna Karenina', price=25, author_name='Tolstoy')
+        self.book_3 = Book.objects.create(name='Idiot', price=55, author_name='Dostoevsky')
+        self.book_4 = Book.objects.create(name='Demons of War', price='155.50', author_name='Dostoevsky')
+        self.book_5 = Book.objects.create(name='Dead Souls', price=55, author_name='Gogol')
+
+    def facets(self, **params):
+        response = self.client.get(reverse('book-list'), {'facets': 1, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response
+
+    def test_facets(self):
+        response = self.facets()
+        self.assertEqual(5, len(response.data['results']))
+        self.assertEqual({
+            'count': 5,
+            'authors': [{'author_name': 'Dostoevsky', 'count': 2}, {'author_name': 'Tolstoy', 'count': 2},
+                        {'author_name': 'Gogol', 'count': 1}],
+            'price': {'min': '5.00', 'max': '155.50', 'buckets': [
+                {'gte': None, 'lt': '10.00', 'count': 1},
+                {'gte': '10.00', 'lt': '50.00', 'count': 1},
+                {'gte': '50.00', 'lt': '100.00', 'count': 2},
+                {'gte': '100.00', 'lt': None, 'count': 1},
+            ]},
+        }, response.data['facets'])
+        # Без ?facets= ответ прежний
+        self.assertIsInstance(self.client.get(reverse('book-list')).data, list)
+
+    # Итоги считаются по всем авторам, а не только по попавшим в лимит
+    def test_authors_limit(self):
+        with self.settings(STORE_FACETS={'AUTHORS_LIMIT': 1, 'PRICE_BUCKETS': (50,)}):
+            facets = self.facets().data['facets']
+        self.assertEqual([{'author_name': 'Dostoevsky', 'count': 2}], facets['authors'])
+        self.assertEqual((5, [2, 3]), (facets['count'], [bucket['count'] for bucket in facets['price']['buckets']]))
+
+    def test_filters_and_search(self):
+        response = self.facets(search='war', page_size=1)
+        self.assertEqual(1, len(response.data['results']))
+        facets = response.data['facets']
+        self.assertEqual(2, facets['count'])
+        self.assertEqual(('5.00', '155.50'), (facets['price']['min'], facets['price']['max']))
+
+        facets = self.facets(price__gte=10, price__lt=100).data['facets']
+        self.assertEqual((3, '25.00', '55.00'), (facets['count'], facets['price']['min'], facets['price']['max']))
+
+        response = self.facets(author_name='Dostoevsky')
+        self.assertEqual({self.book_3.id, self.book_4.id}, {book['id'] for book in response.data['results']})
+        self.assertEqual([{'author_name': 'Dostoevsky', 'count': 2}], response.data['facets']['authors'])
+
+        facets = self.facets(price='1000').data['facets']
+        self.assertEqual((0, [], None), (facets['count'], facets['authors'], facets['price']['min']))
+        self.assertEqual([0] * 4, [bucket['count'] for bucket in facets['price']['buckets']])
+
+    def test_price_lookups(self):
+        for params, expected in (({'price': 55}, {self.book_3, self.book_5}),
+                                 ({'price__in': '5,155.5'}, {self.book_1, self.book_4}),
+                                 ({'price__range': '25,55'}, {self.book_2, self.book_3, self.book_5}),
+                                 ({'price__gt': 55}, {self.book_4}),
+                                 ({'author_name__in': 'Gogol,Tolstoy', 'price__lte': 25},
+                                  {self.book_1, self.book_2})):
+            response = self.client.get(reverse('book-list'), params)
+            self.assertEqual({book.id for book in expected}, {book['id'] for book in response.data}, params)
+        response = self.client.get(reverse('book-list'), {'price__in': '5,abc'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    # Листание и сортировка берут фасеты из кэша, поиск нормализуется
+    def test_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.facets(search='Tolstoy', page_size=1)
+        facet_queries = [query for query in queries if 'OVER ()' in query['sql']]
+        self.assertEqual(1, len(facet_queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+            self.facets(search=' tolstoy  ', ordering='-price')
+        self.assertFalse([query for query in queries if 'OVER ()' in query['sql']])
+        self.assertEqual({'facets_misses': 1, 'facets_hits': 2},
+                         {key: value for key, value in cache_stats.snapshot().items() if 'facets' in key})
+
+        # Новая книга меняет версию каталога
+        Book.objects.create(name='Resurrection', price=30, author_name='Tolstoy')
+        self.assertEqual(3, self.facets(search='tolstoy').data['facets']['count'])
+
+    def test_columnar(self):
+        response = self.client.get(reverse('book-list'), {'facets': 1, 'format': 'columnar', 'page_size': 2})
+        data = response.json()
+        self.assertEqual(2, len(data['results']['id']))
+        self.assertEqual(5, data['facets']['count'])
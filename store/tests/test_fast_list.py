@@ -0,0 +1,56 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.fast_list import ValuesListSerializer
+from store.logic import annotate_user_relation
+from store.models import Book, UserBookRelation
+from store.serializers import BooksSerializer
+
+
+class FastListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price='25.5',
+                                          author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, in_bookmarks=True, rate=1)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_2, like=True)
+
+    def serialize(self, user):
+        queryset = annotate_user_relation(Book.objects.order_by('id'), user)
+        serializer = BooksSerializer()
+        fast = ValuesListSerializer(serializer, queryset)
+        return (fast.to_representation(list(fast.get_rows(queryset))),
+                BooksSerializer(queryset, many=True).data)
+
+    # Результат совпадает с обычным сериализатором
+    def test_same_as_serializer(self):
+        for user in (self.user, self.user2):
+            fast, expected = self.serialize(user)
+            self.assertEqual(expected, fast)
+
+    def test_anonymous(self):
+        fast, expected = self.serialize(AnonymousUser())
+        self.assertEqual(expected, fast)
+        self.assertEqual([None, None], [book['like'] for book in fast])
+
+    # Через API, с курсором и с limit/offset
+    def test_api(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book-list'), data={'ordering': 'price', 'page_size': 1})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book_1.id], [book['id'] for book in response.data['results']])
+        self.assertEqual('25.50', response.data['results'][0]['price'])
+        self.assertEqual([self.user.id, self.user2.id], response.data['results'][0]['readers'])
+        self.assertTrue(response.data['results'][0]['like'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data['results']])
+
+        response = self.client.get(reverse('book-list'), data={'limit': 1, 'offset': 1})
+        self.assertEqual(2, response.data['count'])
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data['results']])
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from store.cache import get_cache
+from store.models import Book, SimilarityChange, UserBookRelation
+
+
+class ImportBooksTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def read_rejects(self, path):
+        with open(f'{path}.rejected.ndjson', encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    # Тест импорта книг из CSV с отклоненными строками
+    def test_books_csv(self):
+        path = self.write('books.csv', 'name,price,author_name,owner\n'
+                                       'Test book 1,25,Author 1,test_username\n'
+                                       'Test book 2,55.5,Author 2,\n'
+                                       'Test book 3,дорого,Author 3,\n'
+                                       'Test book 4,10,Author 4,nobody\n')
+        out = StringIO()
+        call_command('import_books', path, workers=0, batch_size=2, stdout=out)
+        self.assertIn('Imported 2 rows, rejected 2', out.getvalue())
+        books = Book.objects.order_by('name')
+        self.assertEqual([('Test book 1', Decimal('25.00'), self.user),
+                          ('Test book 2', Decimal('55.50'), None)],
+                         [(book.name, book.price, book.owner) for book in books])
+        self.assertEqual([4, 5], [row['line'] for row in self.read_rejects(path)])
+
+    # Тест импорта книг из NDJSON в пуле процессов
+    def test_books_ndjson_pool(self):
+        lines = [json.dumps({'name': f'Book {i}', 'price': i, 'author_name': 'Author'})
+                 for i in range(1, 21)]
+        path = self.write('books.ndjson', '\n'.join(lines + ['{broken']) + '\n')
+        call_command('import_books', path, workers=2, batch_size=3, stdout=StringIO())
+        self.assertEqual(20, Book.objects.count())
+        self.assertEqual(21, self.read_rejects(path)[0]['line'])
+
+    # Тест импорта релейшенов с пересчетом счетчиков
+    def test_relations(self):
+        book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        UserBookRelation.objects.create(user=self.user, book=book, in_bookmarks=True)
+        path = self.write('relations.csv', 'user,book,like,in_bookmarks,rate\n'
+                                           f'test_username,{book.id},1,0,4\n'
+                                           f'test_username,{book.id},true,1,5\n'
+                                           f'test_username,100500,1,0,\n'
+                                           f'test_username,{book.id},1,0,6\n')
+        detail = reverse('book-detail', args=(book.id,))
+        etag = self.client.get(detail)['ETag']
+        call_command('import_books', path, kind='relations', workers=0, stdout=StringIO())
+        # Кэш и ETag книги сброшены, пара в очереди похожих книг
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((200, 1), (response.status_code, response.data['likes_count']))
+        self.assertEqual([(self.user.id, book.id)],
+                         list(SimilarityChange.objects.values_list('user_id', 'book_id')))
+        relation = UserBookRelation.objects.get()
+        self.assertEqual((True, True, 5), (relation.like, relation.in_bookmarks, relation.rate))
+        book.refresh_from_db()
+        self.assertEqual((1, 1, 5), (book.likes_count, book.bookmarks_count, book.rating_sum))
+        self.assertEqual([4, 5], [row['line'] for row in self.read_rejects(path)])
@@ -0,0 +1,117 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, LeaderboardState, UserBookRelation
+
+
+class LeaderboardsTestCase(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'test_username{i}') for i in range(3)]
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.book_3 = Book.objects.create(name='Test book 3', price=55, author_name='Author 3')
+        self.book_4 = Book.objects.create(name='Test book 4', price=55, author_name='Author 4')
+
+    def patch(self, user, book, data):
+        self.client.force_login(user)
+        response = self.client.patch(reverse('userbookrelation-detail', args=(book.id,)), data,
+                                     content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def scores(self, name, **params):
+        response = self.client.get(reverse(f'book-{name}'), params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [(book['id'], book['score']) for book in response.data['results']]
+
+    # Одна пятерка не обгоняет три четверки, книги без оценок в рейтинг не попадают
+    def test_top(self):
+        self.patch(self.users[0], self.book_1, {'rate': 5})
+        for user in self.users:
+            self.patch(user, self.book_2, {'rate': 4})
+        self.patch(self.users[0], self.book_3, {'rate': 1})
+        # m = 3 до первого пересчета, вес априорной оценки 10
+        self.assertEqual([(self.book_2.id, round(42 / 13, 3)), (self.book_1.id, round(35 / 11, 3)),
+                          (self.book_3.id, round(31 / 11, 3))], self.scores('top'))
+
+        # После пересчета m - средняя оценка каталога, изменения идут уже с ней
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(3.6, LeaderboardState.objects.get().rating_mean)
+        self.patch(self.users[1], self.book_1, {'rate': 5})
+        self.assertEqual(round((36 + 10) / 12, 3), dict(self.scores('top'))[self.book_1.id])
+        self.patch(self.users[0], self.book_3, {'rate': None})
+        self.assertNotIn(self.book_3.id, dict(self.scores('top')))
+
+    def test_trending(self):
+        self.patch(self.users[0], self.book_1, {'like': True})
+        self.patch(self.users[1], self.book_1, {'like': True, 'rate': 5})
+        self.patch(self.users[0], self.book_2, {'like': True})
+        # Закладка вес не меняет, низкая оценка без лайка вклада не дает
+        self.patch(self.users[0], self.book_3, {'in_bookmarks': True, 'rate': 2})
+        self.assertEqual([self.book_1.id, self.book_2.id],
+                         [book_id for book_id, _ in self.scores('trending')])
+        self.assertAlmostEqual(3, self.scores('trending')[0][1], places=2)
+
+        self.patch(self.users[0], self.book_2, {'like': False})
+        self.assertEqual([self.book_1.id], [book_id for book_id, _ in self.scores('trending')])
+
+    # Вклад релейшена затухает вдвое за 48 часов
+    def test_decay(self):
+        self.patch(self.users[0], self.book_1, {'like': True})
+        self.patch(self.users[1], self.book_2, {'like': True})
+        UserBookRelation.objects.filter(book=self.book_1).update(
+            updated_at=timezone.now() - timedelta(hours=96))
+        call_command('refresh_leaderboards', stdout=StringIO())
+        (book_2, score_2), (book_1, score_1) = self.scores('trending')
+        self.assertEqual((self.book_2.id, self.book_1.id), (book_2, book_1))
+        self.assertAlmostEqual(1, score_2, places=2)
+        self.assertAlmostEqual(0.25, score_1, places=2)
+
+        # Снова лайк: вклад заменяется, а не добавляется
+        self.patch(self.users[0], self.book_1, {'like': True})
+        self.assertAlmostEqual(1, dict(self.scores('trending'))[self.book_1.id], places=2)
+
+    # Пакетное изменение двигает те же очки, что и поштучное
+    def test_bulk(self):
+        self.client.force_login(self.users[0])
+        response = self.client.post(reverse('userbookrelation-bulk'),
+                                    [{'book': self.book_1.id, 'like': True, 'rate': 4},
+                                     {'book': self.book_2.id, 'rate': 5}],
+                                    content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([(self.book_1.id, 1.5), (self.book_2.id, 1.0)], self.scores('trending'))
+        self.assertEqual([self.book_2.id, self.book_1.id],
+                         [book_id for book_id, _ in self.scores('top')])
+
+    def test_pages(self):
+        for book in (self.book_1, self.book_2, self.book_3):
+            self.patch(self.users[0], book, {'rate': 5})
+        response = self.client.get(reverse('book-top'), {'page_size': 2})
+        # Равные очки идут по убыванию id
+        self.assertEqual([self.book_3.id, self.book_2.id],
+                         [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.book_1.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    # Множитель от эпохи 2026-01-01 при периоде 6 часов уже не помещается во float:
+    # запись не падает, а пересчет переносит эпоху и возвращает очки в масштаб
+    @override_settings(STORE_LEADERBOARDS={'TRENDING_HALF_LIFE_HOURS': 6})
+    def test_epoch_rebase(self):
+        with self.assertLogs('store.leaderboards', 'WARNING'):
+            self.patch(self.users[0], self.book_1, {'like': True})
+        call_command('refresh_leaderboards', stdout=StringIO())
+        state = LeaderboardState.objects.get()
+        self.assertAlmostEqual(0, (timezone.now() - state.trending_epoch).total_seconds(), delta=60)
+        self.book_1.refresh_from_db()
+        self.assertAlmostEqual(1, self.book_1.trending_score, places=2)
+
+        self.patch(self.users[1], self.book_2, {'like': True, 'rate': 5})
+        self.assertEqual([(self.book_2.id, 2.0), (self.book_1.id, 1.0)], self.scores('trending'))
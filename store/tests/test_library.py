@@ -0,0 +1,87 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class LibraryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.other = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1',
+                                          owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.book_3 = Book.objects.create(name='Test book 3', price=55, author_name='Author 3',
+                                          owner=self.other)
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, in_bookmarks=True)
+        UserBookRelation.objects.create(user=self.other, book=self.book_1, like=True)
+        self.client.force_login(self.user)
+
+    def shelf(self, shelf, **params):
+        response = self.client.get(reverse('library'), {'shelf': shelf, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response
+
+    def test_shelves(self):
+        self.assertEqual([self.book_1.id], [book['id'] for book in self.shelf('owned').data['results']])
+        response = self.shelf('liked')
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data['results']])
+        self.assertEqual((True, 4), (response.data['results'][0]['like'],
+                                     response.data['results'][0]['rate']))
+        self.assertEqual([self.book_3.id], [book['id'] for book in self.shelf('bookmarked').data['results']])
+        self.assertEqual([self.book_2.id], [book['id'] for book in self.shelf('rated').data['results']])
+        self.assertEqual({'owned': 1, 'liked': 1, 'bookmarked': 1, 'rated': 1},
+                         response.data['counts'])
+
+    def test_errors(self):
+        response = self.client.get(reverse('library'), {'shelf': 'read'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.client.logout()
+        response = self.client.get(reverse('library'), {'shelf': 'liked'})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_pages(self):
+        books = [Book.objects.create(name=f'Book {i}', price=10, author_name='Author') for i in range(5)]
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=self.user, book=book, like=True) for book in books])
+        response = self.shelf('liked', page_size=4)
+        # Новые книги первыми
+        self.assertEqual([book.id for book in books[:0:-1]],
+                         [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([books[0].id, self.book_2.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    # Страница стоит одинаково при любом размере полки, сводка после первого запроса - из кэша
+    def test_queries(self):
+        self.shelf('liked')
+        with CaptureQueriesContext(connection) as small:
+            self.shelf('liked')
+        books = [Book.objects.create(name=f'Book {i}', price=10, author_name='Author') for i in range(30)]
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=self.other, book=book, like=True) for book in books] +
+            [UserBookRelation(user=self.user, book=book, like=True) for book in books])
+        self.shelf('liked')
+        with CaptureQueriesContext(connection) as large:
+            self.shelf('liked')
+        # Сессия, пользователь, страница книг, читатели
+        self.assertEqual(4, len(small))
+        self.assertEqual(len(small), len(large))
+
+    # Запись релейшена сбрасывает сводку
+    def test_counts_invalidation(self):
+        self.assertEqual(1, self.shelf('liked').data['counts']['liked'])
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book_3.id,)),
+                          data=json.dumps({'like': True}), content_type='application/json')
+        response = self.shelf('liked')
+        self.assertEqual(2, response.data['counts']['liked'])
+        self.assertEqual(2, len(response.data['results']))
+        Book.objects.create(name='Test book 4', price=10, author_name='Author 4', owner=self.user)
+        self.assertEqual(2, self.shelf('owned').data['counts']['owned'])
@@ -0,0 +1,87 @@
+import base64
+import json
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+
+
+class BooksPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        # Несколько книг с одинаковой ценой, чтобы проверить второй ключ (id)
+        self.books = [
+            Book.objects.create(name=f'Test book {i}', price=price,
+                                author_name=f'Author {i % 3}', owner=self.user)
+            for i, price in enumerate([25, 55, 55, 10, 55, 30, 25])
+        ]
+
+    # Проходим все страницы по ссылкам next и собираем id
+    def walk(self, params, link='next'):
+        url = reverse('book-list')
+        response = self.client.get(url, data=params)
+        ids = []
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(book['id'] for book in response.data['results'])
+            if response.data[link] is None:
+                return ids, response
+            response = self.client.get(response.data[link])
+
+    # Без параметров пагинации список отдается целиком, как и раньше
+    def test_unpaginated_by_default(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(7, len(response.data))
+
+    # Тест keyset-пагинации по id
+    def test_cursor_by_id(self):
+        ids, _ = self.walk({'page_size': 3})
+        self.assertEqual([book.id for book in self.books], ids)
+
+    # Тест keyset-пагинации с сортировкой по цене в обе стороны
+    def test_cursor_ordering(self):
+        for ordering in ('price', '-price', 'author_name', '-author_name'):
+            field = ordering.lstrip('-')
+            expected = sorted(self.books, key=lambda book: (getattr(book, field), book.id),
+                              reverse=ordering.startswith('-'))
+            ids, _ = self.walk({'page_size': 2, 'ordering': ordering})
+            self.assertEqual([book.id for book in expected], ids, ordering)
+
+    # Тест перехода назад по ссылкам previous
+    def test_cursor_previous(self):
+        ids, response = self.walk({'page_size': 2, 'ordering': '-price'})
+        back_ids = []
+        while True:
+            back_ids[:0] = [book['id'] for book in response.data['results']]
+            if response.data['previous'] is None:
+                break
+            response = self.client.get(response.data['previous'])
+        self.assertEqual(ids, back_ids)
+
+    # Тест пагинации вместе с фильтром по цене
+    def test_cursor_filter(self):
+        ids, _ = self.walk({'page_size': 2, 'price': 55})
+        self.assertEqual([self.books[1].id, self.books[2].id, self.books[4].id], ids)
+
+    # Тест невалидного курсора
+    def test_cursor_invalid(self):
+        response = self.client.get(reverse('book-list'), data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        # Подмененное значение поля сортировки
+        for value in ('abc', None, 'NaN', [1]):
+            payload = json.dumps({'o': 'price', 'v': value, 'i': self.books[0].id, 'r': 0})
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            response = self.client.get(reverse('book-list'), data={'cursor': cursor, 'ordering': 'price'})
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code, value)
+
+    # Тест офсетного режима
+    def test_offset(self):
+        response = self.client.get(reverse('book-list'), data={'limit': 2, 'offset': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(7, response.data['count'])
+        self.assertEqual([self.books[2].id, self.books[3].id],
+                         [book['id'] for book in response.data['results']])
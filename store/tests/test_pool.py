@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from store.pool import format_pool_stats, get_pool_stats
+
+
+class PoolStatsTestCase(TestCase):
+    def test_format(self):
+        stats = format_pool_stats({
+            'pool_min': 2, 'pool_max': 20, 'pool_size': 5, 'pool_available': 2,
+            'requests_waiting': 1, 'requests_num': 100, 'requests_queued': 4,
+            'requests_wait_ms': 30, 'requests_errors': 1, 'connections_num': 6,
+            'connections_errors': 2, 'connections_lost': 1, 'returns_bad': 0,
+        })
+        self.assertEqual(3, stats['in_use'])
+        self.assertEqual(2, stats['idle'])
+        self.assertEqual(1, stats['waiting'])
+        self.assertEqual(7.5, stats['wait_ms_avg'])
+        self.assertEqual(2, stats['connection_errors'])
+        self.assertEqual(0, format_pool_stats({})['wait_ms_avg'])
+
+    # SQLite без пула: пустая статистика, эндпоинт ее отдает
+    def test_stats_endpoint(self):
+        self.assertEqual({}, get_pool_stats())
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        response = self.client.get(reverse('stats'))
+        self.assertEqual({}, response.data['db_pools'])
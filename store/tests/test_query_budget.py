@@ -0,0 +1,234 @@
+import json
+import re
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.models import Book, UserBookRelation
+from store.similar import build_similar
+
+# Размеры набора книг, на которых прогоняется каждый эндпоинт
+SIZES = (1, 10, 50)
+
+# Бюджет запросов к базе на эндпоинт. Сессия и пользователь входят в бюджет
+BUDGETS = {
+    'list_anonymous': 2,
+    'list': 4,
+    'list_cursor': 4,
+    'list_offset': 5,
+    'list_search': 4,
+    'list_filter': 4,
+    'detail': 5,
+    'create': 4,
+    'update': 6,
+    'delete': 7,
+    # В Postgres прошлое состояние и upsert - один запрос, на SQLite - с чтением книги
+    'relation': 8,
+    'book_bulk': 3,
+    # Пакет читает эпоху trending одним запросом на весь пакет
+    'relation_bulk': 11,
+    'export': 1,
+    # Только сессия и пользователь, статистика в памяти процесса
+    'stats': 2,
+    # Пользователь грузится из сессии в async-вьюхе, те же запросы, что у синхронных
+    'async_list': 4,
+    'async_detail': 5,
+    'async_relation': 3,
+    # Соседи с полями книг одним JOIN и проверка книги, если соседей нет
+    'similar': 2,
+    'top': 4,
+    # Плюс эпоха trending
+    'trending': 5,
+    # Плюс сводка полок: книги владельца и релейшены пользователя
+    'library': 6,
+    # Плюс один агрегат фасетов
+    'facets': 5,
+}
+
+
+# SQL без литералов: одинаковые по форме запросы схлопываются в один шаблон
+def query_pattern(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(?:, \?)*\)', '(...)', sql)
+
+
+class QueryBudgetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.readers = [User.objects.create(username=f'reader_{i}') for i in range(3)]
+        self.books = []
+
+    # Доводим набор до size книг: у каждой владелец и релейшены нескольких читателей
+    def grow(self, size):
+        for i in range(len(self.books), size):
+            book = Book.objects.create(name=f'Book {i}', price=10 + i,
+                                       author_name=f'Author {i % 5}', owner=self.user)
+            for reader in self.readers:
+                UserBookRelation.objects.create(user=reader, book=book, like=True, rate=i % 5 + 1)
+            UserBookRelation.objects.create(user=self.user, book=book, in_bookmarks=True)
+            self.books.append(book)
+
+    def describe(self, queries):
+        patterns = Counter(query_pattern(query['sql']) for query in queries)
+        return '\n'.join(f'{count} x {pattern}' for pattern, count in patterns.most_common())
+
+    # Эндпоинт на каждом размере: число запросов не растет с N и не выше бюджета.
+    # prepare - подготовка данных после роста набора, вне замера
+    def assertQueryBudget(self, name, request, prepare=None):
+        budget = BUDGETS[name]
+        counts = {}
+        for size in SIZES:
+            self.grow(size)
+            if prepare is not None:
+                prepare()
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = request(size)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 300, f'{name}: {response.status_code}')
+            counts[size] = len(captured)
+            self.assertLessEqual(
+                len(captured), budget,
+                f'{name} made {len(captured)} queries at N={size}, budget is {budget}:\n'
+                f'{self.describe(captured.captured_queries)}')
+            if len(set(counts.values())) > 1:
+                self.fail(f'{name} query count grows with N: {counts}\n'
+                          f'{self.describe(captured.captured_queries)}')
+
+    def login(self):
+        self.client.force_login(self.user)
+
+    def json(self, method, url, data):
+        return getattr(self.client, method)(url, data=json.dumps(data),
+                                            content_type='application/json')
+
+    def test_list_anonymous(self):
+        self.assertQueryBudget('list_anonymous', lambda size: self.client.get(reverse('book-list')))
+
+    def test_list(self):
+        self.login()
+        self.assertQueryBudget('list', lambda size: self.client.get(reverse('book-list')))
+
+    def test_list_cursor(self):
+        self.login()
+        self.assertQueryBudget('list_cursor', lambda size: self.client.get(
+            reverse('book-list'), {'page_size': 5, 'ordering': 'price'}))
+
+    def test_list_offset(self):
+        self.login()
+        self.assertQueryBudget('list_offset', lambda size: self.client.get(
+            reverse('book-list'), {'limit': 5, 'offset': 0}))
+
+    def test_list_search(self):
+        self.login()
+        self.assertQueryBudget('list_search', lambda size: self.client.get(
+            reverse('book-list'), {'search': 'Author'}))
+
+    def test_list_filter(self):
+        self.login()
+        self.assertQueryBudget('list_filter', lambda size: self.client.get(
+            reverse('book-list'), {'price': 10}))
+
+    def test_detail(self):
+        self.login()
+        self.assertQueryBudget('detail', lambda size: self.client.get(
+            reverse('book-detail', args=(self.books[-1].id,))))
+
+    def test_create(self):
+        self.login()
+        self.assertQueryBudget('create', lambda size: self.json(
+            'post', reverse('book-list'), {'name': 'New', 'price': 1, 'author_name': 'Author'}))
+
+    def test_update(self):
+        self.login()
+        self.assertQueryBudget('update', lambda size: self.json(
+            'patch', reverse('book-detail', args=(self.books[-1].id,)), {'price': 99}))
+
+    def test_delete(self):
+        self.login()
+        self.assertQueryBudget('delete', lambda size: self.client.delete(
+            reverse('book-detail', args=(self.books.pop().id,))))
+
+    def test_relation(self):
+        self.login()
+        self.assertQueryBudget('relation', lambda size: self.json(
+            'patch', reverse('userbookrelation-detail', args=(self.books[-1].id,)),
+            {'like': True, 'rate': 5}))
+
+    def test_book_bulk(self):
+        self.login()
+        self.assertQueryBudget('book_bulk', lambda size: self.json(
+            'post', reverse('book-bulk'),
+            [{'name': f'New {i}', 'price': i, 'author_name': 'Author'} for i in range(size)]))
+
+    def test_relation_bulk(self):
+        self.login()
+        self.assertQueryBudget('relation_bulk', lambda size: self.json(
+            'post', reverse('userbookrelation-bulk'),
+            [{'book': book.id, 'like': True} for book in self.books]))
+
+    def test_export(self):
+        self.assertQueryBudget('export', lambda size: self.client.get(
+            reverse('book-export'), {'aggregates': 1}))
+
+    def test_stats(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.login()
+        self.assertQueryBudget('stats', lambda size: self.client.get(reverse('stats')))
+
+    def async_get(self, url):
+        return async_to_sync(self.async_client.get)(url)
+
+    def test_async_list(self):
+        self.async_client.force_login(self.user)
+        self.assertQueryBudget('async_list', lambda size: self.async_get(reverse('async-book-list')))
+
+    def test_async_detail(self):
+        self.async_client.force_login(self.user)
+        self.assertQueryBudget('async_detail', lambda size: self.async_get(
+            reverse('async-book-detail', args=(self.books[-1].id,))))
+
+    def test_async_relation(self):
+        self.async_client.force_login(self.user)
+        self.assertQueryBudget('async_relation', lambda size: self.async_get(
+            reverse('async-userbookrelation-detail', args=(self.books[-1].id,))))
+
+    # У первой книги только лайки с оценкой 1, то есть нулевой вес и нет соседей:
+    # худший случай, с проверкой существования книги. Так же при N=1, где соседей быть не может
+    def test_similar(self):
+        self.assertQueryBudget('similar', lambda size: self.client.get(
+            reverse('book-similar', args=(self.books[0].id,))), prepare=build_similar)
+
+    def test_top(self):
+        self.login()
+        self.assertQueryBudget('top', lambda size: self.client.get(reverse('book-top')))
+
+    # Лайк с оценкой 1 не дает trending, у первой книги без этого пустая страница
+    def rate_first_book(self):
+        relation = UserBookRelation.objects.get(user=self.user, book=self.books[0])
+        relation.rate = 5
+        relation.save()
+
+    def test_trending(self):
+        self.login()
+        self.assertQueryBudget('trending', lambda size: self.client.get(reverse('book-trending')),
+                               prepare=self.rate_first_book)
+
+    def test_library(self):
+        self.login()
+        self.assertQueryBudget('library', lambda size: self.client.get(
+            reverse('library'), {'shelf': 'bookmarked'}))
+
+    def test_facets(self):
+        self.login()
+        self.assertQueryBudget('facets', lambda size: self.client.get(
+            reverse('book-list'), {'facets': 1}))
@@ -0,0 +1,75 @@
+import json
+
+import msgpack
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+from store.renderers import COLUMNAR_JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE
+
+
+class RenderersTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1',
+                                          owner=self.user)
+        self.book_2 = Book.objects.create(name='Тестовая книга', price='55.5', author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        self.client.force_login(self.user)
+
+    def columns(self, rows):
+        return {name: [row[name] for row in rows] for name in rows[0]}
+
+    # Колонки совпадают с обычным JSON, перевернутым по полям
+    def test_columnar_list(self):
+        expected = self.columns(self.client.get(reverse('book-list')).json())
+        response = self.client.get(reverse('book-list'), HTTP_ACCEPT=COLUMNAR_JSON_MEDIA_TYPE)
+        self.assertEqual(COLUMNAR_JSON_MEDIA_TYPE, response['Content-Type'])
+        self.assertEqual(expected, json.loads(response.content))
+        self.assertEqual([[self.user.id], []], expected['readers'])
+
+        response = self.client.get(reverse('book-list'), {'format': 'columnar', 'page_size': 1,
+                                                          'fields': 'id,like'})
+        data = json.loads(response.content)
+        self.assertEqual({'id': [self.book_1.id], 'like': [True]}, data['results'])
+        data = json.loads(self.client.get(data['next']).content)
+        self.assertEqual({'id': [self.book_2.id], 'like': [None]}, data['results'])
+
+    def test_msgpack(self):
+        expected = json.loads(self.client.get(reverse('book-list'), {'format': 'columnar'}).content)
+        response = self.client.get(reverse('book-list'), HTTP_ACCEPT=MSGPACK_MEDIA_TYPE)
+        self.assertEqual(MSGPACK_MEDIA_TYPE, response['Content-Type'])
+        self.assertEqual(expected, msgpack.unpackb(response.content))
+        # Одна книга не переворачивается
+        response = self.client.get(reverse('book-detail', args=(self.book_2.id,)), {'format': 'msgpack'})
+        self.assertEqual('55.50', msgpack.unpackb(response.content)['price'])
+
+    # Пакетные эндпоинты принимают колоночное тело
+    def test_parsers(self):
+        body = {'book': [self.book_1.id, self.book_2.id], 'in_bookmarks': [True, True]}
+        response = self.client.post(reverse('userbookrelation-bulk'), json.dumps(body),
+                                    content_type=COLUMNAR_JSON_MEDIA_TYPE)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['updated', 'created'], [result['status'] for result in response.data['results']])
+
+        body = {'name': ['Book 3', 'Book 4'], 'price': ['10.00', '12.00'], 'author_name': ['A', 'B']}
+        response = self.client.post(reverse('book-bulk'), msgpack.packb(body),
+                                    content_type=MSGPACK_MEDIA_TYPE)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, Book.objects.filter(name__in=body['name']).count())
+
+        response = self.client.patch(reverse('userbookrelation-detail', args=(self.book_2.id,)),
+                                     msgpack.packb({'rate': 3}), content_type=MSGPACK_MEDIA_TYPE)
+        self.assertEqual(3, response.data['rate'])
+
+        response = self.client.post(reverse('userbookrelation-bulk'),
+                                    json.dumps({'book': [self.book_1.id], 'like': [True, False]}),
+                                    content_type=COLUMNAR_JSON_MEDIA_TYPE)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        # Обрезанное тело и слишком глубокая вложенность - 400, а не 500
+        for body in (b'\x92\x01', b'\x91' * 5000):
+            response = self.client.post(reverse('book-bulk'), body, content_type=MSGPACK_MEDIA_TYPE)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
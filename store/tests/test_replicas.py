@@ -0,0 +1,139 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from store.cache import get_cache, invalidate_books
+from store.models import Book
+from store.routers import (aget_read_alias, checked, choose_replica, is_available, pin_to_primary,
+                           read_alias, unavailable)
+
+REPLICA = 'replica'
+BROKEN = 'broken'
+# Реплика - вторая база SQLite в памяти, которая не получает записей из default,
+# то есть как бы бесконечно отстает. Недоступная реплика - файл в несуществующем каталоге,
+# MIRROR убирает ее из очистки баз после теста
+EXTRA_DATABASES = {
+    REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    BROKEN: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': '/nonexistent/replica.sqlite3',
+             'TEST': {'MIRROR': 'default'}},
+}
+
+
+@override_settings(STORE_REPLICAS={'REPLICAS': {REPLICA: 1}, 'STICKY_SECONDS': 60})
+class ReplicaRouterTestCase(TransactionTestCase):
+    # Раннер проверяет базы из databases до setUpClass, когда алиасов реплик еще нет.
+    # '__all__' раскрывается в super().setUpClass(), уже после их добавления
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        configured = connections.configure_settings(
+            {'default': connections.settings['default'], **EXTRA_DATABASES})
+        for alias in EXTRA_DATABASES:
+            connections.settings[alias] = configured[alias]
+        call_command('migrate', database=REPLICA, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in EXTRA_DATABASES:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+        unavailable.clear()
+        checked.clear()
+        self.user = User.objects.create(username='test_username')
+        # Книга есть в обеих базах, а изменения - только в default
+        self.book = Book.objects.create(name='Primary name', price=25, author_name='Author 1')
+        Book.objects.using(REPLICA).create(id=self.book.id, name='Replica name', price=25,
+                                           author_name='Author 1')
+
+    def test_reads_from_replica(self):
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Replica name', response.data['name'])
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(['Replica name'], [book['name'] for book in response.data])
+
+    # После записи пользователь читает из default и видит свой лайк
+    def test_read_your_writes(self):
+        self.client.force_login(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        response = self.client.get(url)
+        self.assertFalse(response.data['like'])
+
+        response = self.client.patch(url, {'like': True}, content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.client.get(url)
+        self.assertTrue(response.data['like'])
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Primary name', response.data['name'])
+
+        # Другой пользователь не закреплен и читает с реплики
+        self.client.force_login(User.objects.create(username='test_username2'))
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Replica name', response.data['name'])
+
+    def test_failed_write_does_not_pin(self):
+        self.client.force_login(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        response = self.client.patch(url, {'rate': 10}, content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Replica name', response.data['name'])
+
+    @override_settings(STORE_REPLICAS={'REPLICAS': {BROKEN: 1}})
+    def test_failover_to_primary(self):
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Primary name', response.data['name'])
+        self.assertIn(BROKEN, unavailable)
+
+    @override_settings(STORE_REPLICAS={'REPLICAS': {BROKEN: 5, REPLICA: 1, 'default': 0}})
+    def test_weighted_choice(self):
+        self.assertEqual({REPLICA}, {choose_replica() for _ in range(20)})
+
+    # В async-вьюхах подключение к реплике проверяется раз в RETRY_SECONDS, а не на каждый запрос
+    async def test_async_read_alias(self):
+        with mock.patch('store.routers.is_available', wraps=is_available) as check:
+            self.assertEqual(REPLICA, await aget_read_alias(self.user))
+            self.assertEqual(REPLICA, await aget_read_alias(self.user))
+        self.assertEqual(1, check.call_count)
+
+        await sync_to_async(pin_to_primary)(self.user)
+        self.assertIsNone(await aget_read_alias(self.user))
+
+    @override_settings(STORE_REPLICAS={'REPLICAS': {BROKEN: 1}})
+    async def test_async_failover(self):
+        self.assertIsNone(await aget_read_alias(self.user))
+        self.assertIn(BROKEN, unavailable)
+
+    # Объект с реплики сохраняется в default
+    def test_write_goes_to_primary(self):
+        token = read_alias.set(REPLICA)
+        try:
+            book = Book.objects.get(pk=self.book.id)
+            self.assertEqual('Replica name', book.name)
+            book.price = 30
+            book.save()
+        finally:
+            read_alias.reset(token)
+        self.assertEqual(30, Book.objects.get(pk=self.book.id).price)
+        self.assertEqual(25, Book.objects.using(REPLICA).get(pk=self.book.id).price)
+
+    # Сразу после изменения каталога ответ с реплики не кэшируется
+    def test_no_cache_after_change(self):
+        invalidate_books(self.book.id)
+        url = reverse('book-detail', args=(self.book.id,))
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
@@ -0,0 +1,72 @@
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.search import BookSearchFilter, SqliteSearchBackend, split_terms
+
+
+class BookSearchApiTestCase(APITestCase):
+    def setUp(self):
+        self.book_1 = Book.objects.create(name='Мастер и Маргарита', price=25,
+                                          author_name='Михаил Булгаков')
+        self.book_2 = Book.objects.create(name='Белая гвардия', price=55,
+                                          author_name='Михаил Булгаков')
+        self.book_3 = Book.objects.create(name='Булгаков: жизнеописание', price=40,
+                                          author_name='Мариэтта Чудакова Булгаков')
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('book-list'), data={'search': term, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data]
+
+    # Тест поиска по префиксу и по нескольким словам
+    def test_search(self):
+        self.assertEqual([self.book_1.id], self.search('Марг'))
+        self.assertEqual([self.book_2.id], self.search('булгаков гвард'))
+
+    # Поисковый индекс следит за изменениями книги
+    def test_search_update(self):
+        self.book_1.name = 'Собачье сердце'
+        self.book_1.save()
+        self.assertEqual([], self.search('Маргарита'))
+        self.assertEqual([self.book_1.id], self.search('сердце'))
+        self.book_1.delete()
+        self.assertEqual([], self.search('сердце'))
+
+    # Явная сортировка важнее релевантности
+    def test_search_ordering(self):
+        self.assertEqual([self.book_1.id, self.book_3.id, self.book_2.id],
+                         self.search('Булгаков', ordering='price'))
+
+    # Курсор листает результаты поиска в том же порядке релевантности, в обе стороны
+    def test_search_cursor(self):
+        expected = self.search('Булгаков')
+        url = reverse('book-list')
+        response = self.client.get(url, {'search': 'Булгаков', 'page_size': 1})
+        ids = []
+        while True:
+            ids.extend(book['id'] for book in response.data['results'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(expected, ids)
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(expected[-2:-1], [book['id'] for book in response.data['results']])
+        response = self.client.get(url, {'search': 'Булгаков', 'page_size': 2, 'fields': 'name'})
+        self.assertEqual(2, len(response.data['results']))
+
+
+class BookSearchBackendTestCase(TestCase):
+    def test_split_terms(self):
+        self.assertEqual(['Author', '1', 'O', 'Brien'], split_terms(['Author', '1,', "O'Brien"]))
+
+    # На SQLite с FTS5 поиск уходит в FTS таблицу
+    def test_backend(self):
+        Book.objects.create(name='Test book', price=25, author_name='Author 1')
+        backend = BookSearchFilter().get_search_backend(Book.objects.all())
+        if connection.vendor == 'sqlite':
+            self.assertIsInstance(backend, SqliteSearchBackend)
+            self.assertIn('store_book_fts', str(backend.search(Book.objects.all(), ['test']).query))
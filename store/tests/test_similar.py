@@ -0,0 +1,105 @@
+import json
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, BookSimilarity, SimilarityChange, UserBookRelation
+from store.similar import (get_norms, load_interactions, np, top_similar_python,
+                           top_similar_sparse, update_similar)
+
+
+class SimilarBooksTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.user3 = User.objects.create(username='test_username3')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=25 + i,
+                                          author_name=f'Author {i}') for i in range(1, 5)]
+        book_1, book_2, book_3, book_4 = self.books
+        UserBookRelation.objects.create(user=self.user, book=book_1, like=True)
+        UserBookRelation.objects.create(user=self.user, book=book_2, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=book_1, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=book_2, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=book_3, rate=5)
+        UserBookRelation.objects.create(user=self.user3, book=book_3, like=True)
+        # Низкая оценка без лайка не считается
+        UserBookRelation.objects.create(user=self.user3, book=book_4, rate=2)
+
+    def similar(self, book, **params):
+        return self.client.get(reverse('book-similar', args=(book.id,)), params)
+
+    def snapshot(self):
+        return sorted((row.book_id, row.similar_id, round(row.score, 6))
+                      for row in BookSimilarity.objects.all())
+
+    def test_similar(self):
+        call_command('build_similar', '--full', verbosity=0)
+        book_1, book_2, book_3, book_4 = self.books
+        with self.assertNumQueries(1):
+            response = self.similar(book_1)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([
+            {'id': book_2.id, 'name': 'Test book 2', 'author_name': 'Author 2',
+             'price': '27.00', 'score': 1.0},
+            {'id': book_3.id, 'name': 'Test book 3', 'author_name': 'Author 3',
+             'price': '28.00', 'score': 0.5},
+        ], json.loads(response.content))
+        self.assertEqual([book_2.id], [book['id'] for book in self.similar(book_1, limit=1).data])
+        self.assertEqual([], self.similar(book_4).data)
+
+    def test_errors(self):
+        self.assertEqual(status.HTTP_400_BAD_REQUEST,
+                         self.similar(self.books[0], limit='x').status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST,
+                         self.similar(self.books[0], limit=0).status_code)
+        response = self.client.get(reverse('book-similar', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    @skipIf(np is None, 'NumPy/SciPy are not installed')
+    def test_sparse_same_as_python(self):
+        interactions = list(load_interactions())
+        norms = get_norms(interactions)
+        book_ids = [book.id for book in self.books]
+        sparse = top_similar_sparse(book_ids, interactions, norms, 2)
+        python = top_similar_python(book_ids, interactions, norms, 2)
+        self.assertEqual(python.keys(), sparse.keys())
+        for book_id in book_ids:
+            self.assertEqual([similar_id for similar_id, _ in python[book_id]],
+                             [similar_id for similar_id, _ in sparse[book_id]])
+            for (_, expected), (_, score) in zip(python[book_id], sparse[book_id]):
+                self.assertAlmostEqual(expected, score)
+
+    # Инкрементальный пересчет после лайка дает то же, что полный
+    def test_incremental(self):
+        call_command('build_similar', '--full', verbosity=0)
+        self.assertFalse(SimilarityChange.objects.exists())
+        book_1, book_2, book_3, book_4 = self.books
+        self.client.force_login(self.user3)
+        url = reverse('userbookrelation-detail', args=(book_1.id,))
+        self.client.patch(url, {'like': True}, content_type='application/json')
+        # Закладка не меняет вес и в очередь не попадает
+        self.client.patch(url, {'in_bookmarks': True}, content_type='application/json')
+        self.assertEqual(1, SimilarityChange.objects.count())
+
+        update_similar()
+        self.assertFalse(SimilarityChange.objects.exists())
+        incremental = self.snapshot()
+        self.assertIn(book_1.id, [book['id'] for book in self.similar(book_3).data])
+        call_command('build_similar', '--full', verbosity=0)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_unlike_and_delete(self):
+        call_command('build_similar', '--full', verbosity=0)
+        book_1, book_2, book_3, book_4 = self.books
+        UserBookRelation.objects.get(user=self.user2, book=book_3).delete()
+        relation = UserBookRelation.objects.get(user=self.user, book=book_2)
+        relation.like = False
+        relation.save()
+        self.assertEqual(2, SimilarityChange.objects.count())
+        update_similar()
+        self.assertEqual([book_2.id], [book['id'] for book in self.similar(book_1).data])
+        self.assertEqual([], self.similar(book_3).data)
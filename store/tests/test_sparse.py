@@ -0,0 +1,80 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1',
+                                          owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        self.client.force_login(self.user)
+
+    def book_queries(self, queries):
+        return [query['sql'] for query in queries if 'store_book' in query['sql']]
+
+    def test_list_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-list'), {'fields': 'name,id'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Поля идут в порядке сериализатора
+        self.assertEqual([{'id': self.book_1.id, 'name': 'Test book 1'},
+                          {'id': self.book_2.id, 'name': 'Test book 2'}], response.data)
+        # Одна выборка книг без лишних колонок, JOIN релейшенов и prefetch читателей
+        sql, = self.book_queries(queries)
+        self.assertNotIn('author_name', sql)
+        self.assertNotIn('userbookrelation', sql)
+
+    def test_exclude(self):
+        response = self.client.get(reverse('book-list'), {'exclude': 'readers,owner,price'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        book = response.data[0]
+        self.assertNotIn('readers', book)
+        self.assertNotIn('price', book)
+        self.assertEqual((True, 5), (book['like'], book['rate']))
+
+    def test_retrieve(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-detail', args=(self.book_1.id,)),
+                                       {'fields': 'name,like'})
+        self.assertEqual({'name': 'Test book 1', 'like': True}, response.data)
+        self.assertNotIn('author_name', self.book_queries(queries)[-1])
+
+    # Курсору нужны id и поле сортировки, даже если их нет в ответе
+    def test_cursor(self):
+        response = self.client.get(reverse('book-list'),
+                                   {'fields': 'name', 'ordering': '-price', 'page_size': 1})
+        self.assertEqual([{'name': 'Test book 2'}], response.data['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([{'name': 'Test book 1'}], response.data['results'])
+
+    def test_leaderboard(self):
+        response = self.client.get(reverse('book-top'), {'fields': 'id'})
+        self.assertEqual([self.book_1.id], [book['id'] for book in response.data['results']])
+        self.assertEqual({'id', 'score'}, set(response.data['results'][0]))
+
+    def test_errors(self):
+        for params in ({'fields': 'name,search_vector'}, {'exclude': 'unknown'},
+                       {'fields': 'name', 'exclude': 'price'}, {'fields': ','}):
+            response = self.client.get(reverse('book-list'), params)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, params)
+
+    # Разные наборы полей - разные ETag и записи кэша, порядок в параметре не важен
+    def test_etag_and_cache(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        full = self.client.get(url)
+        narrow = self.client.get(url, {'fields': 'id,name'})
+        self.assertNotEqual(full['ETag'], narrow['ETag'])
+        self.assertEqual({'id', 'name'}, set(narrow.data))
+        response = self.client.get(url, {'fields': 'name,id'}, HTTP_IF_NONE_MATCH=narrow['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=narrow['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn('readers', response.data)
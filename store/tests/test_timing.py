@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import cache_stats, get_cache
+from store.models import Book
+from store.timing import Histogram, timing_stats
+
+
+class ServerTimingTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        cache_stats.reset()
+        timing_stats.reset()
+        self.user = User.objects.create(username='test_username')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+
+    def parse(self, header):
+        metrics = {}
+        for part in header.split(', '):
+            name, *params = part.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    # Заголовок с временем по частям и числом запросов
+    def test_header(self):
+        response = self.client.get(reverse('book-list'))
+        metrics = self.parse(response['Server-Timing'])
+        self.assertEqual({'db', 'serialize', 'perm', 'render', 'total'}, set(metrics))
+        # Книги и их читатели
+        self.assertEqual('"2 queries"', metrics['db']['desc'])
+        self.assertGreater(float(metrics['serialize']['dur']), 0)
+        self.assertGreater(float(metrics['render']['dur']), 0)
+        self.assertGreaterEqual(float(metrics['total']['dur']), float(metrics['db']['dur']))
+
+    def test_stats(self):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.client.get(reverse('book-detail', args=(self.book.id,)))
+
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(reverse('stats')).status_code)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('stats'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        routes = response.data['routes']
+        self.assertEqual(1, routes['GET book-list']['total']['count'])
+        self.assertEqual(2, routes['GET book-detail']['total']['count'])
+        self.assertEqual({'retrieve_hits': 1, 'retrieve_misses': 1, 'list_misses': 1},
+                         response.data['cache'])
+
+        response = self.client.delete(reverse('stats'))
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertNotIn('GET book-list', timing_stats.snapshot())
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in (0.5, 3, 3, 7, 7000):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(5, snapshot['count'])
+        self.assertEqual(5, snapshot['p50_ms'])
+        self.assertEqual(7000, snapshot['p99_ms'])
+        self.assertEqual(1, snapshot['buckets']['le_inf'])
+
+    # Выбросы при включенном профилировании сохраняются в файл
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(STORE_TIMING={'PROFILE_SAMPLE_RATE': 1, 'PROFILE_THRESHOLD_MS': 0,
+                                                 'PROFILE_DIR': directory}):
+                self.client.get(reverse('book-list'))
+            files = os.listdir(directory)
+        self.assertEqual(1, len(files))
+        self.assertIn('GET_book-list', files[0])
@@ -0,0 +1,56 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic import upsert_relation
+from store.models import Book, UserBookRelation
+
+
+class RelationUpsertTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1')
+
+    def patch(self, book_id, data):
+        url = reverse('userbookrelation-detail', args=(book_id,))
+        return self.client.patch(url, data=json.dumps(data),
+                                 content_type='application/json')
+
+    # Повторные записи обновляют единственный релейшен
+    def test_upsert(self):
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_200_OK, self.patch(self.book_1.id, {'like': True}).status_code)
+        response = self.patch(self.book_1.id, {'rate': 4})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'book': self.book_1.id, 'like': True, 'in_bookmarks': False, 'rate': 4},
+                         response.data)
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertEqual((True, 4), (relation.like, relation.rate))
+
+        self.patch(self.book_1.id, {'like': False})
+        self.book_1.refresh_from_db()
+        self.assertEqual((0, 4), (self.book_1.likes_count, self.book_1.rating_sum))
+
+    # Запись релейшена - фиксированное число запросов без get_or_create
+    def test_queries(self):
+        with self.assertNumQueries(6):
+            # savepoint, строка книги с прошлым состоянием и эпохой, upsert, счетчики,
+            # очередь похожих книг, release. В Postgres первые два - один запрос с CTE
+            upsert_relation(self.user, self.book_1.id, {'like': True})
+
+    # Несуществующая книга
+    def test_not_found(self):
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.patch(100500, {'like': True}).status_code)
+        self.assertEqual(0, UserBookRelation.objects.count())
+
+    # База не дает создать дубль релейшена
+    def test_unique(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserBookRelation.objects.create(user=self.user, book=self.book_1)
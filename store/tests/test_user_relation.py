@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class BooksUserRelationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user2 = User.objects.create(username='test_username2')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1,
+                                        like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1,
+                                        in_bookmarks=True, rate=1)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_2,
+                                        like=True)
+
+    # Тест состояния релейшена текущего пользователя в списке и в детальной книге
+    def test_overlay(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        books = {book['id']: book for book in response.data}
+        self.assertEqual((True, False, 4), (books[self.book_1.id]['like'],
+                                            books[self.book_1.id]['in_bookmarks'],
+                                            books[self.book_1.id]['rate']))
+        self.assertEqual((None, None, None), (books[self.book_2.id]['like'],
+                                              books[self.book_2.id]['in_bookmarks'],
+                                              books[self.book_2.id]['rate']))
+
+        response = self.client.get(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertTrue(response.data['like'])
+        # Чтение не создает пустых релейшенов
+        self.assertEqual(3, UserBookRelation.objects.count())
+
+    # Анонимный пользователь получает пустое состояние
+    def test_anonymous(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual([None, None], [book['like'] for book in response.data])
+
+    # Количество запросов не зависит от количества книг
+    def test_queries(self):
+        self.client.force_login(self.user)
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for i in range(10):
+            book = Book.objects.create(name=f'Book {i}', price=i, author_name='Author')
+            UserBookRelation.objects.create(user=self.user, book=book, like=True)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(12, len(response.data))
@@ -0,0 +1,134 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import CATALOG_VERSION_KEY, get_version
+from store.models import Book, UserBookRelation
+from store.write_behind import relation_buffer
+
+WRITE_BEHIND = {'ENABLED': True, 'FLUSH_INTERVAL': None, 'FLUSH_SIZE': 100, 'MAX_PENDING': 100}
+
+
+@override_settings(STORE_WRITE_BEHIND=WRITE_BEHIND)
+class WriteBehindTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=55, author_name='Author 2')
+        self.client.force_login(self.user)
+        relation_buffer.reset()
+
+    def tearDown(self):
+        relation_buffer.flush()
+
+    def patch(self, book_id, data):
+        url = reverse('userbookrelation-detail', args=(book_id,))
+        return self.client.patch(url, data=json.dumps(data), content_type='application/json')
+
+    # Переключения копятся в буфере и пишутся одной записью, пользователь видит их сразу
+    def test_coalesce(self):
+        for like in (True, False, True):
+            response = self.patch(self.book_1.id, {'like': like})
+            self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        response = self.patch(self.book_1.id, {'rate': 5})
+        self.assertEqual({'book': self.book_1.id, 'like': True, 'rate': 5}, response.data)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+        response = self.client.get(reverse('userbookrelation-detail', args=(self.book_1.id,)))
+        self.assertEqual((True, 5), (response.data['like'], response.data['rate']))
+        response = self.client.get(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEqual((True, 5), (response.data['like'], response.data['rate']))
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual([True, None], [book['like'] for book in response.data])
+
+        self.assertEqual(1, relation_buffer.flush())
+        relation = UserBookRelation.objects.get()
+        self.assertEqual((True, False, 5), (relation.like, relation.in_bookmarks, relation.rate))
+        self.book_1.refresh_from_db()
+        self.assertEqual((1, 5, 1), (self.book_1.likes_count, self.book_1.rating_sum,
+                                     self.book_1.rating_count))
+        stats = relation_buffer.snapshot()
+        self.assertEqual((0, 4, 3, 1), (stats['pending'], stats['accepted'], stats['coalesced'],
+                                        stats['flushed']))
+
+    # Изменение из буфера меняет ETag книги, хотя updated_at еще прежний
+    def test_etag(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        etag = self.client.get(url)['ETag']
+        self.patch(self.book_1.id, {'in_bookmarks': True})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.data['in_bookmarks'])
+
+    # Прием изменения не читает базу и не сбрасывает версию каталога,
+    # ETag списка пользователя меняется за счет его незаписанных изменений
+    def test_list_etag(self):
+        url = reverse('book-list')
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)['ETag']
+        self.patch(self.book_1.id, {'like': True})
+        version = get_version(CATALOG_VERSION_KEY)
+        # Существование книги при следующих изменениях берется из кэша
+        self.patch(self.book_2.id, {'in_bookmarks': True})
+        with self.assertNumQueries(0):
+            self.assertEqual(status.HTTP_202_ACCEPTED, self.patch(self.book_2.id, {'like': True}).status_code)
+        self.assertEqual(version, get_version(CATALOG_VERSION_KEY))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([True, True], [book['like'] for book in response.data])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED,
+                         self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.patch(self.book_2.id + 100, {'like': True}).status_code)
+
+    def test_flush_size(self):
+        with override_settings(STORE_WRITE_BEHIND={**WRITE_BEHIND, 'FLUSH_SIZE': 2}):
+            self.patch(self.book_1.id, {'like': True})
+            self.assertFalse(UserBookRelation.objects.exists())
+            self.patch(self.book_2.id, {'like': True})
+        self.assertEqual(2, UserBookRelation.objects.count())
+        self.assertEqual(0, relation_buffer.snapshot()['pending'])
+
+    # Полный буфер не принимает новые пары, но сливает изменения уже лежащих
+    def test_backpressure(self):
+        with override_settings(STORE_WRITE_BEHIND={**WRITE_BEHIND, 'MAX_PENDING': 1}):
+            self.assertEqual(status.HTTP_202_ACCEPTED, self.patch(self.book_1.id, {'like': True}).status_code)
+            response = self.patch(self.book_2.id, {'like': True})
+            self.assertEqual(status.HTTP_503_SERVICE_UNAVAILABLE, response.status_code)
+            self.assertEqual('1', response['Retry-After'])
+            self.assertEqual(status.HTTP_202_ACCEPTED, self.patch(self.book_1.id, {'rate': 3}).status_code)
+        self.assertEqual(1, relation_buffer.snapshot()['rejected'])
+
+    def test_not_found(self):
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.patch(self.book_2.id + 1, {'like': True}).status_code)
+        # Книгу удалили, пока изменение лежало в буфере
+        self.patch(self.book_2.id, {'like': True})
+        self.book_2.delete()
+        relation_buffer.flush()
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.assertEqual(1, relation_buffer.snapshot()['dropped'])
+
+    # Прямая запись забирает из буфера более старые изменения той же книги
+    def test_direct_write(self):
+        self.patch(self.book_1.id, {'like': True})
+        self.patch(self.book_2.id, {'like': True})
+        with override_settings(STORE_WRITE_BEHIND={**WRITE_BEHIND, 'ENABLED': False}):
+            response = self.patch(self.book_1.id, {'rate': 4})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual((True, 4), (response.data['like'], response.data['rate']))
+            response = self.client.post(reverse('userbookrelation-bulk'),
+                                        [{'book': self.book_2.id, 'in_bookmarks': True}],
+                                        content_type='application/json')
+            self.assertEqual('created', response.data['results'][0]['status'])
+        relation = UserBookRelation.objects.get(book=self.book_2)
+        self.assertEqual((True, True), (relation.like, relation.in_bookmarks))
+        self.assertEqual(0, relation_buffer.snapshot()['pending'])
+
+    def test_shutdown(self):
+        self.patch(self.book_1.id, {'like': True})
+        relation_buffer.shutdown()
+        self.assertTrue(UserBookRelation.objects.get().like)
@@ -0,0 +1,269 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+
+# Замеры времени запроса по частям: база, сериализация, проверка прав, рендер.
+# Отдаются заголовком Server-Timing и копятся в гистограммах по маршрутам.
+
+# Границы корзин гистограмм, мс
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PHASES = ('db', 'serialize', 'perm', 'render')
+DEFAULTS = {
+    # Доля запросов, которые идут под cProfile, 0 - профилирование выключено
+    'PROFILE_SAMPLE_RATE': 0.0,
+    # Профиль сохраняется, только если запрос шел дольше порога
+    'PROFILE_THRESHOLD_MS': 500,
+    'PROFILE_DIR': 'profiles',
+}
+
+current_metrics = ContextVar('store_request_metrics', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'STORE_TIMING', {}).get(name, DEFAULTS[name])
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.active = set()
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+
+
+# Замер части запроса. Вложенные замеры одной части не суммируются дважды
+@contextmanager
+def timing(name):
+    metrics = current_metrics.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started)
+        metrics.active.discard(name)
+
+
+# execute_wrapper для всех соединений: число запросов и время в базе
+def query_timer(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    metrics.queries += 1
+    with timing('db'):
+        return execute(sql, params, many, context)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.sum += value_ms
+        self.max = max(self.max, value_ms)
+
+    # Перцентиль по корзинам: верхняя граница корзины, в которую он попал
+    def quantile(self, percent):
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (None,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound if bound is not None else round(self.max, 3)
+        return None
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count, 3) if self.count else None,
+            'max_ms': round(self.max, 3),
+            'p50_ms': self.quantile(50),
+            'p95_ms': self.quantile(95),
+            'p99_ms': self.quantile(99),
+            'buckets': {f'le_{bound}': count for bound, count in zip(BUCKETS_MS, self.counts)}
+                       | {'le_inf': self.counts[-1]},
+        }
+
+
+# Гистограммы по маршрутам в пределах процесса
+class TimingStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, total, metrics):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    'histograms': {name: Histogram() for name in ('total',) + PHASES},
+                    'queries': 0,
+                }
+            stats['histograms']['total'].observe(total * 1000)
+            for name, duration in metrics.durations.items():
+                stats['histograms'][name].observe(duration * 1000)
+            stats['queries'] += metrics.queries
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for route, stats in self.routes.items():
+                count = stats['histograms']['total'].count
+                result[route] = {name: histogram.snapshot()
+                                 for name, histogram in stats['histograms'].items()}
+                result[route]['queries_per_request'] = round(stats['queries'] / count, 2)
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+timing_stats = TimingStats()
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match.view_name if match is not None else 'unresolved'
+    return f'{request.method} {name}'
+
+
+def server_timing_header(total, metrics):
+    parts = [f'db;dur={metrics.durations["db"] * 1000:.2f};desc="{metrics.queries} queries"']
+    parts += [f'{name};dur={metrics.durations[name] * 1000:.2f}' for name in PHASES[1:]]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+# Профиль запроса-выброса в PROFILE_DIR, смотреть через snakeviz или pstats
+def dump_profile(profile, request, total):
+    directory = get_setting('PROFILE_DIR')
+    os.makedirs(directory, exist_ok=True)
+    route = get_route(request).replace(' ', '_').replace('/', '_')
+    profile.dump_stats(os.path.join(directory, f'{time.time_ns()}-{route}-{total * 1000:.0f}ms.prof'))
+
+
+# Обертка ставится на соединение один раз и ничего не делает вне запроса.
+# Контекст запроса копируется и в потоки sync_to_async, поэтому запросы
+# async ORM тоже попадают в замер
+def install_query_timer(connection):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+# Стоит первым в MIDDLEWARE, чтобы total включал остальные middleware.
+# Работает и в async-цепочке ASGI, чтобы не уводить запросы в поток
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Соединения, открытые до middleware, новые получат обертку по connection_created
+        for connection in connections.all():
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        sample_rate = get_setting('PROFILE_SAMPLE_RATE')
+        profile = cProfile.Profile() if sample_rate and random.random() < sample_rate else None
+        started = time.perf_counter()
+        try:
+            if profile is not None:
+                profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profile is not None:
+                    profile.disable()
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - started
+        self.finish(request, response, total, metrics)
+        if profile is not None and total * 1000 >= get_setting('PROFILE_THRESHOLD_MS'):
+            dump_profile(profile, request, total)
+        return response
+
+    # cProfile в async не включаем: запросы в цикле событий идут вперемешку
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.finish(request, response, time.perf_counter() - started, metrics)
+        return response
+
+    def finish(self, request, response, total, metrics):
+        response['Server-Timing'] = server_timing_header(total, metrics)
+        timing_stats.record(get_route(request), total, metrics)
+
+
+# Замеры проверки прав и рендера во вьюхах DRF
+class TimingViewMixin:
+    def check_permissions(self, request):
+        with timing('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timing('perm'):
+            super().check_object_permissions(request, obj)
+
+    # Рендер идет уже после возврата из вьюхи, конец ловим post-render callback'ом
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        metrics = current_metrics.get()
+        if metrics is not None and isinstance(response, Response):
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.add('render', time.perf_counter() - started)
+            response.add_post_render_callback(rendered)
+        return response
+
+
+# Замер сериализации: в DRF она происходит при обращении к .data,
+# валидация входных данных тоже считается сериализацией
+class TimingSerializerMixin:
+    @property
+    def data(self):
+        with timing('serialize'):
+            return super().data
+
+    def is_valid(self, *, raise_exception=False):
+        with timing('serialize'):
+            return super().is_valid(raise_exception=raise_exception)
+
+
+# Для many=True, указывается в Meta.list_serializer_class
+class TimingListSerializer(TimingSerializerMixin, ListSerializer):
+    pass
@@ -1,28 +1,129 @@
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.generics import ListAPIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
+from store.cache import CachedResponseMixin, cache_stats, invalidate_books, invalidate_library
+from store.conditional import ConditionalGetMixin
+from store.facets import FacetsMixin
+from store.fast_list import FastListMixin
+from store.filters import BookFilter
+from store.leaderboards import decay_factor, get_trending_epoch, trending_threshold
+from store.export import (AGGREGATE_FIELDS, EXPORT_FIELDS, aiter_book_chunks, astream_csv,
+                          astream_ndjson, iter_book_rows, stream_csv, stream_ndjson)
+from store.logic import annotate_user_relation, get_relation_state, upsert_relation, upsert_relations
 from store.models import Book, UserBookRelation
+from store.library import SHELVES, get_shelf_counts, shelf_filter
+from store.pagination import BookPagination, LeaderboardPagination, LibraryPagination
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BooksSerializer, UserBookRelationSerializer
+from store.pool import get_pool_stats
+from store.routers import ReplicaReadMixin
+from store.search import BookSearchFilter
+from store.serializers import (BooksSerializer, SimilarBookSerializer,
+                               UserBookRelationBulkSerializer, UserBookRelationSerializer)
+from store.similar import TOP_K, get_similar
+from store.sparse import SparseFieldsMixin
+from store.timing import TimingViewMixin, timing_stats
+from store.write_behind import (PendingRelationsMixin, WriteBufferFull, book_exists,
+                                relation_buffer, get_setting as get_write_behind_setting,
+                                is_enabled as is_write_behind_enabled)
 
+# Максимальный размер пакета в пакетных эндпоинтах
+BULK_MAX_ITEMS = 1000
+# Поля книги из релейшена текущего пользователя (annotate_user_relation)
+USER_STATE_FIELDS = {'like', 'in_bookmarks', 'rate'}
 
-class BookViewSet(ModelViewSet):
+
+# Проверяем, что в теле пакетного запроса пришел непустой список разумного размера
+def get_bulk_items(data):
+    if not isinstance(data, list):
+        raise ValidationError('Expected a list of items.')
+    if not data:
+        raise ValidationError('Expected a non-empty list of items.')
+    if len(data) > BULK_MAX_ITEMS:
+        raise ValidationError(f'Ensure there are no more than {BULK_MAX_ITEMS} items.')
+    return data
+
+
+# Код ответа пакетного запроса: все элементы прошли, часть или ни одного
+def get_bulk_status(results, success_status):
+    failed = sum('errors' in result for result in results)
+    if not failed:
+        return success_status
+    if failed == len(results):
+        return status.HTTP_400_BAD_REQUEST
+    return status.HTTP_207_MULTI_STATUS
+
+
+# На list/retrieve работают условные GET (ETag/Last-Modified), ответы кэшируются,
+# кэш сбрасывается сигналами при изменениях. Список сериализуется из values_list().
+# Чтения идут на реплики, если они настроены. Незаписанные изменения релейшенов
+# пользователя (write-behind) накладываются поверх ответа. ?fields= / ?exclude=
+# на list/retrieve и рейтингах убирают лишние поля из ответа и колонки из запроса.
+# ?facets=1 на list добавляет фасеты по тем же фильтрам и поиску
+class BookViewSet(TimingViewMixin, ReplicaReadMixin, SparseFieldsMixin, ConditionalGetMixin,
+                  PendingRelationsMixin, CachedResponseMixin, FacetsMixin, FastListMixin,
+                  ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BooksSerializer
     # Устанавливаем фильтры
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
     # Проверка аутентификации
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    # Фильтрация по цене
-    filterset_fields = ['price']
-    # Поиск по имени и автору
+    # Фильтрация по цене (точная, диапазоны, списки) и автору
+    filterset_class = BookFilter
+    # Поиск по имени и автору, полнотекстовый движок выбирается под базу
     search_fields = ['name', 'author_name']
     # Сортировка по цене и автору
     ordering_fields = ['price', 'author_name']
+    # Keyset-пагинация по запросу клиента (?cursor= / ?page_size=), офсетная — по ?limit=
+    pagination_class = BookPagination
+
+    sparse_actions = ('list', 'retrieve', 'top', 'trending')
+
+    # Состояние лайка/закладки/рейта пользователя подтягиваем в том же запросе,
+    # читателей - одним prefetch на страницу. Для удаления книга не сериализуется.
+    # При выборе полей JOIN и prefetch делаются, только если их поля в ответе,
+    # а из строки книги читаются только нужные колонки
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'destroy':
+            return queryset
+        fields = self.get_sparse_fields()
+        if fields is None:
+            queryset = queryset.prefetch_related(Prefetch('readers', queryset=User.objects.only('id')))
+            return annotate_user_relation(queryset, self.request.user)
+
+        if 'readers' in fields:
+            queryset = queryset.prefetch_related(Prefetch('readers', queryset=User.objects.only('id')))
+        if USER_STATE_FIELDS & set(fields):
+            queryset = annotate_user_relation(queryset, self.request.user)
+        return queryset.only(*self.get_only_fields(fields))
+
+    # Колонки книги для only(): поля ответа, ключи пагинации и очки рейтинга
+    def get_only_fields(self, fields):
+        serializer_fields = self.get_serializer_class()().fields
+        columns = set(self.get_extra_columns())
+        for name in fields:
+            source = serializer_fields[name].source
+            if name != 'readers' and name not in USER_STATE_FIELDS:
+                columns.add(source)
+        if self.action in ('top', 'trending'):
+            columns.add(f'{self.action}_score')
+        return sorted(columns)
 
     # Добавляем права овнера при создании книги
     def perform_create(self, serializer):
@@ -30,9 +131,112 @@ class BookViewSet(ModelViewSet):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    # Пакетное создание книг: POST /book/bulk/ со списком книг.
+    # Каждая книга валидируется отдельно, валидные вставляются одним bulk_create
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        items = get_bulk_items(request.data)
+        results = [None] * len(items)
+        books = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'errors': serializer.errors}
+                continue
+            serializer.validated_data['owner'] = request.user
+            books.append((index, Book(**serializer.validated_data)))
+
+        if books:
+            Book.objects.bulk_create([book for _, book in books])
+            # bulk_create не отправляет сигналы, сбрасываем кэш сами
+            invalidate_books()
+            invalidate_library(request.user.pk)
+        for index, book in books:
+            results[index] = {'index': index, 'id': book.id}
+        return Response({'results': results},
+                        status=get_bulk_status(results, status.HTTP_201_CREATED))
+
+    # Потоковая выгрузка всего каталога: GET /book/export/?output=ndjson|csv.
+    # ?aggregates=1 добавляет счетчики релейшенов, ?after=<id> продолжает с последней полученной книги
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            raise ValidationError({'output': ['Expected "ndjson" or "csv".']})
+        after = request.query_params.get('after')
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                raise ValidationError({'after': ['A valid integer is required.']})
+        fields = EXPORT_FIELDS
+        if request.query_params.get('aggregates') in ('1', 'true'):
+            fields += AGGREGATE_FIELDS
+
+        # Под ASGI отдаем асинхронный итератор: синхронный Django собрал бы в память целиком
+        if isinstance(request._request, ASGIRequest):
+            rows = aiter_book_chunks(fields, after=after)
+            stream_csv_rows, stream_ndjson_rows = astream_csv, astream_ndjson
+        else:
+            rows = iter_book_rows(fields, after=after)
+            stream_csv_rows, stream_ndjson_rows = stream_csv, stream_ndjson
+        if output == 'csv':
+            response = StreamingHttpResponse(stream_csv_rows(rows, fields), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="books.csv"'
+        else:
+            response = StreamingHttpResponse(stream_ndjson_rows(rows, fields),
+                                             content_type='application/x-ndjson')
+        return response
+
+    # Похожие книги: GET /book/<id>/similar/?limit=N. Соседи заранее посчитаны
+    # командой build_similar, отдаются одним запросом по индексу
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        try:
+            book_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        limit = request.query_params.get('limit', 10)
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        if not 1 <= limit <= TOP_K:
+            raise ValidationError({'limit': [f'Ensure this value is between 1 and {TOP_K}.']})
+
+        rows = list(get_similar(book_id, limit))
+        # Пустой результат бывает и у книги без соседей, тогда проверяем, есть ли книга
+        if not rows and not Book.objects.filter(pk=book_id).exists():
+            raise NotFound()
+        return Response(SimilarBookSerializer(rows, many=True).data)
+
+    # Рейтинги: GET /book/top/ по байесовскому среднему оценок и GET /book/trending/
+    # по затухающей активности. Очки лежат в книге, страница - диапазон по индексу
+    # (очки, id), поэтому любая страница стоит как первая. score в ответе -
+    # байесовское среднее и trending, приведенный к текущему моменту
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        return self.leaderboard(request, 'top_score', 0, 1)
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        now = timezone.now()
+        epoch = get_trending_epoch()
+        return self.leaderboard(request, 'trending_score', trending_threshold(now, epoch),
+                                decay_factor(now, epoch))
+
+    def leaderboard(self, request, field, threshold, scale):
+        queryset = self.get_queryset().filter(**{f'{field}__gt': threshold})
+        paginator = LeaderboardPagination(f'-{field}')
+        page = paginator.paginate_queryset(queryset, request, self)
+        data = self.get_serializer(page, many=True).data
+        for item, book in zip(data, page):
+            item['score'] = round(getattr(book, field) / scale, 3)
+        return paginator.get_paginated_response(data)
+
 
 # Представление системы рейтов
-class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
+class UserBooksRelationView(TimingViewMixin, ReplicaReadMixin, UpdateModelMixin, GenericViewSet):
     # Предоставление только аутентифицированным пользователям
     permission_classes = [IsAuthenticated]
     queryset = UserBookRelation.objects.all()
@@ -40,15 +244,134 @@ class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
     # Передаём айди книги для удобства взаимодействия с фронтом
     lookup_field = 'book'
 
-# Метод получения лайка
-    def get_object(self):
-        # Находим лайк или создаём новый, для этого добавляем нижнее подчеркивание
-        # Ставить лайк может только авторизованный пользователь, поэтому добаляем user
-        # book пришел через url
-        # book пришел через lookup_field и попал в self.kwargs['book']
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user,
-                                                        book_id=self.kwargs['book'])
-        return obj
+    # Состояние релейшена: GET на book_relation/<book>/. Чтение не создает релейшен,
+    # если его нет - отдаем пустое состояние
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            book_id = int(self.kwargs['book'])
+        except ValueError:
+            raise NotFound()
+        state = get_relation_state(request.user, book_id)
+        if state is None:
+            raise NotFound()
+        state.update(relation_buffer.get(request.user.pk, book_id))
+        return Response(state)
+
+    # Изменение лайка/закладки/рейта: PUT/PATCH на book_relation/<book>/.
+    # Вместо get_or_create и отдельного save релейшен пишется одним upsert,
+    # в режиме write-behind - откладывается в буфер
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        data = {field: value for field, value in serializer.validated_data.items()
+                if field != 'book'}
+        try:
+            book_id = int(self.kwargs['book'])
+        except ValueError:
+            raise NotFound()
+        if is_write_behind_enabled():
+            return self.update_write_behind(request, book_id, data)
+        # Ставить лайк может только авторизованный пользователь, поэтому добаляем user.
+        # Изменения, оставшиеся в буфере, старше этого запроса
+        pending = relation_buffer.take(request.user.pk, [book_id]).get(book_id, {})
+        relation = upsert_relation(request.user, book_id, {**pending, **data})
+        if relation is None:
+            raise NotFound()
+        return Response(self.get_serializer(relation).data)
+
+    # Изменение ложится в буфер и пишется пакетом позже. Релейшен из базы не читаем:
+    # ответ 202 с принятыми, но не записанными полями, полное состояние - через GET
+    def update_write_behind(self, request, book_id, data):
+        if not book_exists(book_id):
+            raise NotFound()
+        if not relation_buffer.add(request.user.pk, book_id, data):
+            raise WriteBufferFull(get_write_behind_setting('RETRY_AFTER'))
+        return Response({'book': book_id, **relation_buffer.get(request.user.pk, book_id)},
+                        status=status.HTTP_202_ACCEPTED)
+
+    # Пакетное изменение релейшенов: POST /book_relation/bulk/ со списком
+    # {book, like, in_bookmarks, rate}. Переданные поля меняются, остальные остаются как были
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = get_bulk_items(request.data)
+        results = [None] * len(items)
+        changes = {}
+        for index, item in enumerate(items):
+            serializer = UserBookRelationBulkSerializer(data=item, partial=True)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'errors': serializer.errors}
+            elif 'book' not in serializer.validated_data:
+                results[index] = {'index': index, 'errors': {'book': ['This field is required.']}}
+            else:
+                data = serializer.validated_data
+                changes.setdefault(data.pop('book'), []).append((index, data))
+
+        # Существование книг проверяем одним запросом на весь пакет
+        existing = set(Book.objects.filter(id__in=changes).values_list('id', flat=True))
+        for book_id in set(changes) - existing:
+            for index, _ in changes.pop(book_id):
+                results[index] = {'index': index, 'errors': {
+                    'book': [f'Invalid pk "{book_id}" - object does not exist.']}}
+
+        if changes:
+            # Несколько изменений одной книги в пакете применяем по порядку,
+            # после изменений той же книги, оставшихся в буфере write-behind
+            merged = {(request.user.pk, book_id): data for book_id, data in
+                      relation_buffer.take(request.user.pk, list(changes)).items()}
+            for book_id, entries in changes.items():
+                for _, data in entries:
+                    merged.setdefault((request.user.pk, book_id), {}).update(data)
+            created = upsert_relations(merged)
+            for book_id, entries in changes.items():
+                for index, _ in entries:
+                    results[index] = {'index': index, 'book': book_id, 'status':
+                                      'created' if (request.user.pk, book_id) in created else 'updated'}
+        return Response({'results': results},
+                        status=get_bulk_status(results, status.HTTP_200_OK))
+
+
+# Библиотека пользователя: GET /me/library/?shelf=owned|liked|bookmarked|rated.
+# Страница полки - один запрос книг с состоянием пользователя и один prefetch
+# читателей, в ответе еще сводка числа книг по всем полкам из кэша
+class LibraryView(TimingViewMixin, ReplicaReadMixin, PendingRelationsMixin, FastListMixin,
+                  ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = BooksSerializer
+    pagination_class = LibraryPagination
+
+    def get_shelf(self):
+        shelf = self.request.query_params.get('shelf')
+        if shelf not in SHELVES:
+            raise ValidationError({'shelf': [f'Expected one of: {", ".join(SHELVES)}.']})
+        return shelf
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Book.objects.prefetch_related(Prefetch('readers', queryset=User.objects.only('id')))
+        return annotate_user_relation(queryset, user).filter(shelf_filter(self.get_shelf(), user))
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = {'counts': get_shelf_counts(self.request.user), **response.data}
+        return response
+
+
+# Статистика процесса для персонала: гистограммы времени по маршрутам, попадания в кэш,
+# пулы соединений и буфер write-behind. DELETE обнуляет счетчики маршрутов, кэша и буфера
+class StatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({'routes': timing_stats.snapshot(), 'cache': cache_stats.snapshot(),
+                         'db_pools': get_pool_stats(), 'write_behind': relation_buffer.snapshot()})
+
+    def delete(self, request):
+        timing_stats.reset()
+        cache_stats.reset()
+        relation_buffer.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 # Аутентификация ГитХаб
 def auth(request):
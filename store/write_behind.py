@@ -0,0 +1,333 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from store.cache import BOOK_EXISTS_KEY, BOOK_VERSION_KEY, get_cache, get_version
+from store.fast_list import Table
+from store.logic import upsert_relations
+from store.models import Book
+
+# Отложенная запись релейшенов (write-behind) для всплесков PATCH на book_relation/<book>/.
+# Запрос только кладет изменение в буфер процесса и сразу получает 202. Изменения
+# одного пользователя по одной книге сливаются (повторные переключения лайка
+# пишутся один раз), буфер сбрасывается пакетным upsert_relations по достижении
+# FLUSH_SIZE или раз в FLUSH_INTERVAL фоновым потоком.
+#
+# Прием изменения не читает базу: существование книги берется из кэша, а кэш
+# и версия каталога не сбрасываются до записи пакета. Чтения пользователя накладывают
+# его незаписанные изменения на ответ (и на ETag), поэтому он видит свое состояние сразу. Буфер свой у каждого процесса: при нескольких
+# воркерах это работает, пока запросы пользователя попадают в один процесс,
+# остальные увидят изменение после сброса, не позже FLUSH_INTERVAL.
+#
+# При полном буфере запрос ждет места до BLOCK_SECONDS и получает 503 с Retry-After.
+# Изменения, которые не удалось записать, возвращаются в буфер, при выходе
+# процесса (atexit, в том числе по SIGTERM у gunicorn/uvicorn) буфер дописывается
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Пар (пользователь, книга) в буфере процесса
+    'MAX_PENDING': 10000,
+    # Изменений в одном пакетном upsert; столько же запускают сброс, не дожидаясь таймера
+    'FLUSH_SIZE': 500,
+    # Период фонового сброса, с. None - без фонового потока: буфер сбрасывает
+    # запрос, который его заполнил, и выход процесса
+    'FLUSH_INTERVAL': 1.0,
+    'BLOCK_SECONDS': 0.5,
+    'RETRY_AFTER': 1,
+    # Сколько раз пробовать дописать буфер при выходе
+    'SHUTDOWN_ATTEMPTS': 3,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'STORE_WRITE_BEHIND', {}).get(name, DEFAULTS[name])
+
+
+def is_enabled():
+    return get_setting('ENABLED')
+
+
+# Есть ли книга. Ключ зависит от версии книги, поэтому создание и удаление его сбрасывают.
+# Книгу, удаленную между проверкой и записью, отбросит запись пакета
+def book_exists(book_id):
+    cache = get_cache()
+    key = BOOK_EXISTS_KEY.format(book_id, get_version(BOOK_VERSION_KEY.format(book_id)))
+    exists = cache.get(key)
+    if exists is None:
+        exists = Book.objects.filter(pk=book_id).exists()
+        cache.set(key, exists)
+    return exists
+
+
+class WriteBufferFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many pending writes, try again later.'
+    default_code = 'write_buffer_full'
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF отдает его в заголовке Retry-After
+        self.wait = wait
+
+
+class RelationWriteBuffer:
+    def __init__(self):
+        self.condition = threading.Condition()
+        # {user_id: {book_id: {поле: значение}}} - принятые, но не записанные изменения
+        self.pending = {}
+        self.size = 0
+        # Пакет, который сейчас пишется: до коммита чтения берут изменения из него
+        self.flushing = {}
+        self.flush_lock = threading.Lock()
+        self.counter = Counter()
+        self.thread = None
+        self.stopping = False
+        self.registered = False
+
+    # Кладем изменение в буфер. False - буфер полон и места не дождались
+    def add(self, user_id, book_id, data):
+        background = get_setting('FLUSH_INTERVAL') is not None
+        with self.condition:
+            books = self.pending.get(user_id, {})
+            if book_id in books:
+                books[book_id].update(data)
+                self.counter['coalesced'] += 1
+            else:
+                if not self.wait_for_room(background):
+                    self.counter['rejected'] += 1
+                    return False
+                # Пока ждали, буфер мог смениться, а ключ - появиться снова
+                books = self.pending.setdefault(user_id, {})
+                if book_id not in books:
+                    self.size += 1
+                books.setdefault(book_id, {}).update(data)
+            self.counter['accepted'] += 1
+            full = self.size >= get_setting('FLUSH_SIZE')
+            if full:
+                self.condition.notify_all()
+        if background:
+            self.start()
+        elif full:
+            self.flush()
+        self.register()
+        return True
+
+    def wait_for_room(self, background):
+        max_pending = get_setting('MAX_PENDING')
+        if self.size < max_pending:
+            return True
+        if not background:
+            return False
+        self.condition.notify_all()
+        return self.condition.wait_for(lambda: self.size < max_pending,
+                                       timeout=get_setting('BLOCK_SECONDS'))
+
+    # Незаписанные изменения релейшена пользователя с книгой
+    def get(self, user_id, book_id):
+        with self.condition:
+            data = dict(self.flushing.get(user_id, {}).get(book_id, {}))
+            data.update(self.pending.get(user_id, {}).get(book_id, {}))
+        return data
+
+    # Незаписанные изменения пользователя по всем книгам: {book_id: {поле: значение}}
+    def get_user(self, user_id):
+        with self.condition:
+            if user_id not in self.flushing and user_id not in self.pending:
+                return {}
+            result = {}
+            for source in (self.flushing, self.pending):
+                for book_id, data in source.get(user_id, {}).items():
+                    result.setdefault(book_id, {}).update(data)
+        return result
+
+    # Забираем из буфера изменения пользователя по книгам, чтобы запрос,
+    # пишущий напрямую, применил их раньше своих. Пакет с этими книгами,
+    # который уже пишется, дожидаемся, иначе он перезапишет более новые значения
+    def take(self, user_id, book_ids):
+        with self.condition:
+            self.condition.wait_for(lambda: not any(
+                book_id in self.flushing.get(user_id, {}) for book_id in book_ids))
+            books = self.pending.get(user_id)
+            if not books:
+                return {}
+            taken = {book_id: books.pop(book_id) for book_id in book_ids if book_id in books}
+            self.size -= len(taken)
+            if not books:
+                del self.pending[user_id]
+            if taken:
+                self.condition.notify_all()
+        return taken
+
+    # Записываем все накопленное пакетами по FLUSH_SIZE, возвращаем число записанных.
+    # Если запись упала, незаписанные пакеты возвращаются в буфер под более новые изменения
+    def flush(self):
+        with self.flush_lock:
+            with self.condition:
+                if not self.size:
+                    return 0
+                batch, self.pending, self.size = self.pending, {}, 0
+                self.flushing = batch
+                self.condition.notify_all()
+            items = [((user_id, book_id), data) for user_id, books in batch.items()
+                     for book_id, data in books.items()]
+            batch_size = get_setting('FLUSH_SIZE')
+            written = 0
+            try:
+                for start in range(0, len(items), batch_size):
+                    self.write(dict(items[start:start + batch_size]))
+                    written = min(start + batch_size, len(items))
+            except Exception:
+                with self.condition:
+                    self.requeue(items[written:])
+                    self.counter['errors'] += 1
+                raise
+            finally:
+                with self.condition:
+                    self.flushing = {}
+                    self.counter['flushed'] += written
+                    self.condition.notify_all()
+        return written
+
+    def write(self, changes):
+        # Книги могли удалить, пока изменения лежали в буфере
+        book_ids = {book_id for _, book_id in changes}
+        existing = set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+        dropped = len(changes)
+        changes = {key: data for key, data in changes.items() if key[1] in existing}
+        dropped -= len(changes)
+        try:
+            upsert_relations(changes)
+        except IntegrityError:
+            # Например, удален пользователь: пишем по одному и пропускаем то, что не записать
+            for key, data in changes.items():
+                try:
+                    upsert_relations({key: data})
+                except IntegrityError:
+                    logger.warning('Dropped pending relation change %s: %s', key, data)
+                    dropped += 1
+        with self.condition:
+            self.counter['batches'] += 1
+            self.counter['dropped'] += dropped
+
+    def requeue(self, items):
+        for (user_id, book_id), data in items:
+            books = self.pending.setdefault(user_id, {})
+            if book_id not in books:
+                self.size += 1
+            books[book_id] = {**data, **books.get(book_id, {})}
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self.run, name='relation-write-behind',
+                                               daemon=True)
+                self.thread.start()
+
+    def register(self):
+        if not self.registered:
+            self.registered = True
+            atexit.register(self.shutdown)
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.stopping or self.size >= get_setting('FLUSH_SIZE'),
+                    timeout=get_setting('FLUSH_INTERVAL'))
+                if self.stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed, changes are kept in the buffer')
+            finally:
+                # Соединение потока возвращаем в пул до следующего сброса
+                connections.close_all()
+
+    # Останавливаем фоновый поток и дописываем буфер
+    def shutdown(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        for attempt in range(get_setting('SHUTDOWN_ATTEMPTS')):
+            try:
+                self.flush()
+                return
+            except DatabaseError:
+                logger.exception('Write-behind flush on shutdown failed')
+                time.sleep(attempt + 1)
+        logger.error('Write-behind: %d pending relation changes lost on shutdown', self.size)
+
+    def snapshot(self):
+        with self.condition:
+            return {'pending': self.size, **self.counter}
+
+    def reset(self):
+        with self.condition:
+            self.counter.clear()
+
+
+relation_buffer = RelationWriteBuffer()
+
+
+# Накладываем незаписанные изменения пользователя на представления книг:
+# список, таблицу, страницу с results или одну книгу
+def overlay_books(data, user):
+    if not user.is_authenticated:
+        return data
+    pending = relation_buffer.get_user(user.pk)
+    if not pending:
+        return data
+    if isinstance(data, dict):
+        items = data['results'] if 'results' in data else [data]
+    else:
+        items = data
+    if isinstance(items, Table):
+        overlay_table(items, pending)
+        return data
+    for item in items:
+        changes = pending.get(item.get('id'))
+        if changes:
+            item.update({field: value for field, value in changes.items() if field in item})
+    return data
+
+
+# То же для таблицы колоночных рендереров
+def overlay_table(table, pending):
+    if 'id' not in table.fields:
+        return
+    id_index = table.fields.index('id')
+    positions = {field: index for index, field in enumerate(table.fields)}
+    for row in table.rows:
+        for field, value in pending.get(row[id_index], {}).items():
+            if field in positions:
+                row[positions[field]] = value
+
+
+# Для list/retrieve книг: поверх ответа, в том числе взятого из кэша
+class PendingRelationsMixin:
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            overlay_books(response.data, request.user)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            overlay_books(response.data, request.user)
+        return response